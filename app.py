@@ -1,17 +1,37 @@
 from flask import Flask
 from config import Config
 from models import db
+from cache import cache
 from routes import bp
-
-def create_app():
+import instrumentation
+import db_profile
+import commands
+import search
+import scanner
+import replicas
+
+def create_app(test_config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    # Переопределения (например, из тестов) применяем до инициализации БД,
+    # иначе движок успеет подключиться к боевому файлу базы
+    if test_config:
+        app.config.update(test_config)
 
     # Инициализируем базу данных
+    db_profile.configure(app)
+    replicas.configure(app)
     db.init_app(app)
+    db_profile.init_app(app)
+    replicas.init_app(app)
+    cache.init_app(app)
+    search.init_app(app)
+    scanner.init_app(app)
+    instrumentation.init_app(app)
 
     # Регистрируем blueprint
     app.register_blueprint(bp)
+    commands.init_app(app)
 
     return app
 
@@ -26,4 +46,5 @@ if __name__ == "__main__":
     with app.app_context():
         db.create_all()
 
+    # Только для разработки; в бою приложение запускает serve.py (gunicorn)
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,135 @@
+"""Архивация журнала операций: горячая таблица operations и холодная operations_archive.
+
+Операции старше ARCHIVE_AFTER_DAYS переносятся в operations_archive пачками.
+Перед переносом их движения прибавляются к opening_balances, поэтому для
+любой строки остатка выполняется
+
+    stocks.quantity = opening_balances.quantity + сумма движений operations
+
+и сверка/пересчёт не обязаны читать архив. Горизонт архива — самая поздняя
+дата в operations_archive. Чтения журнала (список, выгрузка, свёртка)
+обращаются к архиву, только если запрошенный интервал заходит за горизонт.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, union_all, update
+
+from models import db, dialect_insert, Operation, OperationArchive, OpeningBalance
+from pagination import build_page, fetch_keyset
+import ledger
+
+log = logging.getLogger(__name__)
+
+COLUMNS = ("id", "product_id", "type", "quantity", "date",
+           "from_wh", "to_wh", "responsible", "note")
+
+
+def horizon(connection=None):
+    """Дата самой поздней архивной операции или None, если архив пуст (по индексу)."""
+    return (connection or db.session).execute(select(func.max(OperationArchive.date))).scalar()
+
+
+def reaches_archive(date_from=None, connection=None):
+    """Горизонт, если интервал с date_from (None — с начала) заходит в архив, иначе None."""
+    edge = horizon(connection)
+    if edge is not None and (date_from is None or date_from <= edge):
+        return edge
+    return None
+
+
+def movements_select(criteria_for=lambda source: (), date_from=None, connection=None):
+    """ledger.movements_select() по горячему журналу и, если нужно, по архиву.
+
+    criteria_for(source) строит условия отбора для таблицы source.
+    """
+    hot = ledger.movements_select(Operation, *criteria_for(Operation))
+    if reaches_archive(date_from, connection) is None:
+        return hot
+    cold = ledger.movements_select(OperationArchive, *criteria_for(OperationArchive))
+    # SQLite не принимает вложенные UNION в скобках — склеиваем в один плоский
+    return union_all(*hot.selects, *cold.selects)
+
+
+# ---------------- Список операций ----------------
+def operations_page(hot_query, cold_query, per_page, after=None, before=None, date_from=None):
+    """Keyset-страница по горячему журналу с догрузкой из архива.
+
+    Архив читается, только если горизонт не позже date_from и страница
+    уходит за горизонт: горячих строк не хватило, последняя строка старше
+    горизонта (операции задним числом) или курсор «назад» лежит в архиве.
+    """
+    limit = per_page + 1
+    columns = (Operation.date, Operation.id)
+    rows = fetch_keyset(hot_query, columns, limit, after, before)
+
+    edge = reaches_archive(date_from)
+    if edge is not None:
+        if before is not None:
+            reaches = before[0] <= edge
+        else:
+            reaches = len(rows) < limit or rows[-1].date <= edge
+        if reaches:
+            cold = fetch_keyset(cold_query, (OperationArchive.date, OperationArchive.id),
+                                limit, after, before)
+            rows = sorted(rows + cold, key=lambda o: (o.date, o.id),
+                          reverse=before is None)[:limit]
+
+    return build_page(rows, lambda o: (o.date, o.id), per_page, after, before)
+
+
+# ---------------- Архивация ----------------
+def _fold_opening(ids):
+    moves = ledger.movements_select(Operation, Operation.id.in_(ids)).subquery()
+    totals = db.session.execute(
+        select(moves.c.product_id, moves.c.warehouse, func.sum(moves.c.delta))
+        .group_by(moves.c.product_id, moves.c.warehouse)).all()
+    if not totals:
+        return
+
+    t = OpeningBalance.__table__
+    stmt = dialect_insert(t)
+    if hasattr(stmt, "on_conflict_do_update"):
+        db.session.execute(
+            stmt.on_conflict_do_update(index_elements=["product_id", "warehouse"],
+                                       set_={"quantity": t.c.quantity + stmt.excluded.quantity}),
+            [{"product_id": p, "warehouse": w, "quantity": q} for p, w, q in totals])
+        return
+    for p, w, q in totals:
+        if not db.session.execute(update(t).where(t.c.product_id == p, t.c.warehouse == w)
+                                  .values(quantity=t.c.quantity + q)).rowcount:
+            db.session.execute(insert(t).values(product_id=p, warehouse=w, quantity=q))
+
+
+def archive_operations(older_than=None, batch_size=None):
+    """Переносит операции с date < older_than в архив; возвращает их число.
+
+    Каждая пачка — отдельная транзакция: входящие остатки, копия в архив и
+    удаление из горячей таблицы либо проходят вместе, либо не проходят вовсе.
+    """
+    config = current_app.config
+    if older_than is None:
+        older_than = datetime.utcnow() - timedelta(days=config.get("ARCHIVE_AFTER_DAYS", 365))
+    batch_size = batch_size or config.get("ARCHIVE_BATCH_SIZE", 10_000)
+
+    hot, cold = Operation.__table__, OperationArchive.__table__
+    moved = 0
+    while True:
+        ids = db.session.execute(
+            select(hot.c.id).where(hot.c.date < older_than)
+            .order_by(hot.c.date, hot.c.id).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+        try:
+            _fold_opening(ids)
+            db.session.execute(insert(cold).from_select(
+                list(COLUMNS), select(*[hot.c[c] for c in COLUMNS]).where(hot.c.id.in_(ids))))
+            db.session.execute(delete(hot).where(hot.c.id.in_(ids)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        moved += len(ids)
+        log.info("В архив перенесено %d операций (всего %d)", len(ids), moved)
+    return moved
@@ -0,0 +1,108 @@
+"""Генератор синтетических данных склада для бенчмарков.
+
+Строит каталог поставщиков и товаров, многолетнюю историю операций и
+согласованные с ней остатки. Генерация детерминирована: одинаковые scale и
+seed дают одинаковые данные. Вставка идёт Core-запросами пачками.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from ledger import movements
+from models import db, Supplier, Product, Stock, Operation
+import rollup
+
+# products — размер каталога, ops_per_product — операций на товар за всю историю
+SCALES = {
+    "1k": {"suppliers": 50, "products": 1_000, "ops_per_product": 30, "years": 3},
+    "100k": {"suppliers": 2_000, "products": 100_000, "ops_per_product": 20, "years": 3},
+    "1m": {"suppliers": 10_000, "products": 1_000_000, "ops_per_product": 10, "years": 3},
+}
+
+CATEGORIES = ["Крепёж", "Инструмент", "Электрика", "Сантехника", "Краски",
+              "Упаковка", "Спецодежда", "Хозтовары", "Освещение", "Метизы"]
+NOUNS = ["Болт", "Гайка", "Шуруп", "Дрель", "Кабель", "Лампа", "Кран", "Труба",
+         "Краска", "Перчатки", "Скотч", "Коробка", "Розетка", "Ключ", "Шайба"]
+ADJECTIVES = ["оцинкованный", "усиленный", "малый", "большой", "стальной",
+              "медный", "белый", "чёрный", "универсальный", "профессиональный"]
+WAREHOUSES = ["Основной", "Северный", "Южный"]
+TYPE_WEIGHTS = (("in", 45), ("out", 45), ("adjust", 5), ("transfer", 5))
+
+BATCH = 5_000
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(insert(model), rows[start:start + BATCH])
+
+
+def generate(scale="1k", seed=42, end=datetime(2026, 1, 1), **overrides):
+    """Заполняет пустую базу; возвращает фактические размеры набора.
+
+    Операции генерируются так, что остаток не уходит в минус, а строки
+    stocks совпадают с суммой журнала.
+    """
+    params = dict(SCALES[scale], **overrides)
+    rnd = random.Random(seed)
+    start = end - timedelta(days=365 * params["years"])
+    span = int((end - start).total_seconds())
+    types = [t for t, _ in TYPE_WEIGHTS]
+    weights = [w for _, w in TYPE_WEIGHTS]
+
+    _insert(Supplier, [{"id": i, "name": f"Поставщик {i}", "contact": f"+7 900 {i:07d}"}
+                       for i in range(1, params["suppliers"] + 1)])
+
+    total_ops = 0
+    for first in range(1, params["products"] + 1, BATCH):
+        last = min(first + BATCH, params["products"] + 1)
+        products, stocks, operations = [], [], []
+        for pid in range(first, last):
+            products.append({
+                "id": pid,
+                "name": f"{rnd.choice(NOUNS)} {rnd.choice(ADJECTIVES)} {pid}",
+                "sku": f"SKU-{pid:07d}",
+                "category": rnd.choice(CATEGORIES),
+                "unit": "шт",
+                "supplier_id": rnd.randint(1, params["suppliers"]),
+            })
+            balances = {WAREHOUSES[0]: 0}
+            count = rnd.randint(params["ops_per_product"] // 2, params["ops_per_product"] * 3 // 2)
+            dates = sorted(start + timedelta(seconds=rnd.randrange(span)) for _ in range(count))
+            for date in dates:
+                op_type = rnd.choices(types, weights)[0]
+                qty = rnd.randint(1, 50)
+                wh = rnd.choice(list(balances))
+                to_wh = None
+                if op_type == "transfer":
+                    to_wh = rnd.choice([w for w in WAREHOUSES if w != wh])
+                if op_type != "in" and balances[wh] < qty:
+                    # Не уводим историю в минус — списываем только наличное
+                    op_type, to_wh = "in", None
+                if op_type == "in":
+                    to_wh = wh
+                for leg_wh, delta in movements(op_type, qty, wh, to_wh):
+                    balances[leg_wh] = balances.get(leg_wh, 0) + delta
+                operations.append({
+                    "product_id": pid,
+                    "type": op_type,
+                    "quantity": qty,
+                    "date": date,
+                    "to_wh": to_wh,
+                    "from_wh": wh if op_type != "in" else None,
+                    "responsible": rnd.choice(["Иванов", "Петров", "Сидорова", None]),
+                })
+            for wh, balance in balances.items():
+                stocks.append({"product_id": pid, "quantity": balance,
+                               "min_stock": rnd.randint(0, 40), "warehouse": wh})
+
+        operations.sort(key=lambda o: o["date"])
+        _insert(Product, products)
+        _insert(Stock, stocks)
+        _insert(Operation, operations)
+        total_ops += len(operations)
+        db.session.commit()
+
+    rollup.rebuild()
+    db.session.commit()
+    return {"suppliers": params["suppliers"], "products": params["products"], "operations": total_ops}
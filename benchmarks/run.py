@@ -0,0 +1,304 @@
+"""Бенчмарк маршрутов приложения на синтетических данных.
+
+    python -m benchmarks.run --scale 1k --out bench.json
+    python -m benchmarks.run --scale 1k --out new.json --compare bench.json
+
+Каждый маршрут blueprint'а main прогоняется через тестовый клиент Flask:
+p50/p95 задержки, SQL-запросов на запрос (X-Query-Count) и пиковая память
+(tracemalloc, отдельным проходом, чтобы не искажать время). Результат —
+JSON, который можно сравнивать между прогонами.
+
+С --db сгенерированный набор сохраняется в файл и переиспользуется
+следующими прогонами; scale и seed набора лежат рядом в <db>.meta.json.
+Сценарии с записью меняют базу, поэтому каждый прогон идёт на свежей
+копии файла, и все прогоны меряют один и тот же набор.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from app import create_app
+from models import db, Product, Supplier
+from benchmarks import datagen
+
+
+def _scenarios(ctx):
+    """endpoint -> список (имя, метод, url, kwargs для клиента)."""
+    pid, sku = ctx["product_id"], ctx["sku"]
+    return {
+        "main.index": [("/", "GET", "/", {})],
+        "main.products": [
+            ("/products", "GET", "/products", {}),
+            ("/products?q", "GET", "/products?q=болт", {}),
+            ("/products?sku", "GET", f"/products?q={sku}", {}),
+            ("/products?category", "GET", "/products?category=Крепёж", {}),
+        ],
+        "main.add_product": [
+            ("/product/add GET", "GET", "/product/add", {}),
+            ("/product/add POST", "POST", "/product/add",
+             {"data": {"name": "Бенч", "sku": "BENCH-{n}", "supplier": ""}}),
+        ],
+        "main.import_products": [
+            ("/products/import", "POST", "/products/import",
+             {"data": "sku,name,category,supplier\n" + "".join(
+                 f"IMP-{i},Импорт {i},Крепёж,Бенч\n" for i in range(1000)),
+              "content_type": "text/csv"}),
+        ],
+        "main.suppliers": [("/suppliers", "GET", "/suppliers", {})],
+        "main.add_supplier": [
+            ("/supplier/add GET", "GET", "/supplier/add", {}),
+            ("/supplier/add POST", "POST", "/supplier/add", {"data": {"name": "Бенч {n}"}}),
+        ],
+        "main.operations": [
+            ("/operations", "GET", "/operations", {}),
+            ("/operations?range", "GET", "/operations?from=2024-06-01&to=2024-06-30", {}),
+        ],
+        "main.add_operation_view": [
+            ("/operations/add GET", "GET", "/operations/add", {}),
+            ("/operations/add POST", "POST", "/operations/add",
+             {"data": {"product_id": pid, "type": "in", "quantity": 1, "date": "2025-12-31"}}),
+            ("/operations/add transfer", "POST", "/operations/add",
+             {"data": {"product_id": pid, "type": "transfer", "quantity": 1, "date": "2025-12-31",
+                       "to_wh": "Южный"}}),
+        ],
+        "main.bulk_operations": [
+            ("/operations/bulk", "POST", "/operations/bulk",
+             {"data": "".join(json.dumps({"sku": sku, "type": "in", "quantity": 1,
+                                          "date": "2025-12-31"}) + "\n" for _ in range(1000)),
+              "content_type": "application/x-ndjson"}),
+        ],
+        "main.export_operations": [
+            ("/export/operations?month", "GET", "/export/operations?from=2024-06-01&to=2024-06-30", {}),
+        ],
+        "main.export_stock": [("/export/stock", "GET", "/export/stock", {})],
+        "main.stock_low": [
+            ("/stock/low", "GET", "/stock/low", {}),
+            ("/stock/low?warehouse", "GET", "/stock/low?warehouse=Северный", {}),
+        ],
+        "main.stock_as_of": [("/stock/asof", "GET", "/stock/asof?date=2024-06-01", {})],
+        "main.api_stock_as_of": [
+            ("/api/stock/asof?product", "GET",
+             f"/api/stock/asof?date=2024-06-01&at=12:00&product_id={pid}", {}),
+        ],
+        "main.api_product_suggest": [
+            ("/api/products/suggest?name", "GET", "/api/products/suggest?q=бол", {}),
+            ("/api/products/suggest?sku", "GET", f"/api/products/suggest?q={sku[:3]}", {}),
+        ],
+        "main.api_scan": [
+            ("/api/scan/<sku>", "GET", f"/api/scan/{sku}", {}),
+            ("/api/scan/<unknown>", "GET", "/api/scan/NO-SUCH-SKU", {}),
+        ],
+        # Постановка задачи: в бенчмарке её никто не выполняет, меряем только ответ 202
+        "main.enqueue_job": [("/jobs/<name>", "POST", "/jobs/rollup-rebuild", {})],
+        "main.job_status": [("/jobs/<id>", "GET", "/jobs/1", {})],
+        "main.job_result": [("/jobs/<id>/result", "GET", "/jobs/1/result", {})],
+        # Поток SSE живёт до EVENTS_MAX_DURATION — время ответа тут не мерило
+        "main.stock_events": [],
+        "main.cache_stats": [("/cache/stats", "GET", "/cache/stats", {})],
+    }
+
+
+def _request(client, method, url, kwargs, n):
+    kwargs = dict(kwargs)
+    if isinstance(kwargs.get("data"), dict):
+        kwargs["data"] = {k: str(v).format(n=n) for k, v in kwargs["data"].items()}
+    resp = client.open(url, method=method, **kwargs)
+    resp.get_data()  # дочитываем потоковые ответы
+    return resp
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_benchmarks(app, repeat=20, warmup=2):
+    with app.app_context():
+        product = Product.query.order_by(Product.id).first()
+        ctx = {"product_id": product.id, "sku": product.sku,
+               "supplier_id": Supplier.query.first().id}
+
+    scenarios = _scenarios(ctx)
+    results, uncovered = {}, []
+    client = app.test_client()
+    counter = 0
+
+    for rule in app.url_map.iter_rules():
+        if not rule.endpoint.startswith("main."):
+            continue
+        cases = scenarios.get(rule.endpoint)
+        if cases is None:
+            if "GET" in rule.methods and not rule.arguments:
+                cases = [(rule.rule, "GET", rule.rule, {})]
+            else:
+                uncovered.append(rule.endpoint)
+                continue
+
+        for name, method, url, kwargs in cases:
+            for _ in range(warmup):
+                counter += 1
+                _request(client, method, url, kwargs, counter)
+
+            timings, queries, status = [], [], None
+            for _ in range(repeat):
+                counter += 1
+                started = time.perf_counter()
+                resp = _request(client, method, url, kwargs, counter)
+                timings.append(time.perf_counter() - started)
+                queries.append(int(resp.headers.get("X-Query-Count", 0)))
+                status = resp.status_code
+
+            counter += 1
+            tracemalloc.start()
+            _request(client, method, url, kwargs, counter)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results[name] = {
+                "endpoint": rule.endpoint,
+                "status": status,
+                "p50_ms": round(_percentile(timings, 50) * 1000, 3),
+                "p95_ms": round(_percentile(timings, 95) * 1000, 3),
+                "mean_ms": round(statistics.mean(timings) * 1000, 3),
+                "queries": max(queries),
+                "peak_kib": round(peak / 1024, 1),
+            }
+
+    return results, uncovered
+
+
+def compare(current, baseline, threshold=1.25):
+    """Регрессии: метрики, выросшие больше чем в threshold раз относительно базы."""
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms", "queries", "peak_kib"):
+            old, new = base.get(metric), result.get(metric)
+            if old and new and new / old > threshold:
+                regressions.append({"scenario": name, "metric": metric,
+                                    "baseline": old, "current": new,
+                                    "ratio": round(new / old, 2)})
+    return regressions
+
+
+def _meta_path(path):
+    return path + ".meta.json"
+
+
+def generate_dataset(path, scale, seed):
+    """Генерирует набор в новый файл SQLite; scale, seed и размеры — в <path>.meta.json."""
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}",
+        "CACHE_BACKEND": "local",
+    })
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        dataset = {"scale": scale, "seed": seed, **datagen.generate(scale, seed)}
+        dataset["generate_s"] = round(time.perf_counter() - started, 1)
+        # Закрываем соединения: WAL сливается в основной файл, его можно копировать
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    with open(_meta_path(path), "w", encoding="utf-8") as f:
+        json.dump(dataset, f, ensure_ascii=False, indent=2)
+    return dataset
+
+
+def load_dataset(path):
+    """Описание ранее сгенерированного набора; без <path>.meta.json scale и seed неизвестны."""
+    try:
+        with open(_meta_path(path), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"scale": None, "seed": None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(datagen.SCALES), default="1k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="файл SQLite с набором; если он уже есть, данные не "
+                                     "генерируются, а прогон идёт по его копии")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp()
+    path = args.db or os.path.join(workdir, f"bench-{args.scale}.db")
+    if os.path.exists(path):
+        dataset = dict(load_dataset(path), reused=True)
+        if (dataset["scale"], dataset["seed"]) != (args.scale, args.seed):
+            print(f"Внимание: {path} сгенерирован с scale={dataset['scale']}, "
+                  f"seed={dataset['seed']} — в отчёт идут они", file=sys.stderr)
+    else:
+        dataset = dict(generate_dataset(path, args.scale, args.seed), reused=False)
+        print(f"Данные сгенерированы: {dataset}", file=sys.stderr)
+
+    if args.db:
+        # Сохранённый набор не трогаем: сценарии с записью идут по копии
+        run_path = os.path.join(workdir, os.path.basename(path))
+        shutil.copyfile(path, run_path)
+    else:
+        run_path = path
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{run_path}",
+        "CACHE_BACKEND": "local",
+    })
+
+    try:
+        results, uncovered = run_benchmarks(app, repeat=args.repeat)
+    finally:
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "scale": dataset["scale"],
+            "seed": dataset["seed"],
+            "dataset": dataset,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "created": datetime.utcnow().isoformat(timespec="seconds"),
+        },
+        "uncovered": uncovered,
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, r in results.items():
+        print(f"{name:40} p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+              f"SQL {r['queries']:4}  mem {r['peak_kib']:9.1f} KiB")
+    if uncovered:
+        print(f"Без сценария: {', '.join(uncovered)}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"РЕГРЕССИЯ {r['scenario']} {r['metric']}: {r['baseline']} -> {r['current']} "
+                  f"(x{r['ratio']})", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""Кэш приложения: локальный LRU+TTL уровень перед Redis.
+
+Настраивается через Config (CACHE_*). К Redis ходим через пул соединений с
+таймаутами, а после серии ошибок срабатывает предохранитель: какое-то время
+Redis не дёргаем вовсе и обходимся локальным уровнем. Так медленный или
+упавший Redis лишь немного замедляет страницы, а не роняет их.
+
+Бэкенды: redis — боевой, memory — fakeredis в памяти (тесты), local — без
+Redis, только локальный уровень.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ("redis", "memory", "local")
+
+_MISSING = object()
+
+
+class CacheUnavailable(Exception):
+    """Redis не настроен, недоступен или отключён предохранителем."""
+
+
+class LocalCache:
+    """Потокобезопасный LRU с временем жизни записей."""
+
+    def __init__(self, maxsize=1024, ttl=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CircuitBreaker:
+    """После `threshold` ошибок подряд размыкается на `reset_timeout` секунд,
+    затем пропускает одну пробную попытку."""
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "half_open":
+                # Пробный запрос один: остальные ждут его результата ещё период
+                self.opened_at = time.monotonic()
+            return state != "open"
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.skipped = 0
+        self.redis_calls = 0
+        self.redis_time = 0.0
+        self.redis_max_time = 0.0
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def observe(self, elapsed):
+        with self._lock:
+            self.redis_calls += 1
+            self.redis_time += elapsed
+            self.redis_max_time = max(self.redis_max_time, elapsed)
+
+    def to_dict(self):
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.local_hits + self.redis_hits) / lookups, 4) if lookups else None,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "redis_calls": self.redis_calls,
+            "redis_avg_ms": round(self.redis_time / self.redis_calls * 1000, 3) if self.redis_calls else None,
+            "redis_max_ms": round(self.redis_max_time * 1000, 3),
+        }
+
+
+class Cache:
+    def __init__(self):
+        self.backend = "local"
+        self.local = LocalCache()
+        self.breaker = CircuitBreaker()
+        self.stats = CacheStats()
+        self._redis = None
+        self._observers = []
+
+    def init_app(self, app):
+        config = app.config
+        self.backend = config.get("CACHE_BACKEND", "redis")
+        if self.backend not in BACKENDS:
+            raise ValueError(f"CACHE_BACKEND должен быть одним из {BACKENDS}")
+
+        self.local = LocalCache(config.get("CACHE_LOCAL_MAXSIZE", 1024),
+                                config.get("CACHE_LOCAL_TTL", 5))
+        self.breaker = CircuitBreaker(config.get("CACHE_BREAKER_THRESHOLD", 5),
+                                      config.get("CACHE_BREAKER_RESET", 30))
+        self.stats = CacheStats()
+
+        if self.backend == "redis":
+            # Клиент не подключается сразу: соединения берутся из пула по требованию
+            pool = redis.BlockingConnectionPool.from_url(
+                config["CACHE_REDIS_URL"],
+                max_connections=config.get("CACHE_MAX_CONNECTIONS", 50),
+                timeout=config.get("CACHE_SOCKET_TIMEOUT", 0.25),
+                socket_timeout=config.get("CACHE_SOCKET_TIMEOUT", 0.25),
+                socket_connect_timeout=config.get("CACHE_CONNECT_TIMEOUT", 0.25),
+                health_check_interval=30,
+                decode_responses=True,
+            )
+            self._redis = redis.Redis(connection_pool=pool)
+        elif self.backend == "memory":
+            import fakeredis
+            self._redis = fakeredis.FakeRedis(decode_responses=True)
+        else:
+            self._redis = None
+
+        app.extensions["cache"] = self
+
+    @property
+    def redis(self):
+        return self._redis
+
+    def add_observer(self, fn):
+        """fn(elapsed) вызывается после каждого обращения к Redis."""
+        if fn not in self._observers:
+            self._observers.append(fn)
+
+    def run(self, fn):
+        """Выполняет fn(redis_client) через предохранитель и с замером времени.
+
+        Бросает CacheUnavailable, если Redis нет или он не ответил.
+        """
+        if self._redis is None:
+            raise CacheUnavailable("Redis не настроен")
+        if not self.breaker.allow():
+            self.stats.incr("skipped")
+            raise CacheUnavailable("Redis отключён предохранителем")
+
+        started = time.perf_counter()
+        try:
+            result = fn(self._redis)
+        except redis.RedisError as e:
+            self.breaker.failure()
+            self.stats.incr("errors")
+            log.warning("Ошибка Redis: %s", e)
+            raise CacheUnavailable(str(e)) from e
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats.observe(elapsed)
+            for observer in self._observers:
+                observer(elapsed)
+        self.breaker.success()
+        return result
+
+    def call(self, method, *args, **kwargs):
+        return self.run(lambda client: getattr(client, method)(*args, **kwargs))
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            self.stats.incr("local_hits")
+            return value
+
+        try:
+            raw = self.call("get", key)
+        except CacheUnavailable:
+            raw = None
+        if raw is None:
+            self.stats.incr("misses")
+            return default
+
+        self.stats.incr("redis_hits")
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value, ttl=None):
+        local_ttl = self.local.ttl if ttl is None else min(ttl, self.local.ttl)
+        self.local.set(key, value, local_ttl)
+        try:
+            self.call("set", key, json.dumps(value), ex=ttl)
+        except CacheUnavailable:
+            pass
+
+    def delete(self, *keys):
+        self.local.delete(*keys)
+        try:
+            self.call("delete", *keys)
+        except CacheUnavailable:
+            pass
+
+    def get_stats(self):
+        data = self.stats.to_dict()
+        data.update(backend=self.backend, breaker=self.breaker.state, local_size=len(self.local))
+        return data
+
+
+cache = Cache()
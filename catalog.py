@@ -0,0 +1,221 @@
+"""Импорт каталога товаров из CSV или XLSX (прайс-лист поставщика).
+
+Строки читаются потоком и применяются пачками по CATALOG_BATCH_SIZE, каждая
+пачка — одна транзакция. Товары сопоставляются по артикулу (sku): известные
+обновляются, новые вставляются одним INSERT ... RETURNING, и в той же
+транзакции для них создаются нулевые строки остатков. У известных товаров
+меняются только колонки, которые есть в файле: прайс-лист без описаний не
+стирает описания. Поставщики ищутся по названию в словаре, загруженном один
+раз на импорт; неизвестные создаются.
+
+Колонки: sku, name (обязательные), category, unit, description, supplier.
+"""
+import logging
+import tempfile
+import zipfile
+
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from flask import current_app
+from sqlalchemy import bindparam, insert, select, update
+
+from models import db, dialect_insert, Product, Stock, Supplier, DEFAULT_WAREHOUSE
+from ingest import IngestReport, iter_records, _text
+import counters
+import search
+
+log = logging.getLogger(__name__)
+
+FORMATS = ("csv", "xlsx")
+# Content-Type тела -> формат, если ?format не задан
+MIMETYPES = {
+    "text/csv": "csv",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+}
+FIELDS = ("sku", "name", "category", "unit", "description")
+# Колонка файла -> столбец products, который импорт перезаписывает у
+# существующего товара, если колонка есть в файле
+COLUMNS = {"name": "name", "category": "category", "unit": "unit",
+           "description": "description", "supplier": "supplier_id"}
+
+
+class CatalogReport(IngestReport):
+    def __init__(self):
+        super().__init__()
+        self.created = 0
+        self.updated = 0
+
+    def to_dict(self):
+        data = super().to_dict()
+        data.update(created=self.created, updated=self.updated)
+        return data
+
+
+def iter_xlsx(stream):
+    """(номер строки, dict) первого листа; первая строка — заголовки."""
+    if not stream.seekable():
+        # XLSX — zip-архив, его нельзя читать с начала до конца без перемоток
+        spool = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+        while chunk := stream.read(1024 * 1024):
+            spool.write(chunk)
+        spool.seek(0)
+        stream = spool
+    try:
+        book = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        raise ValueError("Файл не является книгой XLSX") from None
+    try:
+        rows = book.worksheets[0].iter_rows(values_only=True)
+        header = [str(h).strip().lower() if h is not None else "" for h in next(rows, ())]
+        for line, values in enumerate(rows, 2):
+            if any(v is not None for v in values):
+                yield line, dict(zip(header, values))
+    finally:
+        book.close()
+
+
+def iter_rows(stream, fmt, reject=None):
+    if fmt == "xlsx":
+        return iter_xlsx(stream)
+    return iter_records(stream, "csv", reject)
+
+
+def parse_row(record):
+    row = {name: _text(record, name) for name in FIELDS}
+    if row["sku"] is None:
+        raise ValueError("нужен артикул (sku)")
+    if row["name"] is None:
+        raise ValueError("нужно название (name)")
+    row["supplier"] = _text(record, "supplier")
+    # Какие столбцы обновлять у известного товара: только присланные в файле
+    row["columns"] = tuple(c for key, c in COLUMNS.items() if key in record)
+    return row
+
+
+class SupplierMap:
+    """Название поставщика -> id; новые поставщики создаются пачкой.
+
+    Созданные в пачке поставщики попадают в ids только после commit()
+    пачки: откаченная пачка не оставляет в словаре несуществующих id.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.pending = {}
+        for sid, name in db.session.execute(select(Supplier.id, Supplier.name).order_by(Supplier.id)):
+            self.ids.setdefault(name, sid)
+
+    def get(self, name):
+        return self.pending.get(name, self.ids.get(name))
+
+    def resolve(self, names):
+        self.pending = {}
+        missing = sorted({n for n in names if n and n not in self.ids})
+        if missing:
+            rows = db.session.execute(
+                insert(Supplier).returning(Supplier.id, Supplier.name, sort_by_parameter_order=True),
+                [{"name": n} for n in missing])
+            self.pending = {name: sid for sid, name in rows}
+            counters.record(suppliers=len(missing))
+
+    def commit(self):
+        self.ids.update(self.pending)
+        self.pending = {}
+
+    def rollback(self):
+        self.pending = {}
+
+
+def _apply_batch(batch, report, suppliers):
+    # Повтор артикула внутри пачки: побеждает последняя строка
+    rows = {}
+    for line, row in batch:
+        rows[row["sku"]] = row
+    rows = list(rows.values())
+
+    columns = {r["sku"]: r.pop("columns") for r in rows}
+    suppliers.resolve(r["supplier"] for r in rows)
+    for r in rows:
+        r["supplier_id"] = suppliers.get(r.pop("supplier"))
+
+    t = Product.__table__
+    existing = dict(db.session.execute(
+        select(Product.sku, Product.id).where(Product.sku.in_([r["sku"] for r in rows]))).all())
+    known = [r for r in rows if r["sku"] in existing]
+    new = [r for r in rows if r["sku"] not in existing]
+
+    created = []
+    if new:
+        stmt = dialect_insert(t)
+        if hasattr(stmt, "on_conflict_do_nothing"):
+            # Товар с тем же артикулом мог появиться параллельно — его обновим ниже
+            stmt = stmt.on_conflict_do_nothing(index_elements=["sku"])
+        # RETURNING отдаёт только вставленные строки: по ним считаем новые товары
+        inserted = dict(db.session.execute(stmt.returning(t.c.sku, t.c.id), new).all())
+        known += [r for r in new if r["sku"] not in inserted]
+        created = list(inserted.values())
+
+    # Один UPDATE на набор присланных колонок (в одном файле он обычно один)
+    by_columns = {}
+    for r in known:
+        by_columns.setdefault(columns[r["sku"]], []).append(r)
+    for names, group in by_columns.items():
+        db.session.execute(
+            update(t).where(t.c.sku == bindparam("key"))
+            .values({c: bindparam(c) for c in names}),
+            # Лишние ключи совпадают с именами столбцов и тоже попали бы в SET
+            [{**{c: r[c] for c in names}, "key": r["sku"]} for r in group])
+
+    if created:
+        stocks = dialect_insert(Stock.__table__)
+        if hasattr(stocks, "on_conflict_do_nothing"):
+            stocks = stocks.on_conflict_do_nothing(index_elements=["product_id", "warehouse"])
+        db.session.execute(stocks, [
+            {"product_id": pid, "warehouse": DEFAULT_WAREHOUSE, "quantity": 0, "min_stock": 0}
+            for pid in created])
+
+    counters.record(products=len(created),
+                    low_stock=len(created) * counters.low_stock_delta(None, 0, 0))
+    report.created += len(created)
+    report.updated += len(known)
+    report.accepted += len(batch)
+
+
+def import_catalog(stream, fmt, batch_size=None, progress=None):
+    """Загружает каталог из потока; progress(report) вызывается после каждой пачки."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Формат должен быть одним из {FORMATS}")
+    batch_size = batch_size or current_app.config.get("CATALOG_BATCH_SIZE", 5000)
+    report = CatalogReport()
+    suppliers = SupplierMap()
+
+    def flush(batch):
+        try:
+            _apply_batch(batch, report, suppliers)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            suppliers.rollback()
+            raise
+        suppliers.commit()
+        log.info("Каталог: загружено %d строк (новых %d, обновлено %d)",
+                 report.accepted, report.created, report.updated)
+        if progress:
+            progress(report)
+
+    batch = []
+    for line, record in iter_rows(stream, fmt, report.reject):
+        try:
+            batch.append((line, parse_row(record)))
+        except ValueError as e:
+            report.reject(line, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    # Массовая вставка идёт мимо событий ORM — подсказки сбрасываем сами
+    search.suggestions.clear()
+    return report
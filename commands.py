@@ -0,0 +1,113 @@
+"""CLI-команды обслуживания склада (flask --app app <команда>)."""
+import time
+from datetime import datetime, timedelta
+
+import click
+
+import archive
+import catalog
+import counters
+import db_profile
+import jobs
+import reconcile
+import reorder
+import replicas
+import rollup
+from models import db
+
+
+def init_app(app):
+    @app.cli.command("counters-reconcile")
+    def counters_reconcile():
+        """Пересчитать счётчики главной страницы по базе."""
+        drift = counters.reconcile()
+        click.echo(f"Расхождения: {drift}" if drift else "Счётчики совпадают с базой")
+
+    @app.cli.command("rollup-rebuild")
+    def rollup_rebuild():
+        """Пересобрать дневную свёртку остатков из журнала операций."""
+        rollup.rebuild()
+        db.session.commit()
+        click.echo("Свёртка остатков пересобрана")
+
+    @app.cli.command("db-optimize")
+    def db_optimize():
+        """Обновить статистику планировщика SQLite (PRAGMA optimize)."""
+        if db.engine.dialect.name != "sqlite":
+            click.echo("Только для SQLite")
+            return
+        with db.engine.connect() as conn:
+            db_profile.run_optimize(conn.connection.dbapi_connection)
+        click.echo("PRAGMA optimize выполнен")
+
+    @app.cli.command("reorder-recommend")
+    @click.option("--apply", "write", is_flag=True, help="Записать рекомендации в min_stock")
+    @click.option("--out", type=click.Path(dir_okay=False), help="CSV с рекомендациями")
+    @click.option("--lookback-days", type=int, help="Окно истории отгрузок, дней")
+    @click.option("--lead-time-days", type=float, help="Срок поставки, дней")
+    @click.option("--service-level", type=float, help="Уровень сервиса, например 0.95")
+    @click.option("--batch-size", type=int, help="Товаров в пачке")
+    def reorder_recommend(write, out, **options):
+        """Пересчитать точки заказа (min_stock) по истории отгрузок."""
+        summary = reorder.run(write=write, out=out, **options)
+        verb = "изменено" if write else "к изменению"
+        click.echo(f"Строк остатков: {summary['rows']}, {verb}: {summary['changed']}")
+
+    @app.cli.command("operations-archive")
+    @click.option("--days", type=int, help="Архивировать операции старше N дней")
+    def operations_archive(days):
+        """Перенести старые операции в архив, сложив их во входящие остатки."""
+        older_than = datetime.utcnow() - timedelta(days=days) if days else None
+        moved = archive.archive_operations(older_than)
+        click.echo(f"Перенесено в архив: {moved}")
+
+    @app.cli.command("stock-reconcile")
+    @click.option("--apply", "write", is_flag=True, help="Исправить остатки по журналу")
+    @click.option("--out", type=click.Path(dir_okay=False), help="CSV с расхождениями")
+    @click.option("--chunk-size", type=int, help="Товаров в диапазоне")
+    @click.option("--workers", type=int, help="Число процессов")
+    def stock_reconcile(write, out, chunk_size, workers):
+        """Сверить остатки с журналом операций (входящий остаток + движения)."""
+        summary = reconcile.run(write=write, out=out, chunk_size=chunk_size, workers=workers)
+        msg = f"Диапазонов: {summary['chunks']}, расхождений: {summary['drift']}"
+        if write:
+            msg += f", исправлено: {summary['fixed']}"
+        click.echo(msg)
+
+    @app.cli.command("catalog-import")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(catalog.FORMATS),
+                  help="Формат файла (по умолчанию — по расширению)")
+    @click.option("--batch-size", type=int, help="Строк в пачке")
+    def catalog_import(path, fmt, batch_size):
+        """Загрузить каталог товаров из CSV или XLSX (обновление по артикулу)."""
+        fmt = fmt or ("xlsx" if path.lower().endswith(".xlsx") else "csv")
+
+        def progress(report):
+            click.echo(f"  строк: {report.accepted}, новых: {report.created}, "
+                       f"обновлено: {report.updated}, ошибок: {report.rejected}")
+
+        with open(path, "rb") as f:
+            report = catalog.import_catalog(f, fmt, batch_size, progress)
+        for error in report.to_dict()["errors"][:20]:
+            click.echo(f"  строка {error['line']}: {error['error']}")
+        click.echo(f"Импорт завершён: новых {report.created}, обновлено {report.updated}, "
+                   f"отклонено {report.rejected}")
+
+    @app.cli.command("jobs-purge")
+    @click.option("--ttl", type=int, help="Удалить задачи, завершённые больше N секунд назад")
+    def jobs_purge(ttl):
+        """Удалить старые завершённые задачи и их файлы (JOBS_RESULT_TTL)."""
+        removed = jobs.purge(ttl)
+        click.echo(f"Удалено задач: {removed}")
+
+    @app.cli.command("replica-refresh")
+    @click.option("--interval", type=float, help="Повторять каждые N секунд")
+    def replica_refresh(interval):
+        """Снять копию SQLite-базы в файл реплики (REPLICA_DATABASE_URI)."""
+        while True:
+            replicas.refresh(app)
+            click.echo(f"Реплика обновлена: {datetime.now():%H:%M:%S}")
+            if not interval:
+                break
+            time.sleep(interval)
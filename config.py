@@ -6,3 +6,110 @@ class Config:
     SECRET_KEY = "dev-secret"
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(BASE_DIR, "data", "warehouse.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Пул соединений и PRAGMA для SQLite (см. db_profile.py)
+    DB_POOL_SIZE = 10
+    DB_MAX_OVERFLOW = 20
+    DB_POOL_TIMEOUT = 10
+    DB_POOL_RECYCLE = 1800
+    SQLITE_BUSY_TIMEOUT_MS = 5000
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KIB = 64 * 1024
+    SQLITE_OPTIMIZE_INTERVAL = 3600
+
+    # Реплика для чтения списков (replicas.py); пусто — всё читается из основной базы.
+    # Клиент, который только что писал, STICKY секунд читает из основной базы;
+    # у внешней реплики отставание считается не больше MAX_LAG секунд
+    REPLICA_DATABASE_URI = os.environ.get("REPLICA_DATABASE_URI")
+    REPLICA_STICKY_SECONDS = 5
+    REPLICA_MAX_LAG = 1
+
+    # Сколько SQL-запросов на HTTP-запрос считаем нормой (больше — предупреждение в лог)
+    QUERY_COUNT_LIMIT = 20
+
+    # SQL-запросы дольше порога (мс) пишутся в лог с отпечатком; 0 — не писать
+    SLOW_QUERY_MS = int(os.environ.get("SLOW_QUERY_MS", 200))
+
+    # Сэмплирующий профилировщик по ?_profile=1; включать только на время разбора
+    PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED") == "1"
+    PROFILER_INTERVAL = 0.005
+
+    # Максимум строк в выдаче полнотекстового поиска товаров
+    SEARCH_RESULT_LIMIT = 200
+
+    # Автодополнение товаров: максимум подсказок и LRU частых префиксов в процессе
+    AUTOCOMPLETE_LIMIT = 10
+    AUTOCOMPLETE_CACHE_SIZE = 2048
+    AUTOCOMPLETE_CACHE_TTL = 60
+
+    # Сколько артикулов держит карта sku -> id для сканеров (scanner.py)
+    SKU_MAP_SIZE = 100_000
+
+    # Уход остатка в минус: allow — молча, flag — с предупреждением, reject — запрет
+    NEGATIVE_STOCK_POLICY = "flag"
+
+    # Размер пачки (и транзакции) при пакетной загрузке операций
+    BULK_BATCH_SIZE = 1000
+
+    # Размер пачки (и транзакции) при импорте каталога товаров
+    CATALOG_BATCH_SIZE = 5000
+
+    # Сколько строк выгрузки читать из курсора за раз
+    EXPORT_BATCH_SIZE = 1000
+
+    # Расчёт точки заказа (reorder.py): окно истории, срок поставки, уровень сервиса
+    REORDER_LOOKBACK_DAYS = 90
+    REORDER_LEAD_TIME_DAYS = 7
+    REORDER_SERVICE_LEVEL = 0.95
+    REORDER_BATCH_SIZE = 50_000
+
+    # Операции старше ARCHIVE_AFTER_DAYS дней переносятся в архив (archive.py)
+    ARCHIVE_AFTER_DAYS = 365
+    ARCHIVE_BATCH_SIZE = 10_000
+
+    # Сверка остатков с журналом (reconcile.py): товаров в диапазоне и число процессов
+    # (None — по числу ядер)
+    RECONCILE_CHUNK_SIZE = 10_000
+    RECONCILE_WORKERS = None
+
+    # Фоновые задачи (jobs.py, worker.py): попытки и паузы между ними (сек, растут вдвое),
+    # сколько задача числится за воркером без вестей о прогрессе, опрос очереди
+    JOBS_MAX_ATTEMPTS = 3
+    JOBS_RETRY_DELAY = 10
+    JOBS_RETRY_MAX_DELAY = 600
+    JOBS_LEASE_SECONDS = 600
+    JOBS_POLL_INTERVAL = 2
+    # Каталог для загруженных файлов и результатов задач
+    JOBS_DIR = os.path.join(BASE_DIR, "data", "jobs")
+    # Сколько (сек) хранить завершённые задачи и их файлы-результаты; 0 — бессрочно
+    JOBS_RESULT_TTL = 7 * 24 * 3600
+    # Потоки-воркеры в самом веб-процессе, когда worker.py не запущен; 0 — не запускать
+    JOBS_LOCAL_WORKERS = int(os.environ.get("JOBS_LOCAL_WORKERS", 0))
+
+    # Как часто (сек) воркер задач сверяет счётчики главной страницы с базой;
+    # 0 — не сверять
+    COUNTERS_RECONCILE_INTERVAL = 300
+
+    # Поток SSE /events/stock: пинг, время жизни соединения (сек), очередь клиента.
+    # Каждый поток держит поток воркера: MAX_STREAMS — предел на процесс
+    # (None — без предела, как у сервера разработки; serve.py задаёт свой)
+    EVENTS_KEEPALIVE = 15
+    EVENTS_MAX_DURATION = 300
+    EVENTS_QUEUE_SIZE = 1000
+    EVENTS_MAX_STREAMS = None
+
+    # Сколько секунд хранить отрисованную страницу списка (versions.py)
+    PAGE_CACHE_TTL = 300
+
+    # Кэш: redis | memory (fakeredis, для тестов) | local (только кэш процесса)
+    CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "redis")
+    CACHE_REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+    CACHE_MAX_CONNECTIONS = 50
+    # Таймауты короткие: медленный Redis не должен держать запрос
+    CACHE_SOCKET_TIMEOUT = 0.25
+    CACHE_CONNECT_TIMEOUT = 0.25
+    CACHE_LOCAL_MAXSIZE = 1024
+    CACHE_LOCAL_TTL = 5
+    # Предохранитель: после N ошибок подряд не ходим в Redis столько секунд
+    CACHE_BREAKER_THRESHOLD = 5
+    CACHE_BREAKER_RESET = 30
@@ -3,15 +3,15 @@ import pytest
 
 from app import create_app
 from models import db, Supplier, Product, Stock, Operation
+from cache import cache
 
 @pytest.fixture
 def app():
-    flask_app = create_app()
-    #flask_app = create_app()
-    flask_app.config.update({
+    flask_app = create_app({
         "TESTING": True,
         "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "WTF_CSRF_ENABLED": False
+        "WTF_CSRF_ENABLED": False,
+        "CACHE_BACKEND": "memory",
     })
 
     # Инициализируем расширение SQLAlchemy только если оно ещё не зарегистрировано
@@ -26,6 +26,18 @@ def app():
         db.drop_all()
 
 
+@pytest.fixture
+def fake_redis(app):
+    return cache.redis
+
+
+@pytest.fixture
+def shared_redis(fake_redis, monkeypatch):
+    """fakeredis, который код считает общим Redis всех процессов (как CACHE_BACKEND=redis)."""
+    monkeypatch.setattr(cache, "backend", "redis")
+    return fake_redis
+
+
 @pytest.fixture
 def client(app):
     return app.test_client()
@@ -0,0 +1,159 @@
+"""Счётчики главной страницы: товары, поставщики, товары с критическим остатком.
+
+Записывающие пути копят изменения счётчиков в session.info, а после успешного
+commit они применяются к хэшу в Redis через HINCRBY. Полный пересчёт COUNT(*)
+нужен только когда счётчиков ещё нет, и делает его один процесс (блокировка
+SET NX). Периодическая сверка с базой (в воркере задач или командой
+counters-reconcile) исправляет накопившиеся расхождения.
+"""
+import logging
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import cache, CacheUnavailable
+from models import db, Product, Supplier, Stock
+
+log = logging.getLogger(__name__)
+
+COUNTERS_KEY = "dashboard:counters"
+LOCK_KEY = "dashboard:counters:lock"
+RECONCILE_KEY = "dashboard:counters:reconciled"
+FIELDS = ("products", "suppliers", "low_stock")
+
+LOCK_TTL = 30
+WAIT_STEP = 0.05
+WAIT_STEPS = 40
+
+
+def record(**deltas):
+    """Запоминает изменения счётчиков до commit текущей транзакции."""
+    pending = db.session.info.setdefault("counter_deltas", {})
+    for name, delta in deltas.items():
+        if delta:
+            pending[name] = pending.get(name, 0) + delta
+
+
+def low_stock_delta(quantity_before, quantity_after, min_stock):
+    """+1/-1, если строка остатка вошла в критические или вышла из них."""
+    min_stock = min_stock or 0
+    was_low = quantity_before is not None and quantity_before <= min_stock
+    return int(quantity_after <= min_stock) - int(was_low)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session):
+    deltas = session.info.pop("counter_deltas", None)
+    if not deltas:
+        return
+
+    def apply(client):
+        # Пока счётчиков нет, инкременты не нужны — их посчитает пересчёт
+        if not client.exists(COUNTERS_KEY):
+            return
+        pipe = client.pipeline()
+        for name, delta in deltas.items():
+            pipe.hincrby(COUNTERS_KEY, name, delta)
+        pipe.execute()
+
+    try:
+        cache.run(apply)
+    except CacheUnavailable:
+        # Расхождение исправит сверка
+        pass
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("counter_deltas", None)
+
+
+def count_all():
+    return {
+        "products": Product.query.count(),
+        "suppliers": Supplier.query.count(),
+        # Условие частичного индекса ix_stocks_deficit — считается по индексу
+        "low_stock": Stock.query.filter(Stock.deficit >= 0).count(),
+    }
+
+
+def _store(counts):
+    def store(client):
+        pipe = client.pipeline(transaction=True)
+        pipe.delete(COUNTERS_KEY)
+        pipe.hset(COUNTERS_KEY, mapping=counts)
+        pipe.execute()
+
+    cache.run(store)
+
+
+def _load():
+    data = cache.call("hgetall", COUNTERS_KEY)
+    if not data:
+        return None
+    return {name: int(data.get(name, 0)) for name in FIELDS}
+
+
+def get_counters():
+    """Текущие значения счётчиков.
+
+    Если их нет в Redis, пересчитывает один процесс, остальные ждут его
+    результата. Без Redis считаем по базе и держим результат в локальном
+    кэше процесса CACHE_LOCAL_TTL секунд.
+    """
+    try:
+        counts = _load()
+        if counts is not None:
+            return counts
+
+        if cache.call("set", LOCK_KEY, "1", nx=True, ex=LOCK_TTL):
+            try:
+                counts = count_all()
+                _store(counts)
+                return counts
+            finally:
+                cache.call("delete", LOCK_KEY)
+
+        for _ in range(WAIT_STEPS):
+            time.sleep(WAIT_STEP)
+            counts = _load()
+            if counts is not None:
+                return counts
+    except CacheUnavailable:
+        pass
+
+    counts = cache.local.get(COUNTERS_KEY)
+    if counts is None:
+        counts = count_all()
+        cache.local.set(COUNTERS_KEY, counts)
+    return counts
+
+
+def reconcile():
+    """Сверяет счётчики с базой и перезаписывает их; возвращает найденные расхождения."""
+    counts = count_all()
+    current = _load() or {}
+    _store(counts)
+    return {name: counts[name] - current[name]
+            for name in FIELDS if name in current and current[name] != counts[name]}
+
+
+def maybe_reconcile():
+    """Сверка не чаще раза в COUNTERS_RECONCILE_INTERVAL секунд на все процессы.
+
+    Зовёт её простаивающий воркер задач (jobs.work), а не запросы главной:
+    пересчёт COUNT(*) не должен задерживать ответ.
+    """
+    interval = current_app.config.get("COUNTERS_RECONCILE_INTERVAL")
+    if not interval:
+        return
+    try:
+        if cache.call("set", RECONCILE_KEY, "1", nx=True, ex=interval):
+            drift = reconcile()
+            if drift:
+                log.warning("Счётчики главной разошлись с базой: %s", drift)
+    except CacheUnavailable:
+        # Без Redis счётчики и так считаются по базе
+        pass
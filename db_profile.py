@@ -0,0 +1,132 @@
+"""Профиль движка БД: параметры пула и PRAGMA для SQLite.
+
+Для файловой SQLite каждое новое соединение получает:
+- journal_mode=WAL — читатели не ждут писателей и наоборот;
+- synchronous=NORMAL — в WAL fsync только на контрольных точках, commit
+  по-прежнему атомарен, теряться могут лишь последние транзакции при
+  отключении питания;
+- busy_timeout — писатель ждёт блокировку, а не падает с "database is locked";
+- mmap_size, cache_size, temp_store — чтение через отображение в память,
+  больший кэш страниц, временные таблицы сортировок в памяти.
+
+Раз в SQLITE_OPTIMIZE_INTERVAL секунд соединение, возвращаемое в пул,
+выполняет PRAGMA optimize (обновление статистики планировщика).
+
+Для серверной БД (PostgreSQL и т.п.) задаются размер пула, pre-ping и
+recycle. Всё это попадает в SQLALCHEMY_ENGINE_OPTIONS, если их там не
+задали явно.
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from models import db
+from replicas import REPLICA_BIND
+
+log = logging.getLogger(__name__)
+
+
+def _is_sqlite(url):
+    return url.get_backend_name() == "sqlite"
+
+
+def _is_memory(url):
+    return url.database in (None, "", ":memory:") or "mode=memory" in str(url)
+
+
+def engine_options(uri, config):
+    """Параметры create_engine для uri с учётом настроек config."""
+    url = make_url(uri)
+    if _is_sqlite(url):
+        if _is_memory(url):
+            # Flask-SQLAlchemy сам ставит StaticPool для базы в памяти
+            return {}
+        return {
+            "pool_size": config.get("DB_POOL_SIZE", 10),
+            "max_overflow": config.get("DB_MAX_OVERFLOW", 20),
+            # Таймаут драйвера — то же ожидание блокировки, но и на BEGIN
+            "connect_args": {"timeout": config.get("SQLITE_BUSY_TIMEOUT_MS", 5000) / 1000},
+        }
+    return {
+        "pool_size": config.get("DB_POOL_SIZE", 10),
+        "max_overflow": config.get("DB_MAX_OVERFLOW", 20),
+        "pool_timeout": config.get("DB_POOL_TIMEOUT", 10),
+        "pool_recycle": config.get("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": True,
+    }
+
+
+def sqlite_pragmas(config):
+    return (
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+        ("busy_timeout", config.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        ("mmap_size", config.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        # Отрицательное значение — размер в КиБ, а не в страницах
+        ("cache_size", -config.get("SQLITE_CACHE_SIZE_KIB", 64 * 1024)),
+        ("temp_store", "MEMORY"),
+    )
+
+
+class Optimizer:
+    """Выполняет PRAGMA optimize не чаще раза в interval секунд на процесс."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.last_run = time.monotonic()
+        self._lock = threading.Lock()
+
+    def due(self):
+        return self.interval and time.monotonic() - self.last_run >= self.interval
+
+    def __call__(self, dbapi_connection, connection_record):
+        if not self.due() or not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self.due():
+                run_optimize(dbapi_connection)
+                self.last_run = time.monotonic()
+        except Exception as e:
+            log.warning("PRAGMA optimize не выполнен: %s", e)
+        finally:
+            self._lock.release()
+
+
+def run_optimize(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA optimize")
+    finally:
+        cursor.close()
+
+
+def configure(app):
+    """Дополняет SQLALCHEMY_ENGINE_OPTIONS; вызывать до db.init_app."""
+    options = dict(engine_options(app.config["SQLALCHEMY_DATABASE_URI"], app.config))
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+
+def init_app(app):
+    """Вешает PRAGMA на подключения файловых SQLite-движков; после db.init_app."""
+    pragmas = sqlite_pragmas(app.config)
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            # Реплику только читают, а её файл подменяется целиком (replicas.py)
+            if key == REPLICA_BIND or not _is_sqlite(engine.url) or _is_memory(engine.url):
+                continue
+            event.listen(engine, "connect", set_pragmas)
+            event.listen(engine, "checkin",
+                         Optimizer(app.config.get("SQLITE_OPTIMIZE_INTERVAL", 3600)))
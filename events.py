@@ -0,0 +1,160 @@
+"""Живые обновления остатков: Server-Sent Events поверх Redis pub/sub.
+
+Проводка запоминает изменения остатков в сессии (как counters), и только
+после commit они публикуются в канал Redis EVENTS_CHANNEL; откат их
+отбрасывает. В каждом процессе один фоновый поток подписан на канал и
+раздаёт события локальным очередям открытых потоков SSE, так что число
+соединений с Redis не зависит от числа открытых страниц.
+
+Без Redis (CACHE_BACKEND=local/memory) или когда он недоступен события
+раздаются только внутри процесса.
+
+Событие — JSON {product_id, warehouse, quantity, min_stock, low}, где low —
+изменение числа критических остатков (+1, -1 или 0).
+
+Поток SSE занимает поток воркера gunicorn (gthread) на всё время жизни, до
+EVENTS_MAX_DURATION секунд. Поэтому открытых потоков в процессе не больше
+EVENTS_MAX_STREAMS (serve.py по умолчанию отдаёт им половину --threads).
+Лишние подключения получают 503, и страница пробует снова позже.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+import redis
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db
+from cache import cache, CacheUnavailable
+
+log = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = "events:stock"
+
+
+class LocalBroker:
+    """Раздача событий подписчикам внутри процесса, по очереди на подписчика."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, maxsize=1000, limit=None):
+        """Очередь нового подписчика; None, если подписчиков уже limit."""
+        q = queue.Queue(maxsize)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def dispatch(self, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(data)
+            except queue.Full:
+                # Медленный клиент теряет события, а не тормозит остальных
+                pass
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+broker = LocalBroker()
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _listen():
+    while True:
+        client = cache.redis
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(EVENTS_CHANNEL)
+            while cache.redis is client:
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    broker.dispatch(message["data"])
+            pubsub.close()
+        except redis.RedisError as e:
+            log.warning("Подписка на события остатков прервана: %s", e)
+            time.sleep(1)
+
+
+def _ensure_listener():
+    global _listener
+    if cache.backend != "redis":
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, name="stock-events", daemon=True)
+            _listener.start()
+
+
+# ---------------- Публикация ----------------
+def record(**change):
+    """Запоминает изменение остатка до commit текущей транзакции."""
+    db.session.info.setdefault("stock_events", []).append(change)
+
+
+def publish(data):
+    if cache.backend == "redis":
+        try:
+            cache.call("publish", EVENTS_CHANNEL, data)
+            return
+        except CacheUnavailable:
+            pass
+    broker.dispatch(data)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    for change in session.info.pop("stock_events", ()):
+        publish(json.dumps(change, ensure_ascii=False))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("stock_events", None)
+
+
+# ---------------- Поток SSE ----------------
+def open_stream():
+    """Подписка для нового потока SSE; None, если в процессе уже EVENTS_MAX_STREAMS потоков."""
+    config = current_app.config
+    return broker.subscribe(config.get("EVENTS_QUEUE_SIZE", 1000),
+                            limit=config.get("EVENTS_MAX_STREAMS"))
+
+
+def stream(q):
+    """Генератор текста text/event-stream для подписки q из open_stream().
+
+    Раз в EVENTS_KEEPALIVE секунд шлёт комментарий, чтобы прокси не рвали
+    соединение; через EVENTS_MAX_DURATION секунд закрывает поток — браузер
+    переподключится сам, а поток воркера освободится.
+    """
+    config = current_app.config
+    keepalive = config.get("EVENTS_KEEPALIVE", 15)
+    deadline = time.monotonic() + config.get("EVENTS_MAX_DURATION", 300)
+    _ensure_listener()
+    try:
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            try:
+                data = q.get(timeout=keepalive)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: stock\ndata: {data}\n\n"
+    finally:
+        broker.unsubscribe(q)
@@ -0,0 +1,93 @@
+"""Потоковая выгрузка журнала операций и текущих остатков (CSV/NDJSON).
+
+Строки читаются курсором порциями по EXPORT_BATCH_SIZE (yield_per) и сразу
+отдаются клиенту, поэтому расход памяти не зависит от размера выгрузки.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select, union_all
+
+from models import db, Product, Stock, Operation, OperationArchive
+import archive
+
+FORMATS = ("csv", "ndjson")
+MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def operations_query(date_from=None, date_to=None, product_id=None):
+    """Журнал в хронологическом порядке; date_to — исключающая граница.
+
+    Архив добавляется, только если интервал заходит за его горизонт.
+    """
+    def journal(source):
+        stmt = (select(source.id, source.date, source.product_id,
+                       Product.sku, Product.name.label("product"), source.type,
+                       source.quantity, source.from_wh, source.to_wh,
+                       source.responsible, source.note)
+                .outerjoin(Product, Product.id == source.product_id))
+        if date_from is not None:
+            stmt = stmt.where(source.date >= date_from)
+        if date_to is not None:
+            stmt = stmt.where(source.date < date_to)
+        if product_id is not None:
+            stmt = stmt.where(source.product_id == product_id)
+        return stmt
+
+    if archive.reaches_archive(date_from) is None:
+        return journal(Operation).order_by(Operation.date, Operation.id)
+    both = union_all(journal(OperationArchive), journal(Operation)).subquery()
+    return select(both).order_by(both.c.date, both.c.id)
+
+
+def stock_query():
+    return (select(Stock.product_id, Product.sku, Product.name.label("product"),
+                   Stock.warehouse, Stock.quantity, Stock.min_stock)
+            .join(Product, Product.id == Stock.product_id)
+            .order_by(Stock.product_id, Stock.warehouse))
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def iter_rows(stmt, fmt, batch_size=1000):
+    """Генератор текстовых кусков выгрузки — по одному на порцию строк."""
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    columns = list(result.keys())
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        yield buf.getvalue()
+        for part in result.partitions():
+            buf.seek(0)
+            buf.truncate()
+            writer.writerows([_value(v) for v in row] for row in part)
+            yield buf.getvalue()
+        return
+
+    for part in result.partitions():
+        yield "".join(
+            json.dumps({c: _value(v) for c, v in zip(columns, row)}, ensure_ascii=False) + "\n"
+            for row in part
+        )
+
+
+def encode(chunks, compress=False):
+    """UTF-8 и, по желанию, потоковое сжатие gzip."""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode("utf-8")
+        return
+
+    gz = zlib.compressobj(wbits=31)  # 31 — формат gzip с заголовком
+    for chunk in chunks:
+        data = gz.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield gz.flush()
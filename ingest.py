@@ -0,0 +1,294 @@
+"""Пакетная загрузка операций из потока CSV или NDJSON.
+
+Поток разбирается построчно, операции вставляются пачками (executemany), а
+изменения остатков по пачке сворачиваются по парам (товар, склад) и
+применяются одним UPDATE. При политике reject уход в минус отсекает условие
+самого UPDATE; если остатки успели измениться, пачка проводится заново.
+Ошибка в строке отклоняет только эту строку, а не всю загрузку.
+"""
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import case, insert, or_, select, update
+
+from ledger import OPERATION_TYPES, movements, negative_stock_policy
+from models import db, dialect_insert, Product, Stock, Operation
+import counters
+import rollup
+
+FORMATS = ("csv", "ndjson")
+
+# Сколько ошибок возвращать в отчёте (счётчик rejected считает все)
+MAX_REPORTED_ERRORS = 1000
+
+
+class IngestReport:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line, error):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def to_dict(self):
+        # Ошибки разбора и ошибки пачки приходят вперемешку — упорядочим по строкам
+        errors = sorted(self.errors, key=lambda e: e["line"])
+        return {"accepted": self.accepted, "rejected": self.rejected, "errors": errors}
+
+
+def _not_utf8(line, error):
+    raise ValueError(f"строка {line}: {error}")
+
+
+def _lines(stream, reject):
+    """Строки потока, декодированные по одной: неверная строка не обрывает чтение."""
+    for line_no, raw in enumerate(stream, 1):
+        if line_no == 1:
+            raw = raw.removeprefix(codecs.BOM_UTF8)
+        try:
+            yield raw.decode("utf-8")
+        except UnicodeDecodeError:
+            reject(line_no, "строка не в кодировке UTF-8")
+            yield ""  # номера следующих строк не сдвигаются
+
+
+def iter_records(stream, fmt, reject=None):
+    """Выдаёт (номер строки, dict) по мере чтения; битая строка NDJSON — (номер, None).
+
+    Строка не в UTF-8 не выдаётся, а передаётся в reject(номер, текст);
+    без reject — ValueError.
+    """
+    if not isinstance(stream, io.BufferedIOBase):
+        stream = io.BufferedReader(stream)
+    text = _lines(stream, reject or _not_utf8)
+
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_no, record if isinstance(record, dict) else None
+
+
+def _text(record, key):
+    value = record.get(key)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def parse_record(record):
+    """Проверяет запись и приводит типы; ValueError с понятным текстом при ошибке."""
+    if record is None:
+        raise ValueError("строка не является JSON-объектом")
+
+    op_type = _text(record, "type")
+    if op_type not in OPERATION_TYPES:
+        raise ValueError(f"неизвестный тип операции: {op_type}")
+
+    try:
+        quantity = int(record.get("quantity"))
+    except (TypeError, ValueError):
+        raise ValueError("количество должно быть целым числом") from None
+    if quantity <= 0:
+        raise ValueError("количество должно быть положительным")
+
+    raw_date = _text(record, "date")
+    try:
+        date = datetime.fromisoformat(raw_date) if raw_date else datetime.utcnow()
+    except ValueError:
+        raise ValueError(f"неверная дата: {raw_date}") from None
+
+    product_id = _text(record, "product_id")
+    sku = _text(record, "sku")
+    if product_id is None and sku is None:
+        raise ValueError("нужен product_id или sku")
+    try:
+        product_id = int(product_id) if product_id is not None else None
+    except ValueError:
+        raise ValueError(f"неверный product_id: {product_id}") from None
+
+    from_wh, to_wh = _text(record, "from_wh"), _text(record, "to_wh")
+    # Заодно проверяем склады перемещения (InvalidTransfer — это ValueError)
+    movements(op_type, quantity, from_wh, to_wh)
+
+    return {
+        "product_id": product_id,
+        "sku": sku,
+        "type": op_type,
+        "quantity": quantity,
+        "date": date,
+        "from_wh": from_wh,
+        "to_wh": to_wh,
+        "responsible": _text(record, "responsible"),
+        "note": _text(record, "note"),
+    }
+
+
+def _resolve_products(batch):
+    ids = {r["product_id"] for _, r in batch if r["product_id"] is not None}
+    skus = {r["sku"] for _, r in batch if r["product_id"] is None}
+    rows = db.session.execute(
+        select(Product.id, Product.sku).where(or_(Product.id.in_(ids), Product.sku.in_(skus)))
+    ).all()
+    return {r.id for r in rows}, {r.sku: r.id for r in rows}
+
+
+class _StockChanged(Exception):
+    """Остатки пачки изменились после чтения — пачку нужно провести заново."""
+
+
+def _apply_batch(batch, report, policy):
+    """Проводит пачку в текущей транзакции; отказы по строкам — в report.
+
+    Отказы копятся отдельно и попадают в report, только если пачка
+    проведена: при _StockChanged её проводят заново с начала транзакции.
+    """
+    rejected = []
+    known_ids, sku_to_id = _resolve_products(batch)
+
+    rows = []
+    for line, record in batch:
+        pid = record["product_id"] if record["product_id"] is not None else sku_to_id.get(record["sku"])
+        if pid is None or pid not in known_ids:
+            rejected.append((line, f"товар не найден: {record['product_id'] or record['sku']}"))
+            continue
+        rows.append((line, dict(record, product_id=pid)))
+
+    pids = {r["product_id"] for _, r in rows}
+    # FOR UPDATE блокирует строки остатков на серверных СУБД; в SQLite игнорируется
+    stocks = {(r.product_id, r.warehouse): r for r in db.session.execute(
+        select(Stock.id, Stock.product_id, Stock.warehouse, Stock.quantity, Stock.min_stock)
+        .where(Stock.product_id.in_(pids))
+        .with_for_update()
+    )}
+
+    deltas = {}
+    accepted, legs = [], []
+    for line, record in rows:
+        pid = record["product_id"]
+        moves = [((pid, wh), d) for wh, d in
+                 movements(record["type"], record["quantity"], record["from_wh"], record["to_wh"])]
+        if policy == "reject":
+            short = [key for key, d in moves if d < 0 and
+                     (stocks[key].quantity if key in stocks else 0) + deltas.get(key, 0) + d < 0]
+            if short:
+                rejected.append((line, f"недостаточно остатка товара {pid} на складе {short[0][1]}"))
+                continue
+        for key, d in moves:
+            deltas[key] = deltas.get(key, 0) + d
+            legs.append({"product_id": pid, "warehouse": key[1],
+                         "day": record["date"].date(), "delta": d})
+        record.pop("sku")
+        accepted.append(record)
+
+    if accepted:
+        # Сначала остатки: если их успели изменить, пачка ещё ничего не записала
+        low_stock = _apply_stock_deltas(stocks, deltas, policy)
+        db.session.execute(insert(Operation), accepted)
+        rollup.record_movements(legs)
+        counters.record(low_stock=low_stock)
+
+    for line, error in rejected:
+        report.reject(line, error)
+    report.accepted += len(accepted)
+
+
+def _apply_stock_deltas(stocks, deltas, policy):
+    """Прибавляет deltas к остаткам; возвращает изменение числа критических.
+
+    Как и в ledger.apply_stock_delta, при политике reject уход в минус
+    отсекается условием самого UPDATE, а недостающие строки создаются
+    INSERT .. ON CONFLICT DO NOTHING. Если UPDATE задел не все строки или
+    строку успел создать кто-то другой, бросает _StockChanged.
+    """
+    low_stock = 0
+    existing = {stocks[key].id: d for key, d in deltas.items() if key in stocks}
+    if existing:
+        delta = case(existing, value=Stock.id, else_=0)
+        stmt = (update(Stock)
+                .where(Stock.id.in_(existing))
+                .values(quantity=Stock.quantity + delta)
+                .execution_options(synchronize_session=False))
+        if policy == "reject":
+            stmt = stmt.where(or_(delta >= 0, Stock.quantity + delta >= 0))
+        if db.session.get_bind().dialect.update_returning:
+            updated = db.session.execute(stmt.returning(Stock.id, Stock.quantity, Stock.min_stock)).all()
+            count = len(updated)
+            low_stock += sum(counters.low_stock_delta(r.quantity - existing[r.id], r.quantity, r.min_stock)
+                             for r in updated)
+        else:
+            count = db.session.execute(stmt).rowcount
+            low_stock += sum(counters.low_stock_delta(stocks[key].quantity, stocks[key].quantity + d,
+                                                      stocks[key].min_stock)
+                             for key, d in deltas.items() if key in stocks)
+        if count != len(existing):
+            raise _StockChanged()
+
+    missing = [key for key in deltas if key not in stocks]
+    if missing:
+        stmt = dialect_insert(Stock.__table__)
+        if hasattr(stmt, "on_conflict_do_nothing"):
+            stmt = stmt.on_conflict_do_nothing(index_elements=["product_id", "warehouse"])
+        inserted = db.session.execute(stmt, [
+            {"product_id": pid, "warehouse": wh, "quantity": deltas[(pid, wh)], "min_stock": 0}
+            for pid, wh in missing
+        ]).rowcount
+        if inserted != len(missing):
+            # Строку успела создать параллельная загрузка или проводка
+            raise _StockChanged()
+        low_stock += sum(counters.low_stock_delta(None, deltas[key], 0) for key in missing)
+    return low_stock
+
+
+def ingest_operations(stream, fmt, batch_size=None):
+    """Загружает операции из потока; каждая пачка — отдельная транзакция."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Формат должен быть одним из {FORMATS}")
+    batch_size = batch_size or current_app.config.get("BULK_BATCH_SIZE", 1000)
+    policy = negative_stock_policy()
+    report = IngestReport()
+
+    def flush(batch):
+        while True:
+            try:
+                _apply_batch(batch, report, policy)
+                db.session.commit()
+                return
+            except _StockChanged:
+                # Остатки поменялись после чтения — перечитываем и проводим снова
+                db.session.rollback()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    batch = []
+    for line, record in iter_records(stream, fmt, report.reject):
+        try:
+            batch.append((line, parse_record(record)))
+        except ValueError as e:
+            report.reject(line, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    return report
@@ -0,0 +1,280 @@
+"""Инструментирование запросов: SQL, Redis, задержки по эндпоинтам.
+
+- Слушатели SQLAlchemy считают и замеряют SQL-запросы каждого HTTP-запроса;
+  медленные (дольше SLOW_QUERY_MS) пишутся в лог с отпечатком запроса.
+- Кэш сообщает время обращений к Redis (см. cache.Cache.add_observer).
+- Итоги запроса уходят в заголовки X-Query-Count и Server-Timing и в
+  гистограммы, которые отдаёт /metrics в формате Prometheus.
+- При PROFILER_ENABLED запрос с ?_profile=1 проходит под сэмплирующим
+  профилировщиком и вместо страницы возвращает свёрнутые стеки.
+
+Метрики живут в памяти процесса: при нескольких воркерах у каждого свои.
+"""
+import hashlib
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from cache import cache
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(c), n, s)) for k, (c, n, s) in self._series.items())
+        for label_values, (counts, total, value_sum) in items:
+            pairs = list(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(pairs + [('le', '+Inf')])} {total}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {value_sum}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {total}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class LabeledCounter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_labels(zip(self.labels, label_values))} {value}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _labels(pairs):
+    parts = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+request_latency = Histogram("http_request_duration_seconds", "Время обработки запроса",
+                            LATENCY_BUCKETS, ("endpoint", "method", "status"))
+request_queries = Histogram("http_request_sql_queries", "SQL-запросов на HTTP-запрос",
+                            QUERY_COUNT_BUCKETS, ("endpoint",))
+query_latency = Histogram("db_query_duration_seconds", "Время выполнения SQL-запроса",
+                          LATENCY_BUCKETS)
+redis_latency = Histogram("redis_call_duration_seconds", "Время обращения к Redis",
+                          LATENCY_BUCKETS)
+slow_queries = LabeledCounter("db_slow_queries_total", "Медленные SQL-запросы по отпечаткам",
+                              ("fingerprint",))
+
+METRICS = (request_latency, request_queries, query_latency, redis_latency, slow_queries)
+
+
+# ---------------- SQL ----------------
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """Нормализованный текст запроса и его короткий хэш: литералы -> ?,
+    списки IN (?, ?, ...) сворачиваются, пробелы схлопываются."""
+    normalized = _LITERALS.sub("?", statement)
+    normalized = _IN_LISTS.sub("(?)", normalized)
+    normalized = _SPACES.sub(" ", normalized).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12], normalized
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    query_latency.observe(elapsed)
+
+    in_request = has_request_context()
+    if in_request:
+        g.query_time = g.get("query_time", 0.0) + elapsed
+
+    threshold = current_app.config.get("SLOW_QUERY_MS") if in_request else None
+    if threshold and elapsed * 1000 >= threshold:
+        digest, normalized = fingerprint(statement)
+        slow_queries.inc(digest)
+        log.warning("Медленный SQL %.1f мс [%s] %s %s: %s", elapsed * 1000, digest,
+                    request.method, request.path, normalized[:500])
+
+
+def _handle_error(context):
+    # after_cursor_execute при ошибке запроса не вызывается — снимаем отметку сами
+    if context.connection is not None:
+        started = context.connection.info.get("query_start")
+        if started:
+            started.pop()
+
+
+# ---------------- Redis ----------------
+def _observe_redis(elapsed):
+    redis_latency.observe(elapsed)
+    if has_request_context():
+        g.redis_calls = g.get("redis_calls", 0) + 1
+        g.redis_time = g.get("redis_time", 0.0) + elapsed
+
+
+# ---------------- Профилировщик ----------------
+class SamplingProfiler:
+    """Раз в `interval` секунд снимает стек потока `thread_id` и считает,
+    сколько раз встретился каждый стек."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Формат collapsed stacks (flamegraph.pl, speedscope)."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# ---------------- Хуки запроса ----------------
+def _start_request():
+    # g живёт в app context, который тестовый клиент может переиспользовать
+    g.query_count = 0
+    g.query_time = 0.0
+    g.redis_calls = 0
+    g.redis_time = 0.0
+    g.request_started = time.perf_counter()
+    g.profiler = None
+    if current_app.config.get("PROFILER_ENABLED") and request.args.get("_profile") == "1":
+        g.profiler = SamplingProfiler(threading.get_ident(),
+                                      current_app.config.get("PROFILER_INTERVAL", 0.005)).start()
+
+
+def _finish_request(response):
+    elapsed = time.perf_counter() - g.get("request_started", time.perf_counter())
+    count = g.get("query_count", 0)
+    endpoint = request.endpoint or "unmatched"
+
+    request_latency.observe(elapsed, endpoint, request.method, str(response.status_code))
+    request_queries.observe(count, endpoint)
+
+    response.headers["X-Query-Count"] = str(count)
+    response.headers["Server-Timing"] = ", ".join((
+        f"db;dur={g.get('query_time', 0.0) * 1000:.2f}",
+        f"redis;dur={g.get('redis_time', 0.0) * 1000:.2f}",
+        f"app;dur={elapsed * 1000:.2f}",
+    ))
+
+    limit = current_app.config.get("QUERY_COUNT_LIMIT")
+    if limit and count > limit:
+        log.warning("%s %s: %d SQL-запросов при лимите %d",
+                    request.method, request.path, count, limit)
+
+    profiler = g.get("profiler")
+    if profiler is not None:
+        profiler.stop()
+        g.profiler = None
+        response = current_app.response_class(profiler.collapsed(), mimetype="text/plain")
+    return response
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    stats = cache.get_stats()
+    for name in ("local_hits", "redis_hits", "misses", "errors", "skipped"):
+        lines.append(f"# TYPE cache_{name}_total counter")
+        lines.append(f"cache_{name}_total {stats[name]}")
+    lines.append("# TYPE cache_breaker_open gauge")
+    lines.append(f"cache_breaker_open {int(stats['breaker'] != 'closed')}")
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    for metric in METRICS:
+        metric.reset()
+
+
+def init_app(app):
+    # Слушаем класс Engine, а не конкретный движок: так учитываются все bind'ы
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+    cache.add_observer(_observe_redis)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
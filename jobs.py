@@ -0,0 +1,507 @@
+"""Фоновые задачи: импорт каталога, выгрузки, сверки и пересчёты вне потока запроса.
+
+Задача — строка таблицы jobs: имя из TASKS, аргументы (JSON), состояние
+(queued → running → done | failed), прогресс и результат. Веб-процесс только
+ставит задачу (enqueue) и сразу отвечает; выполняют её воркеры — процессы
+worker.py или, без них, потоки самого приложения (JOBS_LOCAL_WORKERS).
+
+С Redis id новой задачи кладётся в список QUEUE_KEY, и свободный воркер
+просыпается на BRPOP сразу. Список — только сигнал: задачу воркер забирает
+из таблицы условным UPDATE, поэтому двое её не возьмут, а без Redis (или
+если сигнал потерялся) воркеры находят задачи опросом раз в
+JOBS_POLL_INTERVAL секунд.
+
+Упавшая задача ставится обратно с паузой JOBS_RETRY_DELAY * 2^(попытка-1),
+пока не кончатся JOBS_MAX_ATTEMPTS попыток; ValueError (неверные данные)
+не повторяется. Задача числится за воркером JOBS_LEASE_SECONDS секунд:
+пока она выполняется, поток-пульс воркера раз в треть этого срока продлевает
+аренду (и progress() тоже), а если воркер пропал, задачу заберёт другой.
+
+Файлы задачи в JOBS_DIR удаляются, когда она окончательно не удалась;
+завершённые задачи вместе с результатами живут JOBS_RESULT_TTL секунд
+(purge(), воркер зовёт его в простое не чаще раза в PURGE_INTERVAL).
+В простое же воркер сверяет счётчики главной страницы с базой
+(counters.maybe_reconcile, не чаще раза в COUNTERS_RECONCILE_INTERVAL).
+"""
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+import redis
+from flask import current_app
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Job
+from cache import cache, CacheUnavailable
+import archive
+import catalog
+import counters
+import export
+import reconcile
+import reorder
+import rollup
+
+log = logging.getLogger(__name__)
+
+QUEUE_KEY = "jobs:queue"
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# Как часто (сек) простаивающий воркер чистит старые задачи и файлы
+PURGE_INTERVAL = 3600
+
+# Имя -> функция задачи: принимает аргументы задачи, возвращает JSON-результат
+TASKS: dict[str, Callable[..., Any]] = {}
+
+_state = threading.local()
+_wakeup = threading.Event()
+_local_workers: list[threading.Thread] = []
+_local_lock = threading.Lock()
+_purged_at = None
+
+
+def task(name, http=True, types=None):
+    """Регистрирует задачу; http=False — её ставит только код (POST /jobs/<name> недоступен).
+
+    types — {аргумент: тип или кортеж типов}, проверяется при постановке.
+    """
+    def decorator(fn):
+        fn.http = http
+        fn.types = types or {}
+        TASKS[name] = fn
+        return fn
+    return decorator
+
+
+def _check_args(fn, args):
+    inspect.signature(fn).bind(**args)
+    for arg, expected in getattr(fn, "types", {}).items():
+        value = args.get(arg)
+        if value is None:
+            continue
+        # bool — подкласс int: флаг 1 и число True не пропускаем
+        if (isinstance(value, bool) != (expected is bool)) or not isinstance(value, expected):
+            raise TypeError(f"{arg}: ожидается {getattr(expected, '__name__', expected)}, "
+                            f"получено {value!r}")
+
+
+def jobs_dir():
+    path = current_app.config["JOBS_DIR"]
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def save_upload(stream, suffix):
+    """Сохраняет тело запроса в JOBS_DIR; возвращает имя файла для аргументов задачи."""
+    name = f"upload-{uuid.uuid4().hex}.{suffix}"
+    with open(os.path.join(jobs_dir(), name), "wb") as f:
+        while chunk := stream.read(1024 * 1024):
+            f.write(chunk)
+    return name
+
+
+def _output(ext):
+    """Имя и путь файла-результата текущей задачи."""
+    name = f"job-{_state.job_id}.{ext}"
+    return name, os.path.join(jobs_dir(), name)
+
+
+def _discard_files(job_id, args):
+    """Удаляет файл-результат (в том числе недописанный) и загрузку задачи."""
+    path = jobs_dir()
+    names = [n for n in os.listdir(path) if n.startswith(f"job-{job_id}.")]
+    if args.get("upload"):
+        names.append(os.path.basename(args["upload"]))
+    for name in names:
+        try:
+            os.remove(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+
+
+def result_file(job):
+    """Имя файла-результата выполненной задачи в JOBS_DIR или None."""
+    if job.status != DONE or not job.result:
+        return None
+    result = json.loads(job.result)
+    return result.get("file") if isinstance(result, dict) else None
+
+
+def to_dict(job):
+    def stamp(value):
+        return value.isoformat() if value else None
+
+    return {
+        "id": job.id,
+        "name": job.name,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "progress": {"done": job.progress, "total": job.total, "message": job.message},
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": stamp(job.created_at),
+        "started_at": stamp(job.started_at),
+        "finished_at": stamp(job.finished_at),
+        "run_at": stamp(job.run_at) if job.status == QUEUED else None,
+    }
+
+
+# ---------------- Постановка ----------------
+def enqueue(name, **args):
+    """Ставит задачу в очередь и возвращает Job.
+
+    Неизвестное имя — ValueError, лишние, недостающие аргументы или аргументы
+    не того типа — TypeError.
+    """
+    fn = TASKS.get(name)
+    if fn is None:
+        raise ValueError(f"Неизвестная задача: {name}")
+    _check_args(fn, args)
+
+    job = Job(name=name, args=json.dumps(args, ensure_ascii=False), status=QUEUED,
+              max_attempts=current_app.config.get("JOBS_MAX_ATTEMPTS", 3),
+              run_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+
+    if cache.backend == "redis":
+        try:
+            cache.call("lpush", QUEUE_KEY, job.id)
+        except CacheUnavailable:
+            pass  # воркеры найдут задачу опросом
+    _wakeup.set()
+    _ensure_local_workers(current_app._get_current_object())
+    log.info("Задача %s #%d поставлена в очередь", name, job.id)
+    return job
+
+
+def progress(done, total=None, message=None):
+    """Прогресс текущей задачи; заодно продлевает её за воркером.
+
+    Пишет отдельным commit — вызывать между транзакциями самой задачи.
+    """
+    job_id = getattr(_state, "job_id", None)
+    if job_id is None:
+        return
+    lease = current_app.config.get("JOBS_LEASE_SECONDS", 600)
+    db.session.execute(
+        update(Job).where(Job.id == job_id)
+        .values(progress=done, total=total, message=message and message[:200],
+                locked_until=datetime.utcnow() + timedelta(seconds=lease))
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+
+
+# ---------------- Выполнение ----------------
+def _due(now):
+    # Готовая к запуску задача или задача пропавшего воркера
+    return or_(and_(Job.status == QUEUED, Job.run_at <= now),
+               and_(Job.status == RUNNING, Job.locked_until < now))
+
+
+def claim():
+    """Забирает следующую задачу за этим воркером; None, если брать нечего."""
+    now = datetime.utcnow()
+    job_id = db.session.execute(
+        select(Job.id).where(_due(now)).order_by(Job.run_at, Job.id).limit(1)).scalar()
+    if job_id is None:
+        db.session.rollback()
+        return None
+    lease = current_app.config.get("JOBS_LEASE_SECONDS", 600)
+    # Условие повторяется в UPDATE: из двух воркеров задачу получит один
+    taken = db.session.execute(
+        update(Job).where(Job.id == job_id, _due(now))
+        .values(status=RUNNING, attempts=Job.attempts + 1, started_at=now,
+                locked_until=now + timedelta(seconds=lease))
+        .execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    return db.session.get(Job, job_id) if taken else None
+
+
+def _finish(job_id, attempt, **values):
+    # attempt в условии: воркер, у которого задачу уже забрали, её не перезапишет
+    updated = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.attempts == attempt)
+        .values(locked_until=None, **values)
+        .execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    return updated
+
+
+def retry_delay(attempt):
+    config = current_app.config
+    delay = config.get("JOBS_RETRY_DELAY", 10) * 2 ** (attempt - 1)
+    return min(delay, config.get("JOBS_RETRY_MAX_DELAY", 600))
+
+
+def _heartbeat(app, job_id, attempt, stop):
+    """Продлевает аренду задачи, пока она выполняется: задача не обязана звать progress()."""
+    lease = app.config.get("JOBS_LEASE_SECONDS", 600)
+    t = Job.__table__
+    with app.app_context():
+        while not stop.wait(lease / 3):
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(update(t).where(t.c.id == job_id, t.c.attempts == attempt)
+                                 .values(locked_until=datetime.utcnow() + timedelta(seconds=lease)))
+            except SQLAlchemyError as e:
+                # Следующий пульс попробует снова; аренда рассчитана на три пропуска
+                log.warning("Не удалось продлить задачу #%d: %s", job_id, e)
+
+
+def execute(job):
+    """Выполняет взятую задачу и записывает итог: done, повтор или failed."""
+    job_id, name, attempt, max_attempts = job.id, job.name, job.attempts, job.max_attempts
+    args = json.loads(job.args or "{}")
+    fn = TASKS.get(name)
+
+    if attempt > max_attempts:
+        if _finish(job_id, attempt, status=FAILED, finished_at=datetime.utcnow(),
+                   error="Воркер не завершил задачу"):
+            _discard_files(job_id, args)
+        return
+
+    _state.job_id = job_id
+    stop = threading.Event()
+    pulse = threading.Thread(target=_heartbeat, name=f"job-{job_id}-heartbeat", daemon=True,
+                             args=(current_app._get_current_object(), job_id, attempt, stop))
+    pulse.start()
+    try:
+        if fn is None:
+            raise ValueError(f"Неизвестная задача: {name}")
+        result = fn(**args)
+    except Exception as e:
+        db.session.rollback()
+        error = f"{type(e).__name__}: {e}"
+        if isinstance(e, ValueError) or attempt >= max_attempts:
+            log.exception("Задача %s #%d не выполнена", name, job_id)
+            # Повтора не будет: загрузка и недописанный результат больше не нужны
+            if _finish(job_id, attempt, status=FAILED, finished_at=datetime.utcnow(), error=error):
+                _discard_files(job_id, args)
+        else:
+            delay = retry_delay(attempt)
+            log.warning("Задача %s #%d: %s, повтор через %s с", name, job_id, error, delay)
+            _finish(job_id, attempt, status=QUEUED, error=error,
+                    run_at=datetime.utcnow() + timedelta(seconds=delay))
+        return
+    finally:
+        stop.set()
+        pulse.join()
+        _state.job_id = None
+
+    _finish(job_id, attempt, status=DONE, finished_at=datetime.utcnow(), error=None,
+            result=json.dumps(result, ensure_ascii=False, default=str))
+    log.info("Задача %s #%d выполнена", name, job_id)
+
+
+def run_next():
+    """Берёт и выполняет одну задачу; возвращает её id или None."""
+    job = claim()
+    if job is None:
+        return None
+    job_id = job.id
+    execute(job)
+    return job_id
+
+
+def purge(ttl=None):
+    """Удаляет задачи done/failed, завершённые больше ttl (JOBS_RESULT_TTL) секунд
+    назад, и файлы JOBS_DIR, не нужные оставшимся задачам; возвращает число задач.
+
+    Файл без задачи удаляется, только если он тоже старше ttl: загрузку могли
+    сохранить, но ещё не поставить в очередь, а результат — начать писать
+    задачей, поставленной уже после выборки.
+    """
+    ttl = current_app.config.get("JOBS_RESULT_TTL") if ttl is None else ttl
+    if not ttl:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    removed = db.session.execute(
+        delete(Job).where(Job.status.in_([DONE, FAILED]), Job.finished_at < cutoff)
+        .execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+
+    keep = set()
+    for job_id, status, args in db.session.execute(select(Job.id, Job.status, Job.args)):
+        keep.add(f"job-{job_id}")
+        upload = json.loads(args or "{}").get("upload")
+        if upload and status in (QUEUED, RUNNING):
+            keep.add(os.path.basename(upload))
+    db.session.rollback()
+
+    path = jobs_dir()
+    stale = time.time() - ttl
+    for entry in os.scandir(path):
+        if entry.name in keep or entry.name.split(".", 1)[0] in keep:
+            continue
+        if entry.stat().st_mtime < stale:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    if removed:
+        log.info("Удалено старых задач: %d", removed)
+    return removed
+
+
+def maybe_purge():
+    """purge() не чаще раза в PURGE_INTERVAL секунд на процесс."""
+    global _purged_at
+    if _purged_at is not None and time.monotonic() - _purged_at < PURGE_INTERVAL:
+        return
+    _purged_at = time.monotonic()
+    purge()
+
+
+def _maintain():
+    """Обслуживание в простое воркера: очистка старых задач и сверка счётчиков."""
+    for fn, what in ((maybe_purge, "очистки старых задач"),
+                     (counters.maybe_reconcile, "сверки счётчиков главной")):
+        try:
+            fn()
+        except Exception:
+            log.exception("Ошибка %s", what)
+        finally:
+            # Не держим транзакцию чтения до следующей задачи
+            db.session.rollback()
+
+
+def _waiter():
+    """Функция ожидания новой задачи: BRPOP по списку Redis или событие процесса."""
+    config = current_app.config
+    timeout = config.get("JOBS_POLL_INTERVAL", 2)
+    if cache.backend != "redis":
+        def wait():
+            _wakeup.wait(timeout)
+            _wakeup.clear()
+        return wait
+
+    # Своё соединение: у пула кэша таймауты слишком короткие для блокирующего BRPOP
+    client = redis.Redis.from_url(config["CACHE_REDIS_URL"], decode_responses=True,
+                                  socket_timeout=timeout + 5,
+                                  socket_connect_timeout=config.get("CACHE_CONNECT_TIMEOUT", 0.25))
+
+    def wait():
+        try:
+            client.brpop(QUEUE_KEY, timeout=timeout)
+        except redis.RedisError as e:
+            log.warning("Очередь задач в Redis недоступна: %s", e)
+            _wakeup.wait(timeout)
+    return wait
+
+
+def work(stop=None, max_jobs=None):
+    """Цикл воркера в контексте приложения: до stop.set() или max_jobs задач."""
+    stop = stop or threading.Event()
+    wait = _waiter()
+    done = 0
+    while not stop.is_set() and (max_jobs is None or done < max_jobs):
+        try:
+            job_id = run_next()
+        except Exception:
+            # База недоступна и т. п. — не роняем воркер, попробуем позже
+            db.session.rollback()
+            log.exception("Ошибка очереди задач")
+            job_id = None
+        if job_id is None:
+            _maintain()
+            wait()
+        else:
+            done += 1
+    db.session.remove()
+    return done
+
+
+def _ensure_local_workers(app):
+    count = app.config.get("JOBS_LOCAL_WORKERS", 0)
+    with _local_lock:
+        _local_workers[:] = [t for t in _local_workers if t.is_alive()]
+        while len(_local_workers) < count:
+            thread = threading.Thread(target=_run_local, args=(app,), daemon=True,
+                                      name=f"jobs-{len(_local_workers) + 1}")
+            thread.start()
+            _local_workers.append(thread)
+
+
+def _run_local(app):
+    with app.app_context():
+        work()
+
+
+# ---------------- Задачи ----------------
+def _day(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+@task("catalog-import", http=False, types={"upload": str, "format": str, "batch_size": int})
+def import_catalog(upload, format="csv", batch_size=None):
+    path = os.path.join(jobs_dir(), os.path.basename(upload))
+    with open(path, "rb") as f:
+        report = catalog.import_catalog(f, format, batch_size, progress=lambda r: progress(
+            r.accepted, message=f"новых {r.created}, обновлено {r.updated}"))
+    os.remove(path)
+    return report.to_dict()
+
+
+@task("export", http=False, types={"kind": str, "format": str, "gzip": bool,
+                                   "date_from": str, "date_to": str, "product_id": int})
+def export_file(kind, format="csv", gzip=False, date_from=None, date_to=None, product_id=None):
+    if kind == "operations":
+        stmt = export.operations_query(_day(date_from), _day(date_to), product_id)
+    elif kind == "stock":
+        stmt = export.stock_query()
+    else:
+        raise ValueError(f"Неизвестная выгрузка: {kind}")
+    if format not in export.FORMATS:
+        raise ValueError(f"Неизвестный формат: {format}")
+
+    name, path = _output(format + (".gz" if gzip else ""))
+    chunks = export.iter_rows(stmt, format, current_app.config.get("EXPORT_BATCH_SIZE", 1000))
+    with open(path, "wb") as f:
+        for data in export.encode(chunks, gzip):
+            f.write(data)
+    return {"file": name, "size": os.path.getsize(path)}
+
+
+@task("reconcile", types={"write": bool, "chunk_size": int})
+def reconcile_stock(write=False, chunk_size=None):
+    name, path = _output("csv")
+    summary = reconcile.run(write=write, out=path, chunk_size=chunk_size, progress=lambda s: progress(
+        s["chunks"], message=f"расхождений {s['drift']}"))
+    return {**summary, "file": name}
+
+
+@task("reorder", types={"write": bool, "lookback_days": int,
+                        "lead_time_days": (int, float), "service_level": float})
+def reorder_points(write=False, lookback_days=None, lead_time_days=None, service_level=None):
+    name, path = _output("csv")
+    summary = reorder.run(write=write, out=path, progress=lambda s: progress(s["rows"]),
+                          lookback_days=lookback_days, lead_time_days=lead_time_days,
+                          service_level=service_level)
+    return {**summary, "file": name}
+
+
+@task("archive", types={"days": int})
+def archive_operations(days=None):
+    older_than = datetime.utcnow() - timedelta(days=days) if days else None
+    return {"moved": archive.archive_operations(older_than)}
+
+
+@task("counters-reconcile")
+def reconcile_counters():
+    return {"drift": counters.reconcile()}
+
+
+@task("rollup-rebuild")
+def rebuild_rollup():
+    rollup.rebuild()
+    db.session.commit()
+    return {}
@@ -0,0 +1,196 @@
+"""Проводка складских операций.
+
+Остаток хранится по паре (товар, склад) и меняется одним атомарным UPDATE
+stocks SET quantity = quantity + :delta, поэтому параллельные проводки по
+одному товару не затирают друг друга, а запись в журнал operations делается
+в той же транзакции. Перемещение (transfer) списывает со склада-источника и
+приходует на склад назначения в одной транзакции.
+"""
+import logging
+
+from flask import current_app
+from sqlalchemy import case, func, literal, select, union_all, update
+
+from models import db, dialect_insert, Stock, Operation, DEFAULT_WAREHOUSE
+import counters
+import events
+import rollup
+
+log = logging.getLogger(__name__)
+
+# Знак изменения остатка для каждого типа операции
+DELTA_SIGN = {"in": 1, "out": -1, "adjust": -1}
+
+# Перемещение между складами: остаток товара в целом не меняется
+TRANSFER = "transfer"
+OPERATION_TYPES = (*DELTA_SIGN, TRANSFER)
+
+# Что делать, если операция уводит остаток в минус: allow | flag | reject
+NEGATIVE_STOCK_POLICIES = ("allow", "flag", "reject")
+
+
+class LedgerError(ValueError):
+    pass
+
+
+class UnknownOperationType(LedgerError):
+    def __init__(self, op_type):
+        super().__init__(f"Неизвестный тип операции: {op_type}")
+        self.op_type = op_type
+
+
+class InvalidTransfer(LedgerError):
+    def __init__(self):
+        super().__init__("Для перемещения укажите склад назначения, отличный от склада-источника")
+
+
+class InsufficientStock(LedgerError):
+    def __init__(self, product_id, available, requested, warehouse=DEFAULT_WAREHOUSE):
+        super().__init__(f"Недостаточно остатка товара {product_id} на складе {warehouse}: "
+                         f"доступно {available}, требуется {requested}")
+        self.product_id = product_id
+        self.available = available
+        self.requested = requested
+        self.warehouse = warehouse
+
+
+def stock_delta(op_type, quantity):
+    try:
+        return DELTA_SIGN[op_type] * quantity
+    except KeyError:
+        raise UnknownOperationType(op_type) from None
+
+
+def movements(op_type, quantity, from_wh=None, to_wh=None):
+    """Изменения остатков по складам: список (склад, delta).
+
+    У перемещения две ноги, списание идёт первым.
+    """
+    if op_type == TRANSFER:
+        source = from_wh or DEFAULT_WAREHOUSE
+        if not to_wh or to_wh == source:
+            raise InvalidTransfer()
+        return [(source, -quantity), (to_wh, quantity)]
+    delta = stock_delta(op_type, quantity)
+    if delta > 0:
+        return [(to_wh or DEFAULT_WAREHOUSE, delta)]
+    return [(from_wh or DEFAULT_WAREHOUSE, delta)]
+
+
+def movements_select(source=Operation, *criteria):
+    """То же, что movements(), но для SQL: product_id, warehouse, date, delta
+    по каждой операции журнала `source`, отобранной условиями `criteria`."""
+    to_wh = func.coalesce(func.nullif(source.to_wh, ""), DEFAULT_WAREHOUSE)
+    from_wh = func.coalesce(func.nullif(source.from_wh, ""), DEFAULT_WAREHOUSE)
+    incoming = [t for t, sign in DELTA_SIGN.items() if sign > 0]
+    simple = (select(
+                  source.product_id,
+                  case((source.type.in_(incoming), to_wh), else_=from_wh).label("warehouse"),
+                  source.date,
+                  case(*[(source.type == t, source.quantity * sign) for t, sign in DELTA_SIGN.items()])
+                  .label("delta"))
+              .where(source.type.in_(list(DELTA_SIGN)), *criteria))
+    legs = [select(source.product_id, wh.label("warehouse"), source.date,
+                   (source.quantity * literal(sign)).label("delta"))
+            .where(source.type == TRANSFER, *criteria)
+            for wh, sign in ((from_wh, -1), (to_wh, 1))]
+    return union_all(simple, *legs)
+
+
+def negative_stock_policy():
+    policy = current_app.config.get("NEGATIVE_STOCK_POLICY", "allow")
+    if policy not in NEGATIVE_STOCK_POLICIES:
+        raise ValueError(f"NEGATIVE_STOCK_POLICY должен быть одним из {NEGATIVE_STOCK_POLICIES}")
+    return policy
+
+
+def apply_stock_delta(product_id, delta, policy="allow", warehouse=DEFAULT_WAREHOUSE):
+    """Меняет остаток товара на складе на delta в текущей транзакции.
+
+    Возвращает (новый остаток, min_stock). При политике reject уход в минус
+    отсекается условием в том же UPDATE и приводит к InsufficientStock.
+    Изменение числа критических остатков передаётся в counters, новый
+    остаток — в events (после commit уходит открытым страницам).
+    """
+    key = (Stock.product_id == product_id, Stock.warehouse == warehouse)
+    stmt = (update(Stock)
+            .where(*key)
+            .values(quantity=Stock.quantity + delta)
+            .execution_options(synchronize_session=False))
+    if policy == "reject" and delta < 0:
+        stmt = stmt.where(Stock.quantity + delta >= 0)
+
+    if db.session.get_bind().dialect.update_returning:
+        row = db.session.execute(stmt.returning(Stock.quantity, Stock.min_stock)).first()
+    else:
+        row = None
+        if db.session.execute(stmt).rowcount:
+            row = db.session.execute(select(Stock.quantity, Stock.min_stock).where(*key)).first()
+
+    if row is not None:
+        low = counters.low_stock_delta(row.quantity - delta, row.quantity, row.min_stock)
+        counters.record(low_stock=low)
+        events.record(product_id=product_id, warehouse=warehouse, quantity=row.quantity,
+                      min_stock=row.min_stock, low=low)
+        return row.quantity, row.min_stock
+
+    current = db.session.execute(select(Stock.quantity).where(*key)).scalar()
+    if current is not None or (policy == "reject" and delta < 0):
+        raise InsufficientStock(product_id, current or 0, -delta, warehouse)
+
+    # Строки остатка на этом складе ещё нет — создаём её
+    stmt = dialect_insert(Stock.__table__).values(
+        product_id=product_id, warehouse=warehouse, quantity=delta, min_stock=0)
+    if hasattr(stmt, "on_conflict_do_nothing"):
+        stmt = stmt.on_conflict_do_nothing(index_elements=["product_id", "warehouse"])
+    if not db.session.execute(stmt).rowcount:
+        # Строку успела создать параллельная проводка
+        return apply_stock_delta(product_id, delta, policy, warehouse)
+    low = counters.low_stock_delta(None, delta, 0)
+    counters.record(low_stock=low)
+    events.record(product_id=product_id, warehouse=warehouse, quantity=delta, min_stock=0, low=low)
+    return delta, 0
+
+
+def book_operation(product_id, op_type, quantity, date, from_wh=None, to_wh=None,
+                   responsible=None, note=None):
+    """Проводит операцию: журнал + остатки по складам в одной транзакции.
+
+    Возвращает (operation, остаток после проводки; у перемещения — на
+    складе-источнике). Любая ошибка откатывает транзакцию целиком.
+    """
+    policy = negative_stock_policy()
+    # Пустые поля формы приходят строками "" — храним как NULL
+    from_wh = from_wh or None
+    to_wh = to_wh or None
+    legs = movements(op_type, quantity, from_wh, to_wh)
+
+    try:
+        balances = [(wh, apply_stock_delta(product_id, d, policy, wh)[0]) for wh, d in legs]
+        rollup.record_movements([
+            {"product_id": product_id, "warehouse": wh, "day": date.date(), "delta": d}
+            for wh, d in legs
+        ])
+        op = Operation(
+            product_id=product_id,
+            type=op_type,
+            quantity=quantity,
+            date=date,
+            from_wh=from_wh,
+            to_wh=to_wh,
+            responsible=responsible,
+            note=note
+        )
+        db.session.add(op)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if policy == "flag":
+        for wh, balance in balances:
+            if balance < 0:
+                log.warning("Отрицательный остаток товара %s на складе %s: %s (операция %s)",
+                            product_id, wh, balance, op.id)
+
+    return op, balances[0][1]
@@ -43,6 +43,9 @@ def include_object(object, name, type_, reflected, compare_to):
     # Исключаем таблицу alembic_version из сравнения
     if type_ == "table" and name == "alembic_version":
         return False
+    # FTS5-индекс товаров и его теневые таблицы создаются вне моделей
+    if type_ == "table" and name.startswith("products_fts"):
+        return False
     return True
 
 
@@ -0,0 +1,28 @@
+"""operations product index
+
+Revision ID: 0a9d4c7e2b61
+Revises: f2d6a8c1e370
+Create Date: 2026-10-18 18:20:37.902155
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a9d4c7e2b61'
+down_revision: Union[str, Sequence[str], None] = 'f2d6a8c1e370'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_operations_product_date', 'operations', ['product_id', 'date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_operations_product_date', table_name='operations')
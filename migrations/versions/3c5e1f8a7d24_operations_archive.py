@@ -0,0 +1,53 @@
+"""operations archive
+
+Revision ID: 3c5e1f8a7d24
+Revises: 0a9d4c7e2b61
+Create Date: 2026-10-18 18:55:03.271946
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c5e1f8a7d24'
+down_revision: Union[str, Sequence[str], None] = '0a9d4c7e2b61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('operations_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=True),
+    sa.Column('type', sa.String(length=20), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=True),
+    sa.Column('from_wh', sa.String(length=100), nullable=True),
+    sa.Column('to_wh', sa.String(length=100), nullable=True),
+    sa.Column('responsible', sa.String(length=100), nullable=True),
+    sa.Column('note', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_operations_archive_date_id', 'operations_archive', ['date', 'id'], unique=False)
+    op.create_index('ix_operations_archive_product_date', 'operations_archive', ['product_id', 'date'],
+                    unique=False)
+    op.create_table('opening_balances',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('warehouse', sa.String(length=100), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('product_id', 'warehouse')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('opening_balances')
+    op.drop_index('ix_operations_archive_product_date', table_name='operations_archive')
+    op.drop_index('ix_operations_archive_date_id', table_name='operations_archive')
+    op.drop_table('operations_archive')
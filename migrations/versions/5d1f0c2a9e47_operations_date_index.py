@@ -0,0 +1,28 @@
+"""operations date index
+
+Revision ID: 5d1f0c2a9e47
+Revises: c87b6540ab75
+Create Date: 2026-10-18 10:12:04.318542
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1f0c2a9e47'
+down_revision: Union[str, Sequence[str], None] = 'c87b6540ab75'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_operations_date_id', 'operations', ['date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_operations_date_id', table_name='operations')
@@ -0,0 +1,42 @@
+"""products sku unique
+
+Revision ID: 6e1b9d3f4a82
+Revises: 3c5e1f8a7d24
+Create Date: 2026-10-18 21:05:43.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e1b9d3f4a82'
+down_revision: Union[str, Sequence[str], None] = '3c5e1f8a7d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Уникальный индекс не построится на дублях — перечисляем их, чтобы разобрать вручную
+    rows = op.get_bind().execute(sa.text(
+        "SELECT sku, id FROM products WHERE sku IN "
+        "(SELECT sku FROM products GROUP BY sku HAVING COUNT(*) > 1) ORDER BY sku, id")).all()
+    if rows:
+        duplicates: dict[str, list[str]] = {}
+        for sku, pid in rows:
+            duplicates.setdefault(sku, []).append(str(pid))
+        listing = "\n".join(f"  {sku!r}: id {', '.join(ids)}"
+                            for sku, ids in list(duplicates.items())[:50])
+        raise RuntimeError(f"Повторяющиеся артикулы ({len(duplicates)}), "
+                           f"объедините или переименуйте товары:\n{listing}")
+    op.drop_index(op.f('ix_products_sku'), table_name='products')
+    op.create_index(op.f('ix_products_sku'), 'products', ['sku'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_products_sku'), table_name='products')
+    op.create_index(op.f('ix_products_sku'), 'products', ['sku'], unique=False)
@@ -0,0 +1,72 @@
+"""products full-text search
+
+Revision ID: 9b3e7a41c2d8
+Revises: 5d1f0c2a9e47
+Create Date: 2026-10-18 11:02:47.905113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3e7a41c2d8'
+down_revision: Union[str, Sequence[str], None] = '5d1f0c2a9e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# SQL зафиксирован здесь: миграция не должна зависеть от текущего search.py
+CREATE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, sku, category, content='products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, sku, category) "
+    "VALUES (new.id, new.name, new.sku, new.category); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, sku, category) "
+    "VALUES ('delete', old.id, old.name, old.sku, old.category); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, sku, category) "
+    "VALUES ('delete', old.id, old.name, old.sku, old.category); "
+    "INSERT INTO products_fts(rowid, name, sku, category) "
+    "VALUES (new.id, new.name, new.sku, new.category); END",
+)
+
+DROP_FTS = (
+    "DROP TRIGGER IF EXISTS products_fts_ai",
+    "DROP TRIGGER IF EXISTS products_fts_ad",
+    "DROP TRIGGER IF EXISTS products_fts_au",
+    "DROP TABLE IF EXISTS products_fts",
+)
+
+REBUILD_FTS = "INSERT INTO products_fts(products_fts) VALUES ('rebuild')"
+
+
+def fts5_supported(bind):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return bool(bind.exec_driver_sql(
+        "SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_products_sku'), 'products', ['sku'], unique=False)
+
+    bind = op.get_bind()
+    if fts5_supported(bind):
+        for stmt in CREATE_FTS:
+            op.execute(stmt)
+        # Индексируем уже существующие товары
+        op.execute(REBUILD_FTS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'sqlite':
+        for stmt in DROP_FTS:
+            op.execute(stmt)
+    op.drop_index(op.f('ix_products_sku'), table_name='products')
@@ -0,0 +1,52 @@
+"""stock per warehouse
+
+Revision ID: b7c2e9a4d053
+Revises: e4a8d3f6b1c9
+Create Date: 2026-10-18 17:25:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c2e9a4d053'
+down_revision: Union[str, Sequence[str], None] = 'e4a8d3f6b1c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text("UPDATE stocks SET warehouse = :wh WHERE warehouse IS NULL OR warehouse = ''")
+               .bindparams(wh='Основной'))
+    # Дубли (товар, склад) сливаем в строку с наименьшим id
+    op.execute("""
+        UPDATE stocks SET quantity = (
+            SELECT SUM(s.quantity) FROM stocks s
+            WHERE s.product_id = stocks.product_id AND s.warehouse = stocks.warehouse)
+        WHERE id IN (SELECT MIN(id) FROM stocks GROUP BY product_id, warehouse HAVING COUNT(*) > 1)
+    """)
+    op.execute("DELETE FROM stocks WHERE id NOT IN "
+               "(SELECT MIN(id) FROM stocks GROUP BY product_id, warehouse)")
+
+    with op.batch_alter_table('stocks') as batch_op:
+        batch_op.alter_column('warehouse', existing_type=sa.String(length=100), nullable=False)
+
+    op.create_index('ux_stocks_product_warehouse', 'stocks', ['product_id', 'warehouse'], unique=True)
+    op.create_index('ix_stocks_warehouse_totals', 'stocks', ['warehouse', 'quantity', 'min_stock'],
+                    unique=False)
+    op.create_index('ix_stocks_low', 'stocks', ['warehouse', 'product_id'], unique=False,
+                    sqlite_where=sa.text('quantity <= min_stock'),
+                    postgresql_where=sa.text('quantity <= min_stock'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_stocks_low', table_name='stocks')
+    op.drop_index('ix_stocks_warehouse_totals', table_name='stocks')
+    op.drop_index('ux_stocks_product_warehouse', table_name='stocks')
+    with op.batch_alter_table('stocks') as batch_op:
+        batch_op.alter_column('warehouse', existing_type=sa.String(length=100), nullable=True)
@@ -0,0 +1,45 @@
+"""operations autoincrement
+
+Revision ID: d5a7c3e9f182
+Revises: 8a4f2c6e1d93
+Create Date: 2026-10-19 10:12:37.804215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a7c3e9f182'
+down_revision: Union[str, Sequence[str], None] = '8a4f2c6e1d93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Следующий id — после самого большого и в горячей таблице, и в архиве
+SEED_SEQUENCE = (
+    "INSERT INTO sqlite_sequence (name, seq) SELECT 'operations', max("
+    "coalesce((SELECT max(id) FROM operations), 0), "
+    "coalesce((SELECT max(id) FROM operations_archive), 0))"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # На других СУБД id берутся из последовательности и так не повторяются
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('operations', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': True}):
+        pass
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'operations'")
+    op.execute(SEED_SEQUENCE)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('operations', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': False}):
+        pass
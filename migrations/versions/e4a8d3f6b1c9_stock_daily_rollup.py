@@ -0,0 +1,55 @@
+"""stock daily rollup
+
+Revision ID: e4a8d3f6b1c9
+Revises: 9b3e7a41c2d8
+Create Date: 2026-10-18 13:40:11.562730
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a8d3f6b1c9'
+down_revision: Union[str, Sequence[str], None] = '9b3e7a41c2d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stock_daily',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('warehouse', sa.String(length=100), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('balance', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('product_id', 'warehouse', 'day')
+    )
+    # Заполняем свёртку по уже накопленному журналу: остаток на конец дня —
+    # оконная сумма дневных движений по (товар, склад)
+    op.execute(sa.text("""
+        INSERT INTO stock_daily (product_id, warehouse, day, balance)
+        SELECT product_id, warehouse, day,
+               SUM(net) OVER (PARTITION BY product_id, warehouse ORDER BY day)
+        FROM (
+            SELECT product_id, warehouse, day, SUM(delta) AS net
+            FROM (
+                SELECT product_id,
+                       CASE WHEN type = 'in' THEN COALESCE(NULLIF(to_wh, ''), :wh)
+                            ELSE COALESCE(NULLIF(from_wh, ''), :wh) END AS warehouse,
+                       DATE(date) AS day,
+                       CASE WHEN type = 'in' THEN quantity ELSE -quantity END AS delta
+                FROM operations
+                WHERE type IN ('in', 'out', 'adjust')
+            ) AS moves
+            GROUP BY product_id, warehouse, day
+        ) AS daily
+    """).bindparams(wh='Основной'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('stock_daily')
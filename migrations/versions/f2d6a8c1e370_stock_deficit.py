@@ -0,0 +1,40 @@
+"""stock deficit
+
+Revision ID: f2d6a8c1e370
+Revises: b7c2e9a4d053
+Create Date: 2026-10-18 17:58:12.406617
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2d6a8c1e370'
+down_revision: Union[str, Sequence[str], None] = 'b7c2e9a4d053'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LOW = sa.text('deficit >= 0')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('stocks', sa.Column('deficit', sa.Integer(), sa.Computed('min_stock - quantity')))
+    op.drop_index('ix_stocks_low', table_name='stocks')
+    op.create_index('ix_stocks_deficit', 'stocks', ['deficit', 'id'], unique=False,
+                    sqlite_where=LOW, postgresql_where=LOW)
+    op.create_index('ix_stocks_low', 'stocks', ['warehouse', 'deficit', 'id'], unique=False,
+                    sqlite_where=LOW, postgresql_where=LOW)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_stocks_low', table_name='stocks')
+    op.drop_index('ix_stocks_deficit', table_name='stocks')
+    op.drop_column('stocks', 'deficit')
+    op.create_index('ix_stocks_low', 'stocks', ['warehouse', 'product_id'], unique=False,
+                    sqlite_where=sa.text('quantity <= min_stock'),
+                    postgresql_where=sa.text('quantity <= min_stock'))
@@ -1,7 +1,26 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import insert
 from datetime import datetime
 
-db = SQLAlchemy()
+from replicas import RoutingSession
+
+# Сессия умеет читать с реплики (replicas.reads), запись всегда в основную базу
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Склад, на который относятся операции без указания склада
+DEFAULT_WAREHOUSE = "Основной"
+
+
+def dialect_insert(table, connection=None):
+    """insert() текущей СУБД — с on_conflict_do_* для SQLite и PostgreSQL."""
+    name = (connection or db.session.get_bind()).dialect.name
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table)
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table)
+    return insert(table)
 
 class Supplier(db.Model): # type: ignore
     __tablename__ = "suppliers"
@@ -27,29 +46,55 @@ class Product(db.Model): # type: ignore
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    sku = db.Column(db.String(100), nullable=False)
+    sku = db.Column(db.String(100), nullable=False, unique=True, index=True)
     category = db.Column(db.String(100))
     unit = db.Column(db.String(20))
     description = db.Column(db.Text)
 
     supplier_id = db.Column(db.Integer, db.ForeignKey("suppliers.id"))
 
-    stock = db.relationship("Stock", uselist=False, backref="product")
+    stocks = db.relationship("Stock", backref="product", order_by="Stock.warehouse")
     operations = db.relationship("Operation", backref="product")
 
 
 class Stock(db.Model): # type: ignore
+    """Остаток товара на одном складе: не больше строки на пару (товар, склад)."""
     __tablename__ = "stocks"
+    __table_args__ = (
+        db.Index("ux_stocks_product_warehouse", "product_id", "warehouse", unique=True),
+        # Итоги по складу читаются из индекса, без обращения к таблице
+        db.Index("ix_stocks_warehouse_totals", "warehouse", "quantity", "min_stock"),
+        # Частичные индексы только по критическим строкам (deficit >= 0), в порядке
+        # срочности: первые N дозаказов читаются без просмотра всей таблицы
+        db.Index("ix_stocks_deficit", "deficit", "id",
+                 sqlite_where=db.text("deficit >= 0"),
+                 postgresql_where=db.text("deficit >= 0")),
+        db.Index("ix_stocks_low", "warehouse", "deficit", "id",
+                 sqlite_where=db.text("deficit >= 0"),
+                 postgresql_where=db.text("deficit >= 0")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey("products.id"))
     quantity = db.Column(db.Integer, default=0)
     min_stock = db.Column(db.Integer, default=0)
-    warehouse = db.Column(db.String(100), default="Основной")
+    warehouse = db.Column(db.String(100), nullable=False, default=DEFAULT_WAREHOUSE)
+    # Насколько остаток ниже минимума; >= 0 — пора дозаказывать. Вычисляет СУБД
+    # (в SQLite — VIRTUAL, в PostgreSQL — STORED), поэтому он всегда согласован
+    deficit = db.Column(db.Integer, db.Computed("min_stock - quantity"))
 
 
 class Operation(db.Model): # type: ignore
     __tablename__ = "operations"
+    __table_args__ = (
+        # Журнал листается по (date, id) по убыванию — keyset-пагинация
+        db.Index("ix_operations_date_id", "date", "id"),
+        # История одного товара или диапазона товаров (аналитика, выгрузки)
+        db.Index("ix_operations_product_date", "product_id", "date"),
+        # id не переиспользуются, даже когда архивация опустошила таблицу:
+        # они уходят в operations_archive как есть
+        {"sqlite_autoincrement": True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey("products.id"))
@@ -62,3 +107,74 @@ class Operation(db.Model): # type: ignore
     to_wh = db.Column(db.String(100))
     responsible = db.Column(db.String(100))
     note = db.Column(db.Text)
+
+
+class OperationArchive(db.Model): # type: ignore
+    """Операции старше горизонта архивации (см. archive.py); столбцы как у operations."""
+    __tablename__ = "operations_archive"
+    __table_args__ = (
+        db.Index("ix_operations_archive_date_id", "date", "id"),
+        db.Index("ix_operations_archive_product_date", "product_id", "date"),
+    )
+
+    # id переносится из operations как есть
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"))
+    type = db.Column(db.String(20), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+
+    date = db.Column(db.DateTime)
+
+    from_wh = db.Column(db.String(100))
+    to_wh = db.Column(db.String(100))
+    responsible = db.Column(db.String(100))
+    note = db.Column(db.Text)
+
+    product = db.relationship("Product")
+
+
+class OpeningBalance(db.Model): # type: ignore
+    """Сумма движений по архивным операциям: остаток = входящий + горячий журнал."""
+    __tablename__ = "opening_balances"
+
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), primary_key=True)
+    warehouse = db.Column(db.String(100), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StockDaily(db.Model): # type: ignore
+    """Остаток товара на складе на конец дня (свёртка журнала операций)."""
+    __tablename__ = "stock_daily"
+
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), primary_key=True)
+    warehouse = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    balance = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model): # type: ignore
+    """Фоновая задача (см. jobs.py): очередь, состояние и прогресс."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    args = db.Column(db.Text)  # JSON
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    message = db.Column(db.String(200))
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+
+    # Когда задачу можно брать (для повтора — после паузы) и до какого времени она за воркером
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
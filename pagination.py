@@ -0,0 +1,97 @@
+"""Keyset-пагинация (по курсору) для длинных списков.
+
+Вместо OFFSET запоминаем ключ сортировки крайней показанной строки и берём
+следующую порцию условием «строго меньше/больше ключа». При наличии индекса
+по столбцам сортировки стоимость страницы не зависит от глубины листания.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+
+class Page:
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def parse_per_page(raw, default=DEFAULT_PER_PAGE):
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(value, MAX_PER_PAGE))
+
+
+def encode_cursor(values):
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    token = base64.urlsafe_b64encode(json.dumps(raw).encode("utf-8"))
+    return token.decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, types):
+    """Разбирает курсор в кортеж значений типов `types`; None — если курсор битый."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(raw, list) or len(raw) != len(types):
+            return None
+        return tuple(datetime.fromisoformat(v) if t is datetime else t(v)
+                     for t, v in zip(types, raw))
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_keyset(query, columns, limit, after=None, before=None):
+    """До `limit` строк `query` за курсором в порядке обхода: по убыванию
+    `columns`, а при `before` — по возрастанию (от курсора к новым)."""
+    row = tuple_(*columns)
+    if before is not None:
+        return (query.filter(row > tuple_(*before))
+                .order_by(*[c.asc() for c in columns])
+                .limit(limit)
+                .all())
+    if after is not None:
+        query = query.filter(row < tuple_(*after))
+    return (query.order_by(*[c.desc() for c in columns])
+            .limit(limit)
+            .all())
+
+
+def build_page(rows, key, per_page, after=None, before=None):
+    """Page из строк fetch_keyset (не больше per_page + 1)."""
+    if before is not None:
+        # Шли «назад» по возрастанию — разворачиваем
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_next = True
+    else:
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_prev = after is not None
+
+    return Page(
+        items,
+        per_page,
+        next_cursor=encode_cursor(key(items[-1])) if has_next and items else None,
+        prev_cursor=encode_cursor(key(items[0])) if has_prev and items else None,
+    )
+
+
+def keyset_page(query, columns, key, per_page, after=None, before=None):
+    """Страница `query`, отсортированного по `columns` по убыванию.
+
+    `key(item)` возвращает значения столбцов сортировки для строки,
+    `after`/`before` — разобранные курсоры следующей/предыдущей страницы.
+    """
+    rows = fetch_keyset(query, columns, per_page + 1, after, before)
+    return build_page(rows, key, per_page, after, before)
@@ -0,0 +1,196 @@
+"""Сверка остатков (stocks) с журналом операций.
+
+Ожидаемый остаток строки (товар, склад) восстанавливается из журнала:
+
+    входящий остаток (opening_balances) + сумма движений operations
+
+Суммы считает база (GROUP BY по ledger.movements_select), Python только
+сравнивает готовые итоги со stocks. Каталог режется на диапазоны
+product_id по RECONCILE_CHUNK_SIZE товаров; диапазоны сверяются
+параллельно в пуле процессов, у каждого процесса своё соединение. Остатки и
+журнал диапазона читаются в одной транзакции чтения (snapshot), чтобы видеть
+один снимок: иначе проводка между двумя SELECT попала бы только в остаток, и
+исправление откатило бы её.
+
+Исправление пишет ожидаемое значение только в строки, остаток которых не
+изменился с момента сверки (UPDATE ... WHERE quantity = увиденное), поэтому
+проводки, прошедшие во время сверки, не затираются.
+"""
+import csv
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from flask import current_app
+from sqlalchemy import create_engine, func, literal, select, union_all, update
+from sqlalchemy.pool import NullPool
+
+from models import db, dialect_insert, Product, Stock, Operation, OpeningBalance
+import counters
+import ledger
+from cache import CacheUnavailable
+
+log = logging.getLogger(__name__)
+
+Drift = namedtuple("Drift", "product_id warehouse stock ledger")
+FIELDS = ("product_id", "warehouse", "stock", "ledger", "diff")
+
+
+def _chunks(connection, chunk_size):
+    """Границы (lo, hi] по product_id, в каждой не больше chunk_size товаров."""
+    last = 0
+    while True:
+        hi = connection.execute(
+            select(Product.id).where(Product.id > last).order_by(Product.id)
+            .offset(chunk_size - 1).limit(1)).scalar()
+        if hi is None:
+            hi = connection.execute(select(func.max(Product.id)).where(Product.id > last)).scalar()
+            if hi is None:
+                return
+        yield last, hi
+        last = hi
+
+
+def expected_select(lo, hi):
+    """Ожидаемые остатки товаров из (lo, hi]: product_id, warehouse, quantity."""
+    moves = ledger.movements_select(Operation, Operation.product_id > lo, Operation.product_id <= hi)
+    opening = (select(OpeningBalance.product_id, OpeningBalance.warehouse,
+                      literal(None, Operation.date.type).label("date"),
+                      OpeningBalance.quantity.label("delta"))
+               .where(OpeningBalance.product_id > lo, OpeningBalance.product_id <= hi))
+    rows = union_all(*moves.selects, opening).subquery()
+    return (select(rows.c.product_id, rows.c.warehouse, func.sum(rows.c.delta).label("quantity"))
+            .group_by(rows.c.product_id, rows.c.warehouse))
+
+
+@contextmanager
+def snapshot(engine):
+    """Соединение, все запросы которого видят один снимок базы.
+
+    pysqlite не шлёт BEGIN перед SELECT, и каждый запрос видел бы свежие
+    закоммиченные данные — BEGIN отправляем сами. PostgreSQL читает в
+    REPEATABLE READ.
+    """
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            conn.exec_driver_sql("BEGIN")
+        elif engine.dialect.name == "postgresql":
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+
+def diff_chunk(connection, lo, hi):
+    """Расхождения по товарам из (lo, hi]: список Drift.
+
+    stock=None — строки остатка нет, а журнал по складу непустой.
+    """
+    expected = {(p, w): q for p, w, q in connection.execute(expected_select(lo, hi))}
+    drift = []
+    for p, w, q in connection.execute(
+            select(Stock.product_id, Stock.warehouse, Stock.quantity)
+            .where(Stock.product_id > lo, Stock.product_id <= hi)):
+        want = expected.pop((p, w), 0)
+        if q != want:
+            drift.append(Drift(p, w, q, want))
+    drift.extend(Drift(p, w, None, q) for (p, w), q in expected.items() if q)
+    return sorted(drift)
+
+
+# ---------------- Пул процессов ----------------
+_engine = None
+
+
+def _worker_diff(uri, lo, hi):
+    """Сверка диапазона в процессе пула: своё соединение без пула, один снимок."""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(uri, poolclass=NullPool)
+    with snapshot(_engine) as conn:
+        return lo, hi, diff_chunk(conn, lo, hi)
+
+
+def _workers(workers):
+    workers = workers or current_app.config.get("RECONCILE_WORKERS") or os.cpu_count() or 1
+    url = db.engine.url
+    # Базу в памяти видит только этот процесс
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return 1
+    return workers
+
+
+def scan(chunk_size=None, workers=None):
+    """Генератор (lo, hi, [Drift, ...]) по всем диапазонам каталога."""
+    chunk_size = chunk_size or current_app.config.get("RECONCILE_CHUNK_SIZE", 10_000)
+    chunks = list(_chunks(db.session, chunk_size))
+    workers = min(_workers(workers), len(chunks) or 1)
+    if workers == 1:
+        db.session.rollback()
+        for lo, hi in chunks:
+            with snapshot(db.engine) as conn:
+                drift = diff_chunk(conn, lo, hi)
+            yield lo, hi, drift
+        return
+
+    uri = db.engine.url.render_as_string(hide_password=False)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_worker_diff, *zip(*((uri, lo, hi) for lo, hi in chunks)))
+
+
+def apply(drift):
+    """Приводит stocks к журналу; возвращает число исправленных строк.
+
+    Строка, изменённая после сверки, пропускается — её поймает следующий запуск.
+    """
+    fixed = 0
+    t = Stock.__table__
+    missing = [d for d in drift if d.stock is None]
+    for d in drift:
+        if d.stock is None:
+            continue
+        fixed += db.session.execute(
+            update(t).where(t.c.product_id == d.product_id, t.c.warehouse == d.warehouse,
+                            t.c.quantity == d.stock)
+            .values(quantity=d.ledger)).rowcount
+    if missing:
+        stmt = dialect_insert(t)
+        if hasattr(stmt, "on_conflict_do_nothing"):
+            stmt = stmt.on_conflict_do_nothing(index_elements=["product_id", "warehouse"])
+        fixed += db.session.execute(stmt, [
+            {"product_id": d.product_id, "warehouse": d.warehouse,
+             "quantity": d.ledger, "min_stock": 0} for d in missing]).rowcount
+    return fixed
+
+
+def run(write=False, out=None, chunk_size=None, workers=None, progress=None):
+    """Сверка всего каталога. write — исправить stocks (коммит на диапазон),
+    out — путь CSV с расхождениями, progress(summary) — после каждого
+    диапазона. Возвращает сводку."""
+    summary = {"chunks": 0, "drift": 0, "fixed": 0}
+    writer = None
+    with open(out, "w", newline="", encoding="utf-8") if out else nullcontext() as f:
+        if out:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+        for lo, hi, drift in scan(chunk_size, workers):
+            summary["chunks"] += 1
+            summary["drift"] += len(drift)
+            if writer:
+                writer.writerows((*d, d.ledger - (d.stock or 0)) for d in drift)
+            if drift:
+                log.warning("Товары %d..%d: расхождений с журналом %d", lo + 1, hi, len(drift))
+            if write and drift:
+                summary["fixed"] += apply(drift)
+                db.session.commit()
+            if progress:
+                progress(summary)
+    if summary["fixed"]:
+        try:
+            counters.reconcile()
+        except CacheUnavailable:
+            pass
+    return summary
@@ -0,0 +1,174 @@
+"""Расчёт точки заказа (рекомендуемого min_stock) по истории отгрузок.
+
+Для каждой строки остатка (товар, склад) по отгрузкам (out) за последние
+REORDER_LOOKBACK_DAYS дней считаются среднесуточный спрос и его разброс, а
+из них — страховой запас и точка заказа с учётом срока поставки:
+
+    safety = z(service_level) * std * sqrt(lead_time)
+    reorder_point = ceil(mean * lead_time + safety)
+
+Каталог обрабатывается пачками по REORDER_BATCH_SIZE товаров. В пачке база
+отдаёт уже сгруппированные суммы по (товар, склад, день), а статистика
+считается в NumPy целыми массивами — без цикла по товарам в Python. Дни без
+отгрузок входят в среднее как нули.
+"""
+import csv
+import math
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import bindparam, func, select, update
+
+from models import db, Stock, Operation, DEFAULT_WAREHOUSE
+import counters
+from cache import CacheUnavailable
+
+FIELDS = ("stock_id", "product_id", "warehouse", "min_stock",
+          "demand_rate", "demand_std", "safety_stock", "reorder_point")
+
+
+def _settings(lookback_days=None, lead_time_days=None, service_level=None):
+    config = current_app.config
+    return (lookback_days or config.get("REORDER_LOOKBACK_DAYS", 90),
+            lead_time_days or config.get("REORDER_LEAD_TIME_DAYS", 7),
+            service_level or config.get("REORDER_SERVICE_LEVEL", 0.95))
+
+
+def _product_batches(batch_size):
+    """Границы (lo, hi] по product_id, в каждой не больше batch_size товаров."""
+    last = 0
+    while True:
+        ids = select(Stock.product_id).where(Stock.product_id > last).group_by(Stock.product_id)
+        hi = db.session.execute(
+            ids.order_by(Stock.product_id).offset(batch_size - 1).limit(1)).scalar()
+        if hi is None:
+            hi = db.session.execute(select(func.max(Stock.product_id))
+                                    .where(Stock.product_id > last)).scalar()
+            if hi is None:
+                return
+        yield last, hi
+        last = hi
+
+
+def _encode(product_ids, warehouses, codes):
+    """Ключ (товар, склад) одним int64: product_id * 10^6 + код склада в пачке."""
+    wh_codes = np.fromiter((codes.setdefault(w, len(codes)) for w in warehouses),
+                           dtype=np.int64, count=len(warehouses))
+    return product_ids * 1_000_000 + wh_codes
+
+
+def compute_batch(stock_rows, demand_rows, days, lead_time, z):
+    """Статистика по одной пачке.
+
+    stock_rows — (id, product_id, warehouse, min_stock), demand_rows —
+    (product_id, warehouse, день, количество) с уникальными (товар, склад, день).
+    Возвращает словарь массивов с ключами FIELDS.
+    """
+    codes = {}
+    stock_ids = np.array([r[0] for r in stock_rows], dtype=np.int64)
+    stock_pids = np.array([r[1] for r in stock_rows], dtype=np.int64)
+    stock_keys = _encode(stock_pids, [r[2] for r in stock_rows], codes)
+    order = np.argsort(stock_keys)
+    sorted_keys = stock_keys[order]
+
+    totals = np.zeros(len(stock_rows))
+    squares = np.zeros(len(stock_rows))
+    if demand_rows:
+        pids = np.array([r[0] for r in demand_rows], dtype=np.int64)
+        qty = np.array([r[3] for r in demand_rows], dtype=np.float64)
+        keys = _encode(pids, [r[1] for r in demand_rows], codes)
+        pos = np.searchsorted(sorted_keys, keys)
+        pos[pos == len(sorted_keys)] = 0
+        found = sorted_keys[pos] == keys
+        # Отгрузки со склада без строки остатка в расчёт не попадают
+        rows = order[pos[found]]
+        totals = np.bincount(rows, weights=qty[found], minlength=len(stock_rows))
+        squares = np.bincount(rows, weights=qty[found] ** 2, minlength=len(stock_rows))
+
+    mean = totals / days
+    std = np.sqrt(np.maximum(squares / days - mean ** 2, 0.0))
+    safety = z * std * math.sqrt(lead_time)
+    reorder_point = np.ceil(mean * lead_time + safety - 1e-9).astype(np.int64)
+
+    return {
+        "stock_id": stock_ids,
+        "product_id": stock_pids,
+        "warehouse": np.array([r[2] for r in stock_rows], dtype=object),
+        "min_stock": np.array([r[3] or 0 for r in stock_rows], dtype=np.int64),
+        "demand_rate": mean,
+        "demand_std": std,
+        "safety_stock": safety,
+        "reorder_point": reorder_point,
+    }
+
+
+def recommend(batch_size=None, lookback_days=None, lead_time_days=None,
+              service_level=None, now=None):
+    """Генератор рекомендаций: по словарю массивов (FIELDS) на пачку товаров."""
+    batch_size = batch_size or current_app.config.get("REORDER_BATCH_SIZE", 50_000)
+    days, lead_time, level = _settings(lookback_days, lead_time_days, service_level)
+    z = NormalDist().inv_cdf(level)
+    since = (now or datetime.utcnow()) - timedelta(days=days)
+
+    warehouse = func.coalesce(func.nullif(Operation.from_wh, ""), DEFAULT_WAREHOUSE)
+    day = func.date(Operation.date)
+
+    for lo, hi in _product_batches(batch_size):
+        stock_rows = db.session.execute(
+            select(Stock.id, Stock.product_id, Stock.warehouse, Stock.min_stock)
+            .where(Stock.product_id > lo, Stock.product_id <= hi)).all()
+        demand_rows = db.session.execute(
+            select(Operation.product_id, warehouse, day, func.sum(Operation.quantity))
+            .where(Operation.product_id > lo, Operation.product_id <= hi,
+                   Operation.date >= since, Operation.type == "out")
+            .group_by(Operation.product_id, warehouse, day)).all()
+        yield compute_batch(stock_rows, demand_rows, days, lead_time, z)
+
+
+def apply(batch):
+    """Записывает reorder_point пачки в min_stock; возвращает число изменённых строк."""
+    changed = batch["reorder_point"] != batch["min_stock"]
+    params = [{"sid": int(sid), "rp": int(rp)} for sid, rp in
+              zip(batch["stock_id"][changed], batch["reorder_point"][changed])]
+    if params:
+        db.session.execute(
+            update(Stock.__table__)
+            .where(Stock.__table__.c.id == bindparam("sid"))
+            .values(min_stock=bindparam("rp")),
+            params)
+    return len(params)
+
+
+def run(write=False, out=None, progress=None, **options):
+    """Пересчёт по всему каталогу. write — записать в min_stock (коммит на пачку),
+    out — путь CSV для рекомендаций, progress(summary) — после каждой пачки.
+    Возвращает сводку."""
+    summary = {"rows": 0, "changed": 0}
+    writer = None
+    with open(out, "w", newline="", encoding="utf-8") if out else nullcontext() as f:
+        if out:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+        for batch in recommend(**options):
+            summary["rows"] += len(batch["stock_id"])
+            if writer:
+                writer.writerows(zip(*(
+                    np.round(batch[name], 3) if batch[name].dtype == np.float64 else batch[name]
+                    for name in FIELDS)))
+            if write:
+                summary["changed"] += apply(batch)
+                db.session.commit()
+            else:
+                summary["changed"] += int((batch["reorder_point"] != batch["min_stock"]).sum())
+            if progress:
+                progress(summary)
+    if write and summary["changed"]:
+        # Смена min_stock меняет набор критических остатков
+        try:
+            counters.reconcile()
+        except CacheUnavailable:
+            pass
+    return summary
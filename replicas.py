@@ -0,0 +1,197 @@
+"""Чтение с реплики: маршрутизация сессии между основной базой и репликой.
+
+Реплика задаётся REPLICA_DATABASE_URI и становится bind'ом "replica".
+Представления, обёрнутые в reads(*tables), читают с неё, если:
+- клиент недавно ничего не записывал — после записи его запросы
+  REPLICA_STICKY_SECONDS секунд идут в основную базу (read-your-writes);
+- реплика не старше последней записи в tables (по версиям из versions.py).
+Иначе, а также без реплики или без версий, чтение идёт в основную базу.
+Записи (flush) всегда идут в основную базу.
+
+Для локального стенда реплика — копия файла SQLite, которую обновляет
+`flask replica-refresh` через backup API: копия пишется во временный файл и
+атомарно подменяет реплику, а время начала копирования становится её mtime.
+Соединения пула с подменённым файлом переоткрываются при выдаче из пула.
+Для внешней реплики (например, потоковой PostgreSQL) отставание считается
+не больше REPLICA_MAX_LAG секунд.
+"""
+import logging
+import os
+import sqlite3
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session as BaseSession
+from sqlalchemy import event, exc
+from sqlalchemy.orm import Session
+
+import versions
+
+log = logging.getLogger(__name__)
+
+REPLICA_BIND = "replica"
+
+
+class RoutingSession(BaseSession):
+    """Сессия Flask-SQLAlchemy, которая по флагу info["replica"] читает с реплики."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get("replica") and not self._flushing:
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _sqlite_path(url):
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    path = url.database
+    if path.startswith("file:"):
+        path = path[5:].split("?", 1)[0]
+    return path
+
+
+# ---------------- Настройка ----------------
+def configure(app):
+    """Добавляет bind реплики в SQLALCHEMY_BINDS; вызывать до db.init_app."""
+    uri = app.config.get("REPLICA_DATABASE_URI")
+    if not uri:
+        return
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    binds[REPLICA_BIND] = uri
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+def init_app(app):
+    """Следит за подменой файла SQLite-реплики; после db.init_app."""
+    app.after_request(_remember_write)
+    with app.app_context():
+        engine = app.extensions["sqlalchemy"].engines.get(REPLICA_BIND)
+    path = engine is not None and _sqlite_path(engine.url)
+    if not path:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _remember_file(dbapi_connection, connection_record):
+        connection_record.info["inode"] = _inode(path)
+
+    @event.listens_for(engine, "checkout")
+    def _reopen_replaced(dbapi_connection, connection_record, connection_proxy):
+        if connection_record.info.get("inode") != _inode(path):
+            # Пул переподключится и откроет новую копию
+            raise exc.DisconnectionError("Файл реплики обновлён")
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except OSError:
+        return None
+
+
+# ---------------- Выбор базы ----------------
+def synced_at():
+    """Время, до которого реплика гарантированно содержит все записи; None без реплики."""
+    engine = current_app.extensions["sqlalchemy"].engines.get(REPLICA_BIND)
+    if engine is None:
+        return None
+    path = _sqlite_path(engine.url)
+    if path:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+    return time.time() - current_app.config.get("REPLICA_MAX_LAG", 1)
+
+
+def use_replica(tables):
+    if session.get("primary_until", 0) > time.time():
+        return False
+    synced = synced_at()
+    if synced is None:
+        return False
+    data = versions.current()
+    if data is None:
+        return False
+    written = [int(data[f"at:{name}"]) for name in tables if f"at:{name}" in data]
+    if not written:
+        # Хэш версий пересоздан: о записях до его начала ничего не известно
+        written = [int(data.get("started", 0))]
+    # at — целая секунда записи: реплика свежая, только если снята после её конца
+    return max(written) + 1 <= synced
+
+
+def reads(*tables):
+    """Декоратор представления только для чтения из tables."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not use_replica(tables):
+                return view(*args, **kwargs)
+            db_session = current_app.extensions["sqlalchemy"].session
+            db_session.info["replica"] = True
+            try:
+                return view(*args, **kwargs)
+            finally:
+                db_session.info.pop("replica", None)
+        return wrapper
+    return decorator
+
+
+# ---------------- Липкость после записи ----------------
+@event.listens_for(Session, "after_flush")
+def _flushed(db_session, flush_context):
+    if has_request_context():
+        g.wrote = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _executed(state):
+    if has_request_context() and (state.is_insert or state.is_update or state.is_delete):
+        g.wrote = True
+
+
+def _remember_write(response):
+    if g.get("wrote"):
+        sticky = current_app.config.get("REPLICA_STICKY_SECONDS", 5)
+        session["primary_until"] = time.time() + sticky
+    return response
+
+
+# ---------------- Обновление SQLite-реплики ----------------
+def refresh_sqlite(primary, replica):
+    """Снимает копию primary в replica через backup API; возвращает время снятия."""
+    started = time.time()
+    tmp = f"{replica}.tmp"
+    src = sqlite3.connect(primary)
+    dst = sqlite3.connect(tmp)
+    try:
+        src.backup(dst)
+        # Копия не в WAL: рядом с подменяемым файлом не должно быть -wal/-shm
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dst.close()
+        src.close()
+    os.utime(tmp, (started, started))
+    os.replace(tmp, replica)
+    return started
+
+
+def refresh(app):
+    """refresh_sqlite для файлов основной базы и реплики из настроек app.
+
+    Пути берутся из движков: Flask-SQLAlchemy уже разрешил относительные
+    пути SQLite от app.instance_path, и реплику читает именно этот файл.
+    """
+    with app.app_context():
+        engines = app.extensions["sqlalchemy"].engines
+        primary = _sqlite_path(engines[None].url)
+        replica = REPLICA_BIND in engines and _sqlite_path(engines[REPLICA_BIND].url)
+    if not primary or not replica:
+        raise ValueError("Копию снимает только файловая SQLite: проверьте "
+                         "SQLALCHEMY_DATABASE_URI и REPLICA_DATABASE_URI")
+    started = refresh_sqlite(primary, replica)
+    log.info("Реплика %s обновлена", replica)
+    return started
@@ -0,0 +1,125 @@
+"""Дневная свёртка остатков: остаток товара на складе на конец каждого дня.
+
+Свёртка ведётся инкрементально при проводке операций и может быть целиком
+пересобрана из журнала. Остаток на произвольный момент = ближайший снимок
+до этого дня + операции самого дня, без прохода по всему журналу.
+"""
+from datetime import datetime, time
+
+from sqlalchemy import and_, bindparam, delete, exists, func, insert, select, update, Date
+
+from models import db, StockDaily, dialect_insert
+import archive
+import ledger
+
+
+def record_movements(rows):
+    """Учитывает изменения остатков в свёртке в рамках текущей транзакции.
+
+    rows — словари product_id, warehouse, day, delta. Для каждого
+    (товар, склад, день) создаётся строка с остатком на конец предыдущего дня,
+    затем delta прибавляется к этому и всем более поздним дням (операции
+    задним числом).
+    """
+    totals = {}
+    for row in rows:
+        key = (row["product_id"], row["warehouse"], row["day"])
+        totals[key] = totals.get(key, 0) + row["delta"]
+    keys = [k for k, delta in totals.items() if delta]
+    if not keys:
+        return
+
+    t = StockDaily.__table__
+    p, w, d = bindparam("p"), bindparam("w"), bindparam("d", type_=Date)
+    previous = (select(t.c.balance)
+                .where(t.c.product_id == p, t.c.warehouse == w, t.c.day < d)
+                .order_by(t.c.day.desc())
+                .limit(1)
+                .scalar_subquery())
+
+    stmt = dialect_insert(t)
+    if hasattr(stmt, "on_conflict_do_nothing"):
+        stmt = stmt.values(product_id=p, warehouse=w, day=d,
+                           balance=func.coalesce(previous, 0)).on_conflict_do_nothing()
+    else:
+        # Другие СУБД: вставляем, только если строки дня ещё нет
+        stmt = insert(t).from_select(
+            ["product_id", "warehouse", "day", "balance"],
+            select(p, w, d, func.coalesce(previous, 0)).where(~exists().where(
+                t.c.product_id == p, t.c.warehouse == w, t.c.day == d)))
+    db.session.execute(stmt, [{"p": pid, "w": wh, "d": day} for pid, wh, day in keys])
+    db.session.execute(
+        update(t)
+        .where(t.c.product_id == p, t.c.warehouse == w, t.c.day >= d)
+        .values(balance=t.c.balance + bindparam("delta")),
+        [{"p": pid, "w": wh, "d": day, "delta": totals[(pid, wh, day)]} for pid, wh, day in keys],
+    )
+
+
+def rebuild(connection=None, include_archive=True):
+    """Пересобирает свёртку из журнала одним INSERT ... SELECT с оконной суммой.
+
+    Архив входит целиком: свёртка хранит и дни до горизонта архивации.
+    include_archive=False — для миграций, выполняемых до появления архива.
+    """
+    conn = connection or db.session.connection()
+    if include_archive:
+        moves = archive.movements_select(connection=conn).subquery()
+    else:
+        moves = ledger.movements_select().subquery()
+    daily = (select(moves.c.product_id, moves.c.warehouse,
+                    func.date(moves.c.date).label("day"),
+                    func.sum(moves.c.delta).label("net"))
+             .group_by(moves.c.product_id, moves.c.warehouse, func.date(moves.c.date))
+             .subquery())
+    running = func.sum(daily.c.net).over(
+        partition_by=(daily.c.product_id, daily.c.warehouse), order_by=daily.c.day)
+
+    conn.execute(delete(StockDaily.__table__))
+    conn.execute(insert(StockDaily.__table__).from_select(
+        ["product_id", "warehouse", "day", "balance"],
+        select(daily.c.product_id, daily.c.warehouse, daily.c.day, running),
+    ))
+
+
+def stock_as_of(day, until=None, product_id=None, warehouse=None):
+    """Остатки {(product_id, склад): количество} на конец дня `day`.
+
+    Если задан `until` (datetime внутри дня), берётся снимок на конец
+    предыдущего дня и к нему добавляются операции дня до `until` включительно.
+    """
+    t = StockDaily
+    latest = (select(t.product_id, t.warehouse, func.max(t.day).label("day"))
+              .where(t.day <= day if until is None else t.day < day)
+              .group_by(t.product_id, t.warehouse))
+    if product_id is not None:
+        latest = latest.where(t.product_id == product_id)
+    if warehouse:
+        latest = latest.where(t.warehouse == warehouse)
+    latest = latest.subquery()
+
+    snapshot = select(t.product_id, t.warehouse, t.balance).join(latest, and_(
+        t.product_id == latest.c.product_id,
+        t.warehouse == latest.c.warehouse,
+        t.day == latest.c.day,
+    ))
+    balances = {(r.product_id, r.warehouse): r.balance for r in db.session.execute(snapshot)}
+
+    if until is not None:
+        day_start = datetime.combine(day, time.min)
+
+        def criteria(source):
+            where = [source.date >= day_start, source.date <= until]
+            if product_id is not None:
+                where.append(source.product_id == product_id)
+            return where
+
+        moves = archive.movements_select(criteria, date_from=day_start).subquery()
+        day_ops = select(moves.c.product_id, moves.c.warehouse, func.sum(moves.c.delta))
+        if warehouse:
+            day_ops = day_ops.where(moves.c.warehouse == warehouse)
+        for pid, wh, delta in db.session.execute(
+                day_ops.group_by(moves.c.product_id, moves.c.warehouse)):
+            balances[(pid, wh)] = balances.get((pid, wh), 0) + delta
+
+    return balances
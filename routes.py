@@ -1,64 +1,65 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from models import db, Product, Supplier, Stock, Operation
-from datetime import datetime
-from sqlalchemy import func
-import redis
-import json
-
-redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify,
+                   Response, stream_with_context, current_app, send_from_directory)
+from models import db, Product, Supplier, Stock, Operation, OperationArchive, Job
+import archive
+import rollup
+from search import search_products, suggest
+from ledger import book_operation, negative_stock_policy, LedgerError
+from ingest import ingest_operations, FORMATS as INGEST_FORMATS
+import export
+import catalog
+from pagination import keyset_page, decode_cursor, parse_per_page
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+import counters
+import instrumentation
+import warehouses
+import scanner
+import events
+import jobs
+import versions
+import replicas
+from cache import cache
 
 bp = Blueprint('main', __name__)
 
 
 # ---------------- Главная ----------------
 @bp.route("/")
+@replicas.reads("products", "suppliers", "stocks")
 def index():
-    cache_key = "dashboard_stats"
-    cached = redis_client.get(cache_key)
-
-    if cached:
-        # Если есть в кеше - возвращаем из Redis
-        data = json.loads(cached)
-        return render_template("index.html",
-                               total_products=data['products'],
-                               total_suppliers=data['suppliers'],
-                               low_count=data['low_stock'])
-
-    total_products = Product.query.count()
-    total_suppliers = Supplier.query.count()
-    low = Stock.query.filter(Stock.quantity <= Stock.min_stock).count()
-    
-    # Сохраняем в кеш на 30 секунд
-    data = {
-        'products': total_products,
-        'suppliers': total_suppliers, 
-        'low_stock': low
-    }
-    redis_client.setex(cache_key, 30, json.dumps(data))  
-    
+    # Счётчики поддерживаются записывающими путями, сверяет их воркер задач
+    data = counters.get_counters()
+
     return render_template("index.html",
-                           total_products=total_products,
-                           total_suppliers=total_suppliers,
-                           low_count=low)
+                           total_products=data['products'],
+                           total_suppliers=data['suppliers'],
+                           low_count=data['low_stock'])
+
+
+@bp.route("/cache/stats")
+def cache_stats():
+    return jsonify(cache.get_stats())
+
+
+@bp.route("/metrics")
+def metrics():
+    return Response(instrumentation.render_metrics(),
+                    mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 
 # ---------------- Список товаров ----------------
 @bp.route("/products")
+@versions.conditional("products", "stocks", "suppliers")
+@replicas.reads("products", "stocks", "suppliers")
 def products():
     q = request.args.get("q", "")
     category = request.args.get("category", "")
     supplier = request.args.get("supplier", "")
 
-    query = Product.query
-
-    if q:
-        query = query.filter(
-            (Product.name.contains(q)) |
-            (Product.sku.contains(q))
-        )
-
-    if category:
-        query = query.filter(Product.category.contains(category))
+    # Остатки по складам и поставщик нужны в каждой строке — грузим одним JOIN'ом, без N+1
+    query = Product.query.options(joinedload(Product.stocks), joinedload(Product.supplier))
 
     if supplier:
         try:
@@ -67,6 +68,9 @@ def products():
         except:
             pass
 
+    # Поиск последним: он добавляет сортировку по релевантности и LIMIT
+    query = search_products(query, q, category)
+
     items = query.all()
     return render_template("product_list.html", products=items)
 
@@ -75,20 +79,30 @@ def products():
 @bp.route("/product/add", methods=["GET", "POST"])
 def add_product():
     if request.method == "POST":
+        sku = request.form["sku"]
+        if db.session.execute(db.select(Product.id).filter_by(sku=sku)).first():
+            flash(f"Товар с артикулом {sku} уже есть", "error")
+            return redirect(url_for("main.add_product"))
         p = Product(
             name=request.form["name"],
-            sku=request.form["sku"],
+            sku=sku,
             category=request.form.get("category"),
             unit=request.form.get("unit"),
             description=request.form.get("description"),
             supplier_id=request.form.get("supplier") or None
         )
-        db.session.add(p)
-        db.session.commit()
-
-        stock = Stock(product_id=p.id, quantity=0, min_stock=0)
-        db.session.add(stock)
-        db.session.commit()
+        try:
+            # Товар и его строка остатка — одной транзакцией
+            db.session.add(p)
+            db.session.flush()
+            db.session.add(Stock(product_id=p.id, quantity=0, min_stock=0))
+            counters.record(products=1, low_stock=counters.low_stock_delta(None, 0, 0))
+            db.session.commit()
+        except IntegrityError:
+            # Тот же артикул успел добавить параллельный запрос — сработал уникальный индекс
+            db.session.rollback()
+            flash(f"Товар с артикулом {sku} уже есть", "error")
+            return redirect(url_for("main.add_product"))
 
         flash("Товар добавлен", "success")
         return redirect(url_for("main.products"))
@@ -97,8 +111,30 @@ def add_product():
     return render_template("add_product.html", suppliers=suppliers)
 
 
+# Импорт каталога: тело запроса — CSV или XLSX (?format или Content-Type); ?background=1 — фоновой задачей
+@bp.route("/products/import", methods=["POST"])
+def import_products():
+    fmt = request.args.get("format") or catalog.MIMETYPES.get(request.mimetype)
+    if not fmt:
+        return jsonify(error="Укажите ?format=csv|xlsx или Content-Type text/csv либо XLSX"), 400
+    if fmt not in catalog.FORMATS:
+        return jsonify(error=f"Неизвестный формат: {fmt}"), 400
+
+    if request.args.get("background") == "1":
+        upload = jobs.save_upload(request.stream, fmt)
+        return _job_accepted(jobs.enqueue("catalog-import", upload=upload, format=fmt))
+
+    try:
+        report = catalog.import_catalog(request.stream, fmt)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(report.to_dict())
+
+
 # ---------------- Поставщики ----------------
 @bp.route("/suppliers")
+@versions.conditional("suppliers")
+@replicas.reads("suppliers")
 def suppliers():
     return render_template("suppliers_list.html", suppliers=Supplier.query.all())
 
@@ -108,6 +144,7 @@ def add_supplier():
     if request.method == "POST":
         s = Supplier(name=request.form["name"], contact=request.form.get("contact"))
         db.session.add(s)
+        counters.record(suppliers=1)
         db.session.commit()
         flash("Поставщик добавлен", "success")
         return redirect(url_for("main.suppliers"))
@@ -116,71 +153,273 @@ def add_supplier():
 
 
 # ---------------- Операции ----------------
+OPERATION_CURSOR = (datetime, int)
+
+
+def _parse_day(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+
 @bp.route("/operations")
+@versions.conditional("operations", "operations_archive", "products")
+@replicas.reads("operations", "operations_archive", "products")
 def operations():
     df = request.args.get("from", "")
     dt = request.args.get("to", "")
+    per_page = parse_per_page(request.args.get("per_page"))
+
+    # Фильтр — полуоткрытый интервал [from 00:00; to+1 00:00), чтобы работал
+    # индекс ix_operations_date_id (func.date(...) его отключал)
+    d1 = _parse_day(df)
+    d2 = _parse_day(dt)
+
+    def journal(model):
+        query = model.query.options(joinedload(model.product))
+        if d1:
+            query = query.filter(model.date >= d1)
+        if d2:
+            query = query.filter(model.date < d2 + timedelta(days=1))
+        return query
+
+    # Архив подмешивается, только если страница заходит за его горизонт
+    page = archive.operations_page(
+        journal(Operation),
+        journal(OperationArchive),
+        per_page,
+        after=decode_cursor(request.args.get("after"), OPERATION_CURSOR),
+        before=decode_cursor(request.args.get("before"), OPERATION_CURSOR),
+        date_from=d1,
+    )
+    filters = {k: request.args[k] for k in ("from", "to", "per_page") if request.args.get(k)}
+    return render_template("operations_list.html", operations=page.items,
+                           page=page, filters=filters)
 
-    query = Operation.query
 
-    if df:
+@bp.route("/operations/add", methods=["GET", "POST"])
+def add_operation_view():
+    if request.method == "POST":
+        product_id = request.form.get("product_id", type=int)
+        if product_id is None or db.session.get(Product, product_id) is None:
+            flash("Выберите товар из подсказок", "error")
+            return redirect(url_for("main.add_operation_view"))
         try:
-            d1 = datetime.strptime(df, "%Y-%m-%d")
-            query = query.filter(func.date(Operation.date) >= d1.date())
-        except:
-            pass
+            _, quantity_after = book_operation(
+                product_id=product_id,
+                op_type=request.form["type"],
+                quantity=int(request.form["quantity"]),
+                date=datetime.strptime(request.form["date"], "%Y-%m-%d"),
+                from_wh=request.form.get("from_wh"),
+                to_wh=request.form.get("to_wh"),
+                responsible=request.form.get("responsible"),
+                note=request.form.get("note")
+            )
+        except LedgerError as e:
+            flash(str(e), "error")
+            return redirect(url_for("main.add_operation_view"))
 
-    if dt:
-        try:
-            d2 = datetime.strptime(dt, "%Y-%m-%d")
-            query = query.filter(func.date(Operation.date) <= d2.date())
-        except:
-            pass
+        flash("Операция добавлена", "success")
+        if quantity_after < 0 and negative_stock_policy() == "flag":
+            flash(f"Внимание: остаток ушёл в минус ({quantity_after})", "warning")
+        return redirect(url_for("main.operations"))
 
-    ops = query.order_by(Operation.date.desc()).all()
-    return render_template("operations_list.html", operations=ops)
+    # Каталог в форму не грузим: товар выбирается через /api/products/suggest
+    return render_template("add_operation.html")
 
 
-@bp.route("/operations/add", methods=["GET", "POST"])
-def add_operation_view():
-    if request.method == "POST":
-        pid = int(request.form["product_id"])
-        op_type = request.form["type"]
-        qty = int(request.form["quantity"])
-
-        op = Operation(
-            product_id=pid,
-            type=op_type,
-            quantity=qty,
-            date=datetime.strptime(request.form["date"], "%Y-%m-%d"),
-            from_wh=request.form.get("from_wh"),
-            to_wh=request.form.get("to_wh"),
-            responsible=request.form.get("responsible"),
-            note=request.form.get("note")
-        )
+@bp.route("/api/products/suggest")
+def api_product_suggest():
+    items = suggest(request.args.get("q", ""), request.args.get("limit", type=int))
+    return jsonify(items=items)
 
-        db.session.add(op)
 
-        stock = Stock.query.filter_by(product_id=pid).first()
+# Сканер штрихкодов: товар, поставщик и остатки по точному артикулу
+@bp.route("/api/scan/<path:sku>")
+def api_scan(sku):
+    product = scanner.lookup(sku)
+    if product is None:
+        return jsonify(error=f"Товар с артикулом {sku} не найден"), 404
+    return jsonify(scanner.to_dict(product))
 
-        if op_type == "in":
-            stock.quantity += qty
-        elif op_type == "out":
-            stock.quantity -= qty
-        elif op_type == "adjust":
-            stock.quantity -= qty
 
-        db.session.commit()
+# Пакетная загрузка: тело запроса — CSV (text/csv) или NDJSON (application/x-ndjson)
+@bp.route("/operations/bulk", methods=["POST"])
+def bulk_operations():
+    fmt = request.args.get("format")
+    if not fmt:
+        fmt = "csv" if request.mimetype == "text/csv" else "ndjson"
+    if fmt not in INGEST_FORMATS:
+        return jsonify(error=f"Неизвестный формат: {fmt}"), 400
 
-        flash("Операция добавлена", "success")
-        return redirect(url_for("main.operations"))
+    report = ingest_operations(request.stream, fmt)
+    return jsonify(report.to_dict())
+
+
+# ---------------- Экспорт ----------------
+def _export_response(stmt, name):
+    fmt = request.args.get("format", "csv")
+    if fmt not in export.FORMATS:
+        return jsonify(error=f"Неизвестный формат: {fmt}"), 400
+    compress = request.args.get("gzip") == "1"
+
+    chunks = export.iter_rows(stmt, fmt, current_app.config.get("EXPORT_BATCH_SIZE", 1000))
+    filename = f"{name}.{fmt}" + (".gz" if compress else "")
+    return Response(
+        stream_with_context(export.encode(chunks, compress)),
+        mimetype="application/gzip" if compress else export.MIMETYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+# POST — выгрузка файлом фоновой задачей (те же параметры в адресе), забирать с /jobs/<id>/result
+def _export_job(kind, **filters):
+    fmt = request.args.get("format", "csv")
+    if fmt not in export.FORMATS:
+        return jsonify(error=f"Неизвестный формат: {fmt}"), 400
+    job = jobs.enqueue("export", kind=kind, format=fmt, gzip=request.args.get("gzip") == "1",
+                       **filters)
+    return _job_accepted(job)
 
-    return render_template("add_operation.html",
-                           products=Product.query.all())
+
+@bp.route("/export/operations", methods=["GET", "POST"])
+def export_operations():
+    d1 = _parse_day(request.args.get("from"))
+    d2 = _parse_day(request.args.get("to"))
+    d2 = d2 + timedelta(days=1) if d2 else None
+    product_id = request.args.get("product_id", type=int)
+
+    if request.method == "POST":
+        return _export_job("operations", date_from=d1 and d1.isoformat(),
+                           date_to=d2 and d2.isoformat(), product_id=product_id)
+    stmt = export.operations_query(d1, d2, product_id)
+    return _export_response(stmt, "operations")
+
+
+@bp.route("/export/stock", methods=["GET", "POST"])
+def export_stock():
+    if request.method == "POST":
+        return _export_job("stock")
+    return _export_response(export.stock_query(), "stock")
+
+
+# ---------------- Фоновые задачи ----------------
+def _job_accepted(job):
+    resp = jsonify(jobs.to_dict(job))
+    resp.status_code = 202
+    resp.headers["Location"] = url_for("main.job_status", job_id=job.id)
+    return resp
+
+
+# Тело — JSON с аргументами задачи, например {"write": true} для reconcile
+@bp.route("/jobs/<name>", methods=["POST"])
+def enqueue_job(name):
+    fn = jobs.TASKS.get(name)
+    if fn is None or not fn.http:
+        return jsonify(error=f"Неизвестная задача: {name}"), 404
+    args = request.get_json(silent=True) or {}
+    if not isinstance(args, dict):
+        return jsonify(error="Аргументы задачи — JSON-объект"), 400
+    try:
+        job = jobs.enqueue(name, **args)
+    except TypeError as e:
+        return jsonify(error=f"Неверные аргументы задачи: {e}"), 400
+    return _job_accepted(job)
+
+
+@bp.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify(error="Задача не найдена"), 404
+    data = jobs.to_dict(job)
+    if jobs.result_file(job):
+        data["result_url"] = url_for("main.job_result", job_id=job_id)
+    return jsonify(data)
+
+
+@bp.route("/jobs/<int:job_id>/result")
+def job_result(job_id):
+    job = db.session.get(Job, job_id)
+    name = job and jobs.result_file(job)
+    if not name:
+        return jsonify(error="У задачи нет готового файла-результата"), 404
+    return send_from_directory(current_app.config["JOBS_DIR"], name, as_attachment=True)
 
 
 # ---------------- Минимальные остатки ----------------
 @bp.route("/stock/low")
+@versions.conditional("stocks", "products", "suppliers")
+@replicas.reads("stocks", "products", "suppliers")
 def stock_low():
-    items = Stock.query.filter(Stock.quantity <= Stock.min_stock).all()
-    return render_template("stock_low.html", stocks=items)
+    warehouse = request.args.get("warehouse") or None
+    page = keyset_page(
+        warehouses.low_stock_query(warehouse),
+        warehouses.LOW_STOCK_ORDER,
+        lambda s: (s.deficit, s.id),
+        parse_per_page(request.args.get("per_page")),
+        after=decode_cursor(request.args.get("after"), warehouses.LOW_STOCK_CURSOR),
+        before=decode_cursor(request.args.get("before"), warehouses.LOW_STOCK_CURSOR),
+    )
+    filters = {k: request.args[k] for k in ("warehouse", "per_page") if request.args.get(k)}
+    return render_template("stock_low.html", stocks=page.items, page=page, filters=filters,
+                           warehouse=warehouse, warehouses=warehouses.warehouse_names())
+
+
+# Изменения остатков для открытых страниц (Server-Sent Events)
+@bp.route("/events/stock")
+def stock_events():
+    q = events.open_stream()
+    if q is None:
+        # Все места под потоки заняты: держать ещё один поток воркера нельзя
+        return Response("Слишком много открытых потоков событий", status=503,
+                        mimetype="text/plain", headers={"Retry-After": "60"})
+    resp = Response(stream_with_context(events.stream(q)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Генератор, закрытый до первого куска, не дойдёт до своего finally
+    resp.call_on_close(lambda: events.broker.unsubscribe(q))
+    return resp
+
+
+@bp.route("/stock/warehouses")
+def stock_by_warehouse():
+    return render_template("warehouses.html", totals=warehouses.warehouse_totals())
+
+
+# ---------------- Остатки на дату ----------------
+def _as_of_args():
+    """Разбирает date/at/product_id/warehouse; ValueError при неверной дате."""
+    raw_day = request.args.get("date")
+    day = datetime.strptime(raw_day, "%Y-%m-%d").date() if raw_day else datetime.utcnow().date()
+    raw_at = request.args.get("at")
+    until = datetime.combine(day, datetime.strptime(raw_at, "%H:%M").time()) if raw_at else None
+    return day, until, request.args.get("product_id", type=int), request.args.get("warehouse") or None
+
+
+@bp.route("/stock/asof")
+def stock_as_of():
+    try:
+        day, until, product_id, warehouse = _as_of_args()
+    except ValueError:
+        flash("Неверная дата или время", "error")
+        return redirect(url_for("main.stock_as_of"))
+
+    balances = rollup.stock_as_of(day, until, product_id, warehouse)
+    products = {p.id: p for p in Product.query.filter(Product.id.in_({pid for pid, _ in balances}))}
+    rows = [(products.get(pid), wh, qty) for (pid, wh), qty in sorted(balances.items())]
+    return render_template("stock_asof.html", rows=rows, day=day)
+
+
+@bp.route("/api/stock/asof")
+def api_stock_as_of():
+    try:
+        day, until, product_id, warehouse = _as_of_args()
+    except ValueError:
+        return jsonify(error="Неверная дата или время"), 400
+
+    balances = rollup.stock_as_of(day, until, product_id, warehouse)
+    return jsonify(date=day.isoformat(), at=until.isoformat() if until else None, items=[
+        {"product_id": pid, "warehouse": wh, "quantity": qty}
+        for (pid, wh), qty in sorted(balances.items())
+    ])
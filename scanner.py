@@ -0,0 +1,70 @@
+"""Поиск товара по артикулу для сканеров штрихкодов.
+
+Артикул переводится в id через карту процесса (LRU на SKU_MAP_SIZE
+артикулов), затем товар, поставщик и остатки читаются одним запросом по
+первичному ключу. Карта чистится при изменении и удалении товаров в этом
+процессе; в других процессах устаревшая запись ловится сверкой артикула
+загруженного товара и тут же перечитывается по уникальному индексу sku.
+"""
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import joinedload
+
+from models import db, Product
+from cache import LocalCache
+
+# Карта sku -> id; записи не устаревают по времени, только вытесняются и чистятся
+sku_map = LocalCache(100_000, float("inf"))
+
+
+def init_app(app):
+    global sku_map
+    sku_map = LocalCache(app.config.get("SKU_MAP_SIZE", 100_000), float("inf"))
+
+
+@event.listens_for(Product, "after_update")
+def _forget_renamed(mapper, connection, target):
+    history = inspect(target).attrs.sku.history
+    sku_map.delete(*history.deleted)
+
+
+@event.listens_for(Product, "after_delete")
+def _forget_deleted(mapper, connection, target):
+    sku_map.delete(target.sku)
+
+
+def _load(product_id):
+    return (Product.query
+            .options(joinedload(Product.stocks), joinedload(Product.supplier))
+            .filter(Product.id == product_id)
+            .one_or_none())
+
+
+def lookup(sku):
+    """Товар с поставщиком и остатками по артикулу или None."""
+    product_id = sku_map.get(sku)
+    if product_id is not None:
+        product = _load(product_id)
+        if product is not None and product.sku == sku:
+            return product
+        sku_map.delete(sku)
+
+    product_id = db.session.execute(select(Product.id).where(Product.sku == sku)).scalar()
+    if product_id is None:
+        return None
+    sku_map.set(sku, product_id)
+    return _load(product_id)
+
+
+def to_dict(product):
+    supplier = product.supplier
+    return {
+        "id": product.id,
+        "sku": product.sku,
+        "name": product.name,
+        "category": product.category,
+        "unit": product.unit,
+        "supplier": {"id": supplier.id, "name": supplier.name} if supplier else None,
+        "stocks": [{"warehouse": s.warehouse, "quantity": s.quantity, "min_stock": s.min_stock}
+                   for s in product.stocks],
+        "total": sum(s.quantity for s in product.stocks),
+    }
@@ -0,0 +1,198 @@
+"""Полнотекстовый поиск товаров на SQLite FTS5.
+
+products_fts — external content таблица над products: хранит только индекс,
+а триггеры держат его в синхронизации с products. Если FTS5 нет (другая СУБД
+или сборка SQLite без модуля), поиск работает по-старому, через LIKE.
+
+Автодополнение (suggest) отдаёт не больше AUTOCOMPLETE_LIMIT товаров по
+префиксу: диапазон по индексу sku плюс префиксный запрос FTS по названию.
+Ответы для частых префиксов держит LRU процесса.
+"""
+import logging
+import weakref
+
+from flask import current_app
+from sqlalchemy import column, event, inspect, table, text
+from sqlalchemy.engine import Engine
+
+from models import db, Product
+from cache import LocalCache
+
+log = logging.getLogger(__name__)
+
+FTS_TABLE = "products_fts"
+
+CREATE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, sku, category, content='products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, sku, category) "
+    "VALUES (new.id, new.name, new.sku, new.category); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, sku, category) "
+    "VALUES ('delete', old.id, old.name, old.sku, old.category); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, sku, category) "
+    "VALUES ('delete', old.id, old.name, old.sku, old.category); "
+    "INSERT INTO products_fts(rowid, name, sku, category) "
+    "VALUES (new.id, new.name, new.sku, new.category); END",
+)
+
+DROP_FTS = (
+    "DROP TRIGGER IF EXISTS products_fts_ai",
+    "DROP TRIGGER IF EXISTS products_fts_ad",
+    "DROP TRIGGER IF EXISTS products_fts_au",
+    "DROP TABLE IF EXISTS products_fts",
+)
+
+REBUILD_FTS = "INSERT INTO products_fts(products_fts) VALUES ('rebuild')"
+
+fts = table(FTS_TABLE, column("rowid"), column("rank"))
+
+# Движок -> есть ли в его базе products_fts (проверяем один раз на движок)
+_available: weakref.WeakKeyDictionary[Engine, bool] = weakref.WeakKeyDictionary()
+
+
+def fts5_supported(connection):
+    if connection.dialect.name != "sqlite":
+        return False
+    return bool(connection.exec_driver_sql(
+        "SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+
+@event.listens_for(Product.__table__, "after_create")
+def create_fts(target, connection, **kw):
+    if not fts5_supported(connection):
+        log.warning("FTS5 недоступен — поиск товаров будет через LIKE")
+        return
+    for stmt in CREATE_FTS:
+        connection.exec_driver_sql(stmt)
+    _available.pop(connection.engine, None)
+
+
+@event.listens_for(Product.__table__, "before_drop")
+def drop_fts(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        for stmt in DROP_FTS:
+            connection.exec_driver_sql(stmt)
+    _available.pop(connection.engine, None)
+
+
+def fts_available():
+    engine = db.engine
+    if engine not in _available:
+        _available[engine] = inspect(engine).has_table(FTS_TABLE)
+    return _available[engine]
+
+
+def _terms(value):
+    # Каждое слово — префиксный запрос; кавычки внутри экранируются удвоением
+    return " ".join('"%s"*' % t.replace('"', '""') for t in value.split())
+
+
+def _match_expression(q, category):
+    parts = []
+    if q.strip():
+        parts.append("{name sku} : (%s)" % _terms(q))
+    if category.strip():
+        parts.append("category : (%s)" % _terms(category))
+    return " AND ".join(parts)
+
+
+def search_products(query, q="", category=""):
+    """Накладывает на query по Product фильтры поиска по q и категории.
+
+    Точное совпадение артикула возвращается сразу, иначе — результаты FTS,
+    отсортированные по релевантности и ограниченные SEARCH_RESULT_LIMIT.
+    """
+    q = q.strip()
+    category = category.strip()
+    if not q and not category:
+        return query
+
+    if not fts_available():
+        if q:
+            query = query.filter(Product.name.contains(q) | Product.sku.contains(q))
+        if category:
+            query = query.filter(Product.category.contains(category))
+        return query
+
+    # Быстрый путь для сканера/ввода артикула целиком — поиск по индексу sku
+    if q and not category and len(q.split()) == 1:
+        exact = query.filter(Product.sku == q)
+        if db.session.query(exact.exists()).scalar():
+            return exact
+
+    limit = current_app.config.get("SEARCH_RESULT_LIMIT", 200)
+    return (query
+            .join(fts, fts.c.rowid == Product.id)
+            .filter(text("products_fts MATCH :match").bindparams(
+                match=_match_expression(q, category)))
+            .order_by(fts.c.rank)
+            .limit(limit))
+
+
+# ---------------- Автодополнение ----------------
+# Префикс -> подсказки; пересоздаётся в init_app по настройкам приложения
+suggestions = LocalCache(2048, 60)
+
+
+def init_app(app):
+    global suggestions
+    suggestions = LocalCache(app.config.get("AUTOCOMPLETE_CACHE_SIZE", 2048),
+                             app.config.get("AUTOCOMPLETE_CACHE_TTL", 60))
+
+
+@event.listens_for(Product, "after_insert")
+@event.listens_for(Product, "after_update")
+@event.listens_for(Product, "after_delete")
+def _forget_suggestions(mapper, connection, target):
+    # В других процессах подсказки устареют не дольше чем на AUTOCOMPLETE_CACHE_TTL
+    suggestions.clear()
+
+
+def _sku_prefix(prefix, limit):
+    # Диапазон [prefix, prefix + U+FFFF) идёт по индексу sku, в отличие от LIKE
+    return (db.session.query(Product.id, Product.name, Product.sku)
+            .filter(Product.sku >= prefix, Product.sku < prefix + "\uffff")
+            .order_by(Product.sku)
+            .limit(limit)
+            .all())
+
+
+def _name_prefix(prefix, limit):
+    query = db.session.query(Product.id, Product.name, Product.sku)
+    if not fts_available():
+        return query.filter(Product.name.startswith(prefix)).order_by(Product.name).limit(limit).all()
+    return (query
+            .join(fts, fts.c.rowid == Product.id)
+            .filter(text("products_fts MATCH :match").bindparams(
+                match="{name sku} : (%s)" % _terms(prefix)))
+            .order_by(fts.c.rank)
+            .limit(limit)
+            .all())
+
+
+def suggest(prefix, limit=None):
+    """Подсказки по префиксу артикула или названия: [{id, name, sku}, ...].
+
+    Сначала товары с артикулом на prefix (по алфавиту), затем совпадения
+    по словам названия (по релевантности).
+    """
+    prefix = " ".join(prefix.split())
+    max_limit = current_app.config.get("AUTOCOMPLETE_LIMIT", 10)
+    limit = max(1, min(limit or max_limit, max_limit))
+    if not prefix:
+        return []
+
+    key = (prefix, limit)
+    items = suggestions.get(key)
+    if items is None:
+        rows = _sku_prefix(prefix, limit)
+        if len(rows) < limit:
+            seen = {r.id for r in rows}
+            rows += [r for r in _name_prefix(prefix, limit) if r.id not in seen]
+        items = [{"id": r.id, "name": r.name, "sku": r.sku} for r in rows[:limit]]
+        suggestions.set(key, items)
+    return items
@@ -0,0 +1,104 @@
+"""Боевой запуск приложения под gunicorn.
+
+    python serve.py --workers 4 --threads 4 --bind 0.0.0.0:5000
+
+Приложение создаётся один раз в мастер-процессе (preload) и наследуется
+воркерами через fork. Унаследованные соединения с БД после fork не
+используем: post_fork сбрасывает пулы движков, и каждый воркер открывает
+свои. По SIGTERM воркеры дообрабатывают текущие запросы в пределах
+--graceful-timeout.
+
+Поток событий /events/stock (SSE) держит поток воркера до
+EVENTS_MAX_DURATION секунд, поэтому на процесс их не больше --max-streams —
+по умолчанию половина --threads, остальное остаётся обычным запросам.
+Лишние подключения получают 503 и повторяются позже. Если живых страниц
+нужно больше, поднимите --threads или отдайте /events/ отдельному
+экземпляру serve.py с большим числом потоков.
+
+Параметры по умолчанию берутся из переменных окружения WEB_WORKERS,
+WEB_THREADS, WEB_BIND, WEB_TIMEOUT, WEB_GRACEFUL_TIMEOUT, WEB_MAX_STREAMS.
+"""
+import argparse
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from app import create_app
+from models import db
+
+
+def default_workers():
+    return int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+
+
+def max_streams(args):
+    """Сколько потоков воркера можно занять под SSE; при sync-воркере — ни одного."""
+    if args.max_streams is not None:
+        return args.max_streams
+    return args.threads // 2
+
+
+def post_fork(server, worker):
+    # Соединения пула открыты мастером: закрываем их копии, не трогая сокеты родителя
+    with server.app.application.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+class WarehouseApplication(BaseApplication):
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def options_from_args(args):
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        # При threads > 1 gunicorn сам выбирает gthread
+        "worker_class": "gthread" if args.threads > 1 else "sync",
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "keepalive": 5,
+        # Периодический перезапуск воркеров ограничивает рост памяти
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "preload_app": True,
+        "post_fork": post_fork,
+        "accesslog": "-",
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bind", default=os.environ.get("WEB_BIND", "0.0.0.0:5000"))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("WEB_THREADS", 2)))
+    parser.add_argument("--timeout", type=int, default=int(os.environ.get("WEB_TIMEOUT", 30)))
+    parser.add_argument("--graceful-timeout", type=int,
+                        default=int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30)))
+    parser.add_argument("--max-requests", type=int, default=10000)
+    parser.add_argument("--max-streams", type=int,
+                        default=int(os.environ["WEB_MAX_STREAMS"]) if "WEB_MAX_STREAMS" in os.environ else None)
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    app.config["EVENTS_MAX_STREAMS"] = max_streams(args)
+    with app.app_context():
+        db.create_all()
+
+    WarehouseApplication(app, options_from_args(args)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+// Живые обновления остатков: страница подписывается на /events/stock и
+// правит свои строки и счётчики на месте, без перезагрузки и без запросов к базе.
+(function () {
+    var script = document.currentScript;
+    if (!window.EventSource || !script) return;
+    var url = script.dataset.url;
+
+    // Ответ не 200 (503 — у сервера нет мест под потоки) браузер не повторяет сам
+    function connect() {
+        var source = new EventSource(url);
+        source.addEventListener("stock", onChange);
+        source.onerror = function () {
+            if (source.readyState === EventSource.CLOSED) setTimeout(connect, 60000);
+        };
+    }
+
+    function onChange(e) {
+        var change = JSON.parse(e.data);
+
+        // Главная: число товаров с критическим остатком
+        var counter = document.getElementById("low-count");
+        if (counter && change.low) {
+            counter.textContent = counter.textContent.replace(/\d+$/, function (n) {
+                return parseInt(n, 10) + change.low;
+            });
+        }
+
+        // Малый остаток: строка (товар, склад), если она на странице. Таблицы
+        // нет, когда список пуст, а подсказка об обновлении есть всегда
+        var notice = document.getElementById("low-stock-new");
+        if (!notice) return;
+        var filter = notice.dataset.warehouse;
+        if (filter && filter !== change.warehouse) return;
+        var table = document.getElementById("low-stock");
+        var row = null;
+        if (table) {
+            table.querySelectorAll("tbody tr").forEach(function (tr) {
+                if (tr.dataset.product === String(change.product_id) &&
+                    tr.dataset.warehouse === change.warehouse) row = tr;
+            });
+        }
+        if (row) {
+            row.querySelector(".quantity").textContent = change.quantity;
+            row.querySelector(".min-stock").textContent = change.min_stock;
+            row.querySelector(".deficit").textContent = change.min_stock - change.quantity;
+            row.classList.toggle("resolved", change.quantity > change.min_stock);
+        } else if (change.low > 0) {
+            notice.hidden = false;
+        }
+    }
+
+    connect();
+})();
@@ -0,0 +1,93 @@
+import csv
+import io
+from datetime import date, datetime
+
+from sqlalchemy import func
+
+import archive
+import rollup
+from ledger import book_operation
+from models import db, Stock, Operation, OperationArchive, OpeningBalance, StockDaily
+
+
+def _history(pid):
+    for day in range(1, 11):
+        book_operation(pid, "in", day, datetime(2024, 1, day, 12))
+    book_operation(pid, "transfer", 5, datetime(2024, 1, 3, 13), to_wh="Северный")
+    book_operation(pid, "out", 2, datetime(2024, 1, 9, 13))
+
+
+def test_archive_folds_into_opening_balances(app, sample_data):
+    pid = sample_data["product"].id
+    _history(pid)
+    stocks = {s.warehouse: s.quantity for s in Stock.query}
+    daily = {(r.warehouse, r.day): r.balance for r in StockDaily.query}
+
+    moved = archive.archive_operations(datetime(2024, 1, 6), batch_size=2)
+
+    assert moved == 6
+    assert Operation.query.count() == 6
+    assert OperationArchive.query.count() == 6
+    assert archive.horizon() == datetime(2024, 1, 5, 12)
+    # Остаток = начальный (10 из фикстуры) + входящий + горячий журнал
+    opening = {o.warehouse: o.quantity for o in OpeningBalance.query}
+    assert opening == {"Основной": 1 + 2 + 3 + 4 + 5 - 5, "Северный": 5}
+    moves = archive.ledger.movements_select().subquery()
+    hot = dict(db.session.execute(db.select(moves.c.warehouse, func.sum(moves.c.delta))
+                                  .group_by(moves.c.warehouse)).all())
+    assert {wh: 10 * (wh == "Основной") + opening[wh] + hot.get(wh, 0) for wh in opening} == stocks
+
+    # Свёртка пересобирается и с архивом
+    rollup.rebuild()
+    db.session.commit()
+    assert {(r.warehouse, r.day): r.balance for r in StockDaily.query} == daily
+    assert rollup.stock_as_of(date(2024, 1, 3), until=datetime(2024, 1, 3, 12, 30)) == {
+        (pid, "Основной"): 6}
+
+
+def _ids(html):
+    return [int(line.split("<td>")[1].split("</td>")[0])
+            for line in html.split("<tr>")[2:] if "<td>" in line]
+
+
+def test_operations_list_unions_archive_only_when_needed(client, app, sample_data):
+    pid = sample_data["product"].id
+    _history(pid)
+    all_ids = [o.id for o in Operation.query.order_by(Operation.date.desc(), Operation.id.desc())]
+    archive.archive_operations(datetime(2024, 1, 6))
+    # Операция задним числом после архивации остаётся в горячей таблице
+    late, _ = book_operation(pid, "in", 1, datetime(2024, 1, 2, 18))
+    all_ids.insert(all_ids.index(OperationArchive.query.filter_by(
+        date=datetime(2024, 1, 2, 12)).one().id), late.id)
+
+    seen, url = [], "/operations?per_page=4"
+    while url:
+        html = client.get(url).get_data(as_text=True)
+        seen += _ids(html)
+        url = None
+        if "after=" in html:
+            url = "/operations?per_page=4&after=" + html.split("after=")[1].split('"')[0]
+    assert seen == all_ids
+
+    hot_only = client.get("/operations?from=2024-01-08")
+    assert len(_ids(hot_only.get_data(as_text=True))) == 4
+    assert hot_only.headers["X-Query-Count"] == "2"
+
+    rows = list(csv.DictReader(io.StringIO(
+        client.get("/export/operations?from=2024-01-02&to=2024-01-03").get_data(as_text=True))))
+    assert [r["date"] for r in rows] == ["2024-01-02T12:00:00", "2024-01-02T18:00:00",
+                                         "2024-01-03T12:00:00", "2024-01-03T13:00:00"]
+
+
+def test_ids_are_not_reused_after_archive_empties_hot_table(app, sample_data):
+    pid = sample_data["product"].id
+    _history(pid)
+    last_id = db.session.execute(db.select(func.max(Operation.id))).scalar()
+    archive.archive_operations(datetime(2025, 1, 1))
+    assert Operation.query.count() == 0
+
+    op, _ = book_operation(pid, "in", 1, datetime(2024, 6, 1))
+    assert op.id == last_id + 1
+
+    assert archive.archive_operations(datetime(2025, 1, 1)) == 1
+    assert OperationArchive.query.count() == last_id + 1
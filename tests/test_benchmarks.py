@@ -0,0 +1,86 @@
+import json
+
+from sqlalchemy import func
+
+from benchmarks import datagen, run
+from benchmarks.run import compare, run_benchmarks
+from ledger import movements, movements_select
+from models import db, Product, Stock, Operation
+
+
+def _fingerprint():
+    return (Product.query.count(), Operation.query.count(),
+            db.session.query(func.sum(Stock.quantity)).scalar())
+
+
+def test_datagen_is_deterministic_and_consistent(app):
+    sizes = datagen.generate("1k", seed=7, products=40, suppliers=3, ops_per_product=6)
+    first = _fingerprint()
+
+    assert sizes["products"] == 40
+    assert first[1] == sizes["operations"]
+    # Остатки по складам совпадают с журналом
+    moves = movements_select().subquery()
+    ledger_balances = {(pid, wh): total for pid, wh, total in db.session.execute(
+        db.select(moves.c.product_id, moves.c.warehouse, func.sum(moves.c.delta))
+        .group_by(moves.c.product_id, moves.c.warehouse))}
+    assert {(s.product_id, s.warehouse): s.quantity for s in Stock.query} == ledger_balances
+    assert Operation.query.filter_by(type="transfer").count() > 0
+    assert Stock.query.filter(Stock.quantity < 0).count() == 0
+    # И в хронологическом порядке история нигде не уходит в минус
+    running = {}
+    for op in Operation.query.order_by(Operation.date, Operation.id):
+        for wh, delta in movements(op.type, op.quantity, op.from_wh, op.to_wh):
+            running[(op.product_id, wh)] = running.get((op.product_id, wh), 0) + delta
+            assert running[(op.product_id, wh)] >= 0
+
+    db.drop_all()
+    db.create_all()
+    datagen.generate("1k", seed=7, products=40, suppliers=3, ops_per_product=6)
+    assert _fingerprint() == first
+
+
+def test_run_benchmarks_covers_routes(app):
+    datagen.generate("1k", seed=1, products=20, suppliers=2, ops_per_product=4)
+
+    results, uncovered = run_benchmarks(app, repeat=2, warmup=0)
+
+    assert uncovered == []
+    for name in ("/products", "/operations", "/stock/low"):
+        assert results[name]["status"] == 200
+        assert set(results[name]) >= {"p50_ms", "p95_ms", "queries", "peak_kib"}
+
+
+def test_compare_flags_regressions():
+    baseline = {"/products": {"p50_ms": 10, "p95_ms": 20, "queries": 2, "peak_kib": 100}}
+    current = {"/products": {"p50_ms": 11, "p95_ms": 40, "queries": 2, "peak_kib": 100}}
+
+    assert compare(current, baseline) == [{"scenario": "/products", "metric": "p95_ms",
+                                           "baseline": 20, "current": 40, "ratio": 2.0}]
+
+
+def test_reused_db_is_measured_on_a_fresh_copy(tmp_path, monkeypatch):
+    monkeypatch.setitem(datagen.SCALES, "1k", {"suppliers": 2, "products": 10,
+                                               "ops_per_product": 2, "years": 1})
+    seen = []
+
+    def fake_benchmarks(app, repeat):
+        # Сценарии с записью: каждый прогон добавляет товары
+        with app.app_context():
+            seen.append(Product.query.count())
+            db.session.add(Product(name="Бенч", sku=f"BENCH-{len(seen)}"))
+            db.session.commit()
+        return {}, []
+
+    monkeypatch.setattr(run, "run_benchmarks", fake_benchmarks)
+    path = str(tmp_path / "seed.db")
+    reports = []
+    for _ in range(2):
+        out = tmp_path / "bench.json"
+        assert run.main(["--db", path, "--seed", "5", "--out", str(out)]) == 0
+        reports.append(json.loads(out.read_text(encoding="utf-8"))["meta"])
+
+    assert seen == [10, 10]
+    assert [m["dataset"]["reused"] for m in reports] == [False, True]
+    assert all((m["scale"], m["seed"]) == ("1k", 5) for m in reports)
+    assert reports[1]["dataset"]["products"] == 10
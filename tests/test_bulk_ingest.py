@@ -0,0 +1,116 @@
+import json
+
+from models import Stock, Operation
+
+
+def test_bulk_csv_ingest(client, sample_data):
+    p = sample_data["product"]
+    body = "\n".join([
+        "product_id,sku,type,quantity,date,from_wh,to_wh,responsible",
+        f"{p.id},,in,5,2025-01-01,,Основной,Иванов",
+        ",SKU123,out,2,2025-01-02T10:30:00,Основной,,",
+        ",NOPE,in,1,2025-01-02,,,",
+        f"{p.id},,in,abc,2025-01-02,,,",
+        f"{p.id},,gift,1,2025-01-02,,,",
+    ])
+
+    resp = client.post("/operations/bulk", data=body.encode(), content_type="text/csv")
+    report = resp.get_json()
+
+    assert resp.status_code == 200
+    assert report["accepted"] == 2
+    assert report["rejected"] == 3
+    assert [e["line"] for e in report["errors"]] == [4, 5, 6]
+    assert Stock.query.filter_by(product_id=p.id).first().quantity == 13
+    assert Operation.query.count() == 2
+
+
+def test_bulk_ndjson_ingest_is_batched(client, app, sample_data):
+    app.config["BULK_BATCH_SIZE"] = 500
+    p = sample_data["product"]
+    lines = [json.dumps({"sku": "SKU123", "type": "in", "quantity": 1, "date": "2025-01-01"})
+             for _ in range(2000)]
+    lines.insert(10, "{not json")
+
+    resp = client.post("/operations/bulk", data="\n".join(lines).encode(),
+                       content_type="application/x-ndjson")
+    report = resp.get_json()
+
+    assert report["accepted"] == 2000
+    assert report["errors"] == [{"line": 11, "error": "строка не является JSON-объектом"}]
+    assert Stock.query.filter_by(product_id=p.id).first().quantity == 2010
+    # Четыре пачки по несколько запросов, а не тысячи запросов на строки
+    assert int(resp.headers["X-Query-Count"]) <= 4 * 6
+
+
+def test_bulk_reject_policy_is_per_line(client, app, sample_data):
+    app.config["NEGATIVE_STOCK_POLICY"] = "reject"
+    p = sample_data["product"]
+    body = "\n".join([
+        "product_id,type,quantity,date",
+        f"{p.id},out,8,2025-01-01",
+        f"{p.id},out,8,2025-01-01",
+        f"{p.id},in,1,2025-01-01",
+    ])
+
+    report = client.post("/operations/bulk", data=body.encode(), content_type="text/csv").get_json()
+
+    assert report["accepted"] == 2
+    assert report["errors"][0]["line"] == 3
+    assert Stock.query.filter_by(product_id=p.id).first().quantity == 3
+
+
+def test_bulk_ingest_rejects_lines_that_are_not_utf8(client, sample_data):
+    p = sample_data["product"]
+    good = f"{p.id},,in,5,2025-01-01,,,".encode()
+    body = b"\n".join([b"\xef\xbb\xbfproduct_id,sku,type,quantity,date,from_wh,to_wh",
+                       good, b"\xff\xfe,,in,1,2025-01-01,,,", good])
+    resp = client.post("/operations/bulk", data=body, content_type="text/csv")
+
+    assert resp.status_code == 200
+    report = resp.get_json()
+    assert report["accepted"] == 2
+    assert report["errors"] == [{"line": 3, "error": "строка не в кодировке UTF-8"}]
+
+    line = json.dumps({"product_id": p.id, "type": "in", "quantity": 1}).encode()
+    resp = client.post("/operations/bulk", data=b"\n".join([line, b'{"note": "\xc3"}', line]),
+                       content_type="application/x-ndjson")
+    assert resp.get_json()["accepted"] == 2
+    assert resp.get_json()["errors"][0]["line"] == 2
+    assert Stock.query.filter_by(product_id=p.id).first().quantity == 10 + 10 + 2
+
+
+def test_bulk_ingest_rereads_stock_changed_after_the_check(client, app, sample_data, monkeypatch):
+    import ingest
+    from sqlalchemy import update
+    from models import db
+
+    app.config["NEGATIVE_STOCK_POLICY"] = "reject"
+    p = sample_data["product"]
+    apply = ingest._apply_stock_deltas
+    calls = []
+
+    def concurrent(stocks, deltas, policy):
+        if not calls:
+            # Параллельная проводка списала остаток и создала строку второго склада
+            db.session.execute(update(Stock).where(Stock.product_id == p.id).values(quantity=3))
+            db.session.add(Stock(product_id=p.id, warehouse="Второй", quantity=1, min_stock=0))
+            # Пачка до этого места ещё ничего не записала
+            db.session.commit()
+        calls.append(policy)
+        return apply(stocks, deltas, policy)
+
+    monkeypatch.setattr(ingest, "_apply_stock_deltas", concurrent)
+    body = "\n".join([
+        "product_id,type,quantity,date,to_wh",
+        f"{p.id},out,8,2025-01-01,",
+        f"{p.id},in,2,2025-01-01,Второй",
+    ])
+
+    report = client.post("/operations/bulk", data=body.encode(), content_type="text/csv").get_json()
+
+    assert len(calls) == 2
+    assert report["accepted"] == 1
+    assert report["errors"] == [{"line": 2, "error": f"недостаточно остатка товара {p.id} на складе Основной"}]
+    assert {s.warehouse: s.quantity for s in Stock.query.filter_by(product_id=p.id)} == {
+        "Основной": 3, "Второй": 3}
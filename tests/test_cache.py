@@ -0,0 +1,97 @@
+import pytest
+import redis
+
+from cache import Cache, CacheUnavailable, CircuitBreaker, LocalCache, cache
+
+
+def test_local_cache_is_lru_with_ttl(monkeypatch):
+    import cache as cache_module
+
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    local = LocalCache(maxsize=2, ttl=10)
+
+    local.set("a", 1)
+    local.set("b", 2)
+    local.get("a")
+    local.set("c", 3)
+    # "b" дольше всех не читали — вытеснен
+    assert local.get("b") is None
+    assert local.get("a") == 1
+
+    now[0] += 11
+    assert local.get("a") is None
+
+
+def test_circuit_breaker_opens_and_recovers(monkeypatch):
+    import cache as cache_module
+
+    now = [0.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    now[0] += 31
+    assert breaker.allow()
+    # Пока пробный запрос не завершился, остальные не проходят
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+
+
+def test_get_set_through_tiers(app):
+    cache.set("k", {"v": 1}, ttl=60)
+    assert cache.get("k") == {"v": 1}
+    assert cache.stats.local_hits == 1
+
+    cache.local.clear()
+    assert cache.get("k") == {"v": 1}
+    assert cache.stats.redis_hits == 1
+    assert cache.get("absent") is None
+    assert cache.stats.misses == 1
+
+
+def test_redis_errors_trip_breaker_and_degrade_to_local(app, monkeypatch):
+    calls = []
+
+    class Down:
+        def __getattr__(self, name):
+            def fail(*args, **kwargs):
+                calls.append(name)
+                raise redis.TimeoutError("slow")
+            return fail
+
+    monkeypatch.setattr(cache, "_redis", Down())
+    cache.breaker.threshold = 2
+
+    cache.set("k", 1)
+    assert cache.get("k") == 1  # из локального уровня
+    cache.local.clear()
+    assert cache.get("k") is None
+    assert cache.get("k") is None
+
+    assert len(calls) == 2
+    assert cache.get_stats()["breaker"] == "open"
+    assert cache.stats.skipped >= 1
+
+
+def test_local_backend_has_no_redis(app):
+    local_only = Cache()
+    app.config["CACHE_BACKEND"] = "local"
+    local_only.init_app(app)
+
+    local_only.set("k", 1)
+    assert local_only.get("k") == 1
+    with pytest.raises(CacheUnavailable):
+        local_only.call("ping")
+
+
+def test_cache_stats_endpoint(client):
+    data = client.get("/cache/stats").get_json()
+    assert data["backend"] == "memory"
+    assert data["breaker"] == "closed"
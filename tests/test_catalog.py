@@ -0,0 +1,141 @@
+import io
+import re
+
+import openpyxl
+import pytest
+from sqlalchemy import event
+
+import catalog
+from models import db, Product, Stock, Supplier
+
+
+def _csv(lines):
+    return ("sku,name,category,unit,supplier\n" + "\n".join(lines) + "\n").encode()
+
+
+def test_csv_import_creates_products_with_stock(client, app, sample_data, fake_redis):
+    client.get("/")
+    body = _csv([
+        "A-1,Анкер,Крепёж,шт,Test Supplier",
+        "A-2,Дюбель,Крепёж,шт,Новый поставщик",
+        ",Без артикула,,,",
+        "SKU123,Переименованный,Категория,шт,",
+        "A-2,Дюбель 6мм,Крепёж,шт,Новый поставщик",
+    ])
+    report = client.post("/products/import", data=body, content_type="text/csv").get_json()
+
+    assert report["created"] == 2
+    assert report["updated"] == 1
+    assert report["rejected"] == 1 and report["errors"][0]["line"] == 4
+
+    a1, a2 = Product.query.filter(Product.sku.in_(["A-1", "A-2"])).order_by(Product.sku)
+    assert a1.supplier_id == sample_data["supplier"].id
+    assert a2.name == "Дюбель 6мм" and a2.supplier.name == "Новый поставщик"
+    assert Supplier.query.count() == 2
+    assert [(s.warehouse, s.quantity) for s in a1.stocks] == [("Основной", 0)]
+    # У существующего товара остаток не трогаем
+    assert Stock.query.filter_by(product_id=sample_data["product"].id).one().quantity == 10
+    assert db.session.get(Product, sample_data["product"].id).name == "Переименованный"
+
+    # Счётчики главной: товары, поставщики, критические остатки (новые — с нулём)
+    assert re.findall(r": (\d+)</li>", client.get("/").get_data(as_text=True)) == ["3", "2", "2"]
+    names = [i["name"] for i in client.get("/api/products/suggest?q=A-").get_json()["items"]]
+    assert names == ["Анкер", "Дюбель 6мм"]
+
+
+def test_xlsx_import_is_batched(app):
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(["SKU", "Name", "Category"])
+    for i in range(25):
+        sheet.append([f"X-{i:02d}", f"Товар {i}", "Кат"])
+    sheet.append([None, None, None])
+    data = io.BytesIO()
+    book.save(data)
+
+    class Stream(io.RawIOBase):
+        # Тело HTTP-запроса: читается только вперёд
+        def __init__(self, raw):
+            self.raw = io.BytesIO(raw)
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            return self.raw.readinto(b)
+
+    seen = []
+    report = catalog.import_catalog(Stream(data.getvalue()), "xlsx", batch_size=10,
+                                    progress=lambda r: seen.append(r.accepted))
+    assert seen == [10, 20, 25]
+    assert report.created == 25 and report.rejected == 0
+    assert Stock.query.count() == 25
+
+
+def test_import_requires_known_format_and_valid_xlsx(client, app):
+    body = _csv(["A-1,Анкер,Крепёж,шт,"])
+    assert client.post("/products/import", data=body).status_code == 400
+    assert client.post("/products/import", data=body, content_type="application/json").status_code == 400
+    assert client.post("/products/import?format=csv", data=body).get_json()["created"] == 1
+
+    resp = client.post("/products/import", data=body, content_type=(
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"))
+    assert resp.status_code == 400
+    assert "XLSX" in resp.get_json()["error"]
+
+
+def test_sku_created_concurrently_is_counted_as_updated(client, app, fake_redis):
+    client.get("/")
+
+    @event.listens_for(db.engine, "before_cursor_execute")
+    def _concurrent_insert(conn, cursor, statement, parameters, context, executemany):
+        # Между проверкой артикулов и вставкой другой импорт успевает создать R-1
+        if statement.startswith("INSERT INTO products") and not getattr(conn, "_raced", False):
+            conn._raced = True
+            cursor.execute("INSERT INTO products (name, sku) VALUES ('Параллельный', 'R-1')")
+
+    try:
+        report = catalog.import_catalog(io.BytesIO(_csv(["R-1,Первый,,,", "R-2,Второй,,,"])), "csv")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _concurrent_insert)
+
+    assert (report.created, report.updated) == (1, 1)
+    assert Product.query.filter_by(sku="R-1").one().name == "Первый"
+    # Счётчик товаров вырос на вставленный импортом товар, без параллельного
+    assert re.findall(r": (\d+)</li>", client.get("/").get_data(as_text=True))[0] == "1"
+
+
+def test_partial_columns_keep_the_rest_of_the_product(client, sample_data):
+    p = sample_data["product"]
+    body = "sku,name\nSKU123,Новое имя\n".encode()
+    report = client.post("/products/import?format=csv", data=body).get_json()
+
+    assert report["updated"] == 1
+    product = db.session.get(Product, p.id)
+    assert product.name == "Новое имя"
+    assert (product.category, product.unit, product.description, product.supplier_id) == (
+        "Категория", "шт", "Описание", sample_data["supplier"].id)
+
+    # Присланная пустой колонка очищает значение
+    client.post("/products/import?format=csv", data="sku,name,category\nSKU123,Новое имя,\n".encode())
+    product = db.session.get(Product, p.id)
+    assert product.category is None and product.unit == "шт"
+
+
+def test_rolled_back_batch_leaves_no_new_suppliers_in_map(app, monkeypatch):
+    suppliers = catalog.SupplierMap()
+    monkeypatch.setattr(catalog, "SupplierMap", lambda: suppliers)
+
+    @event.listens_for(db.engine, "before_cursor_execute")
+    def _fail_stocks(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO stocks"):
+            raise RuntimeError("сбой посреди пачки")
+
+    try:
+        with pytest.raises(RuntimeError):
+            catalog.import_catalog(io.BytesIO(_csv(["S-1,Саморез,,,Новый"])), "csv")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _fail_stocks)
+
+    assert Supplier.query.filter_by(name="Новый").count() == 0
+    assert suppliers.get("Новый") is None
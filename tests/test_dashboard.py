@@ -0,0 +1,93 @@
+import counters
+from models import db, Stock
+
+
+def _counts(html):
+    import re
+    return [int(x) for x in re.findall(r": (\d+)</li>", html)]
+
+
+def test_dashboard_counts_on_first_view(client, sample_data):
+    html = client.get("/").get_data(as_text=True)
+    assert _counts(html) == [1, 1, 0]
+
+
+def test_write_paths_update_counters_without_recount(client, app, sample_data, fake_redis):
+    client.get("/")
+
+    client.post("/supplier/add", data={"name": "Новый поставщик"})
+    client.post("/product/add", data={"name": "Новый", "sku": "N1", "supplier": ""})
+    client.post("/operations/add", data={
+        "product_id": sample_data["product"].id, "type": "out", "quantity": 6, "date": "2025-01-01"
+    })
+
+    resp = client.get("/")
+    # Новый товар с нулевым остатком и списанный до 4 из 5 — оба критические
+    assert _counts(resp.get_data(as_text=True)) == [2, 2, 2]
+    assert resp.headers["X-Query-Count"] == "0"
+
+
+def test_rollback_discards_pending_deltas(client, app, sample_data):
+    client.get("/")
+
+    counters.record(products=5)
+    db.session.rollback()
+    db.session.commit()
+
+    assert counters.get_counters()["products"] == 1
+
+
+def test_reconcile_heals_drift(client, app, sample_data, fake_redis):
+    client.get("/")
+    fake_redis.hset(counters.COUNTERS_KEY, "low_stock", 7)
+
+    assert counters.reconcile() == {"low_stock": -7}
+    assert counters.get_counters() == {"products": 1, "suppliers": 1, "low_stock": 0}
+
+
+def test_single_flight_waits_for_recompute(app, sample_data, fake_redis, monkeypatch):
+    # Блокировку держит другой процесс: ждём его результат, а не считаем сами
+    fake_redis.set(counters.LOCK_KEY, "1")
+
+    def other_process_finishes(seconds):
+        fake_redis.hset(counters.COUNTERS_KEY, mapping={"products": 3, "suppliers": 2, "low_stock": 1})
+
+    monkeypatch.setattr(counters.time, "sleep", other_process_finishes)
+    monkeypatch.setattr(counters, "count_all", lambda: {"products": -1, "suppliers": -1, "low_stock": -1})
+
+    assert counters.get_counters() == {"products": 3, "suppliers": 2, "low_stock": 1}
+
+
+def test_redis_outage_falls_back_to_database(client, app, sample_data, monkeypatch):
+    import redis
+    from cache import cache
+
+    class Down:
+        def __getattr__(self, name):
+            def fail(*args, **kwargs):
+                raise redis.ConnectionError("down")
+            return fail
+
+    monkeypatch.setattr(cache, "_redis", Down())
+    stock = Stock.query.first()
+    stock.quantity = 1
+    db.session.commit()
+
+    assert counters.get_counters() == {"products": 1, "suppliers": 1, "low_stock": 1}
+    assert client.get("/").status_code == 200
+
+
+def test_idle_worker_reconciles_instead_of_dashboard(client, app, sample_data, fake_redis, tmp_path):
+    import jobs
+
+    app.config["JOBS_DIR"] = str(tmp_path)
+    client.get("/")
+    fake_redis.hset(counters.COUNTERS_KEY, "low_stock", 7)
+
+    # Главная только читает счётчики, пересчёт COUNT(*) в запросе не идёт
+    resp = client.get("/")
+    assert _counts(resp.get_data(as_text=True)) == [1, 1, 7]
+    assert resp.headers["X-Query-Count"] == "0"
+
+    jobs._maintain()
+    assert _counts(client.get("/").get_data(as_text=True)) == [1, 1, 0]
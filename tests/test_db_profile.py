@@ -0,0 +1,44 @@
+from sqlalchemy import text
+
+import db_profile
+from app import create_app
+from models import db
+
+
+def _file_app(tmp_path, **config):
+    return create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'profile.db'}",
+        "CACHE_BACKEND": "memory",
+        **config,
+    })
+
+
+def test_engine_options_by_url():
+    config = {"DB_POOL_SIZE": 4}
+    assert db_profile.engine_options("sqlite:///:memory:", config) == {}
+    assert db_profile.engine_options("sqlite:////tmp/x.db", config)["pool_size"] == 4
+    server = db_profile.engine_options("postgresql://u@h/db", config)
+    assert server["pool_pre_ping"] is True and server["pool_size"] == 4
+
+
+def test_file_sqlite_connections_get_pragmas(tmp_path):
+    app = _file_app(tmp_path, SQLITE_BUSY_TIMEOUT_MS=1234)
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 1234
+            assert conn.execute(text("PRAGMA temp_store")).scalar() == 2
+
+
+def test_optimizer_runs_once_per_interval(monkeypatch):
+    calls = []
+    monkeypatch.setattr(db_profile, "run_optimize", calls.append)
+    optimizer = db_profile.Optimizer(interval=60)
+
+    optimizer("conn", None)
+    optimizer.last_run -= 61
+    optimizer("conn", None)
+    optimizer("conn", None)
+    assert calls == ["conn"]
@@ -0,0 +1,70 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import events
+from ledger import apply_stock_delta, book_operation, InsufficientStock
+from models import db
+
+
+@pytest.fixture
+def subscriber(app):
+    q = events.broker.subscribe()
+    yield q
+    events.broker.unsubscribe(q)
+
+
+def test_committed_bookings_are_published(app, sample_data, subscriber):
+    pid = sample_data["product"].id
+    apply_stock_delta(pid, -1, warehouse="Основной")
+    assert subscriber.empty()  # до commit ничего не уходит
+    db.session.rollback()
+    assert subscriber.empty()
+
+    book_operation(pid, "out", 6, datetime(2025, 1, 1))
+    assert json.loads(subscriber.get_nowait()) == {
+        "product_id": pid, "warehouse": "Основной", "quantity": 4, "min_stock": 5, "low": 1}
+
+    book_operation(pid, "transfer", 1, datetime(2025, 1, 2), to_wh="Северный")
+    assert [json.loads(subscriber.get_nowait())["warehouse"] for _ in range(2)] == [
+        "Основной", "Северный"]
+
+    app.config["NEGATIVE_STOCK_POLICY"] = "reject"
+    with pytest.raises(InsufficientStock):
+        book_operation(pid, "out", 100, datetime(2025, 1, 3))
+    assert subscriber.empty()
+
+
+def test_sse_stream_delivers_events(client, app, sample_data):
+    app.config.update(EVENTS_KEEPALIVE=0.01, EVENTS_MAX_DURATION=5)
+    resp = client.get("/events/stock")
+    assert resp.mimetype == "text/event-stream"
+    chunks = iter(resp.response)
+    assert next(chunks) == b"retry: 3000\n\n"
+    assert next(chunks) == b": keepalive\n\n"
+
+    client.post("/operations/add", data={"product_id": sample_data["product"].id, "type": "in",
+                                         "quantity": 2, "date": "2025-01-01"})
+    chunk = next(c for c in chunks if not c.startswith(b":")).decode()
+    assert chunk.startswith("event: stock\ndata: ")
+    assert json.loads(chunk.split("data: ", 1)[1])["quantity"] == 12
+
+    resp.close()
+    assert len(events.broker) == 0
+
+
+def test_streams_per_process_are_capped(client, app):
+    app.config.update(EVENTS_MAX_STREAMS=1)
+    first = client.get("/events/stock")
+    assert first.status_code == 200
+
+    busy = client.get("/events/stock")
+    assert busy.status_code == 503 and busy.headers["Retry-After"] == "60"
+
+    # Закрытый до первого куска поток тоже освобождает место
+    first.close()
+    assert len(events.broker) == 0
+    again = client.get("/events/stock")
+    assert again.status_code == 200
+    again.close()
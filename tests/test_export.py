@@ -0,0 +1,54 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+from models import db, Operation
+
+
+def _add_ops(product, count, day):
+    db.session.add_all([
+        Operation(product_id=product.id, type="in", quantity=i + 1, date=day.replace(hour=i % 24))
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def test_export_operations_csv_streams_with_filters(client, app, sample_data):
+    app.config["EXPORT_BATCH_SIZE"] = 7
+    p = sample_data["product"]
+    _add_ops(p, 30, datetime(2024, 2, 1))
+    _add_ops(p, 5, datetime(2024, 2, 3))
+
+    resp = client.get("/export/operations?from=2024-02-01&to=2024-02-01")
+
+    assert resp.is_streamed
+    assert resp.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    assert len(rows) == 30
+    assert rows[0]["sku"] == "SKU123"
+    assert rows[0]["date"] == "2024-02-01T00:00:00"
+
+
+def test_export_operations_ndjson_gzip(client, sample_data):
+    p = sample_data["product"]
+    _add_ops(p, 3, datetime(2024, 2, 1))
+
+    resp = client.get(f"/export/operations?format=ndjson&gzip=1&product_id={p.id}")
+
+    assert resp.mimetype == "application/gzip"
+    lines = gzip.decompress(resp.get_data()).decode("utf-8").splitlines()
+    assert [json.loads(line)["quantity"] for line in lines] == [1, 2, 3]
+
+
+def test_export_stock(client, sample_data):
+    resp = client.get("/export/stock")
+    rows = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    assert rows == [{"product_id": str(sample_data["product"].id), "sku": "SKU123",
+                     "product": "Тест Товар", "warehouse": "Основной",
+                     "quantity": "10", "min_stock": "5"}]
+
+
+def test_export_unknown_format(client, sample_data):
+    assert client.get("/export/stock?format=xml").status_code == 400
@@ -0,0 +1,177 @@
+import csv
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from models import db, Job, Operation, Product
+
+
+@pytest.fixture(autouse=True)
+def jobs_dir(app, tmp_path):
+    app.config["JOBS_DIR"] = str(tmp_path)
+    return tmp_path
+
+
+def test_catalog_import_runs_in_background(client, app, sample_data, jobs_dir):
+    body = "sku,name\nB-1,Болт\nB-2,Гайка\n,Без артикула\n".encode()
+    resp = client.post("/products/import?background=1", data=body, content_type="text/csv")
+
+    assert resp.status_code == 202
+    status_url = resp.headers["Location"]
+    assert client.get(status_url).get_json()["status"] == "queued"
+    # Запрос только сохранил файл и поставил задачу
+    assert Product.query.count() == 1
+
+    assert jobs.run_next() == resp.get_json()["id"]
+    assert jobs.run_next() is None
+
+    data = client.get(status_url).get_json()
+    assert data["status"] == "done" and data["attempts"] == 1
+    assert data["result"]["created"] == 2 and data["result"]["rejected"] == 1
+    assert data["progress"]["done"] == 2
+    assert Product.query.count() == 3
+    assert list(jobs_dir.iterdir()) == []  # загруженный файл удалён
+
+
+def test_background_export_result_download(client, app, sample_data):
+    p = sample_data["product"]
+    db.session.add_all([Operation(product_id=p.id, type="in", quantity=i + 1,
+                                  date=datetime(2024, 3, 1, i)) for i in range(5)])
+    db.session.commit()
+
+    # GET по-прежнему отдаёт выгрузку потоком и задач не создаёт
+    assert client.get("/export/operations?from=2024-03-01&to=2024-03-01").is_streamed
+    assert Job.query.count() == 0
+    job_id = client.post("/export/operations?from=2024-03-01&to=2024-03-01").get_json()["id"]
+    assert client.get(f"/jobs/{job_id}/result").status_code == 404
+
+    jobs.run_next()
+    data = client.get(f"/jobs/{job_id}").get_json()
+    assert data["status"] == "done"
+    resp = client.get(data["result_url"])
+    rows = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    assert len(rows) == 5 and rows[0]["sku"] == "SKU123"
+
+
+def test_enqueue_endpoint_validates_task_and_args(client, app):
+    assert client.post("/jobs/no-such-task").status_code == 404
+    # Задачи с файлами ставятся только своими маршрутами
+    assert client.post("/jobs/catalog-import", json={"upload": "/etc/passwd"}).status_code == 404
+    assert client.post("/jobs/archive", json={"weeks": 1}).status_code == 400
+    # Строка "false" не должна включать запись
+    assert client.post("/jobs/reconcile", json={"write": "false"}).status_code == 400
+    assert client.post("/jobs/archive", json={"days": True}).status_code == 400
+    assert Job.query.count() == 0
+    assert client.get("/jobs/999").status_code == 404
+
+    resp = client.post("/jobs/reconcile", json={"write": True})
+    assert resp.status_code == 202
+    jobs.run_next()
+    data = client.get(resp.headers["Location"]).get_json()
+    assert data["status"] == "done"
+    assert data["result"]["drift"] == 0 and "result_url" in data
+
+
+def test_failed_job_retries_with_backoff(app, monkeypatch):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        raise RuntimeError("нет связи")
+
+    monkeypatch.setitem(jobs.TASKS, "flaky", flaky)
+    app.config.update(JOBS_MAX_ATTEMPTS=3, JOBS_RETRY_DELAY=10)
+    job_id = jobs.enqueue("flaky").id
+
+    delays = []
+    for attempt in range(1, 4):
+        started = datetime.utcnow()
+        assert jobs.run_next() == job_id
+        job = db.session.get(Job, job_id)
+        assert job.attempts == attempt and "нет связи" in job.error
+        if job.status == jobs.QUEUED:
+            delays.append(round((job.run_at - started).total_seconds()))
+            # До конца паузы задачу никто не берёт
+            assert jobs.run_next() is None
+            job.run_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+    assert delays == [10, 20]
+    assert job.status == jobs.FAILED and job.finished_at is not None
+    assert len(calls) == 3
+    assert jobs.run_next() is None
+
+
+def test_value_error_fails_without_retry_and_lost_job_is_reclaimed(app, monkeypatch):
+    monkeypatch.setitem(jobs.TASKS, "bad", lambda: int("x"))
+    job_id = jobs.enqueue("bad").id
+    jobs.run_next()
+    assert db.session.get(Job, job_id).status == jobs.FAILED
+
+    # Воркер взял задачу и пропал: после истечения аренды её берёт другой
+    job_id = jobs.enqueue("rollup-rebuild").id
+    job = jobs.claim()
+    job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert jobs.run_next() == job_id
+    job = db.session.get(Job, job_id)
+    assert job.status == jobs.DONE and job.attempts == 2
+
+
+def test_heartbeat_keeps_long_job_leased(app, monkeypatch):
+    stolen = []
+
+    def slow():
+        time.sleep(0.5)
+        # Аренда (0.3 с) истекла бы, но пульс её продлил: другой воркер задачу не берёт
+        stolen.append(jobs.claim())
+        return {}
+
+    monkeypatch.setitem(jobs.TASKS, "slow", slow)
+    app.config["JOBS_LEASE_SECONDS"] = 0.3
+    job_id = jobs.enqueue("slow").id
+    assert jobs.run_next() == job_id
+
+    assert stolen == [None]
+    job = db.session.get(Job, job_id)
+    assert job.status == jobs.DONE and job.attempts == 1
+
+
+def test_failed_import_removes_upload(client, app, jobs_dir):
+    resp = client.post("/products/import?background=1&format=xlsx", data=b"not a workbook",
+                       content_type="application/octet-stream")
+    assert resp.status_code == 202
+    assert len(list(jobs_dir.iterdir())) == 1
+
+    jobs.run_next()
+    assert client.get(resp.headers["Location"]).get_json()["status"] == "failed"
+    assert list(jobs_dir.iterdir()) == []
+
+
+def test_purge_removes_old_jobs_and_files(app, jobs_dir):
+    app.config["JOBS_RESULT_TTL"] = 3600
+    old = datetime.utcnow() - timedelta(hours=2)
+    done_old = Job(name="export", status=jobs.DONE, finished_at=old)
+    done_new = Job(name="export", status=jobs.DONE, finished_at=datetime.utcnow())
+    queued = Job(name="catalog-import", status=jobs.QUEUED, args='{"upload": "upload-q.csv"}')
+    db.session.add_all([done_old, done_new, queued])
+    db.session.commit()
+    old_id, new_id = done_old.id, done_new.id
+
+    for name in (f"job-{old_id}.csv.gz", f"job-{new_id}.csv",
+                 "upload-q.csv", "upload-orphan.csv", "upload-fresh.csv"):
+        (jobs_dir / name).write_text("x")
+    stale = time.time() - 7200
+    for name in (f"job-{old_id}.csv.gz", "upload-q.csv", "upload-orphan.csv"):
+        os.utime(jobs_dir / name, (stale, stale))
+
+    assert jobs.purge() == 1
+    assert db.session.get(Job, old_id) is None
+    assert db.session.get(Job, new_id) is not None
+    # Загрузку поставленной задачи и только что сохранённую не трогаем
+    assert sorted(p.name for p in jobs_dir.iterdir()) == [
+        f"job-{new_id}.csv", "upload-fresh.csv", "upload-q.csv"]
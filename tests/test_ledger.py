@@ -0,0 +1,96 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from app import create_app
+from ledger import book_operation, UnknownOperationType
+from models import db, Supplier, Product, Stock, Operation
+
+
+def test_reject_policy_keeps_stock_and_journal(client, app, sample_data):
+    app.config["NEGATIVE_STOCK_POLICY"] = "reject"
+    p = sample_data["product"]
+
+    resp = client.post("/operations/add", data={
+        "product_id": p.id,
+        "type": "out",
+        "quantity": 11,
+        "date": "2025-01-01"
+    }, follow_redirects=True)
+
+    assert "Недостаточно остатка" in resp.get_data(as_text=True)
+    assert Stock.query.filter_by(product_id=p.id).first().quantity == 10
+    assert Operation.query.count() == 0
+
+
+def test_flag_policy_allows_negative_stock(app, sample_data):
+    app.config["NEGATIVE_STOCK_POLICY"] = "flag"
+    p = sample_data["product"]
+
+    _, quantity_after = book_operation(p.id, "out", 12, datetime(2025, 1, 1))
+
+    assert quantity_after == -2
+
+
+def test_unknown_operation_type(app, sample_data):
+    with pytest.raises(UnknownOperationType):
+        book_operation(sample_data["product"].id, "gift", 1, datetime(2025, 1, 1))
+    assert Operation.query.count() == 0
+
+
+def test_missing_stock_row_is_created(app, sample_data):
+    p = Product(name="Без остатка", sku="NOSTOCK")
+    db.session.add(p)
+    db.session.commit()
+
+    _, quantity_after = book_operation(p.id, "in", 4, datetime(2025, 1, 1))
+
+    assert quantity_after == 4
+    assert Stock.query.filter_by(product_id=p.id).one().quantity == 4
+
+
+def test_concurrent_bookings_do_not_lose_updates(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'ledger.db'}",
+        "SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 30}},
+        "NEGATIVE_STOCK_POLICY": "reject",
+        "CACHE_BACKEND": "memory",
+    })
+    with app.app_context():
+        db.create_all()
+        product = Product(name="Ходовой", sku="HOT-1", supplier=Supplier(name="S"))
+        db.session.add(product)
+        db.session.flush()
+        db.session.add(Stock(product_id=product.id, quantity=100, min_stock=0))
+        db.session.commit()
+        pid = product.id
+
+    threads_count, per_thread = 8, 25
+    errors = []
+
+    def worker(n):
+        try:
+            with app.app_context():
+                for i in range(per_thread):
+                    # Чётные потоки приходуют по 2, нечётные списывают по 1
+                    if n % 2:
+                        book_operation(pid, "out", 1, datetime(2025, 1, 1))
+                    else:
+                        book_operation(pid, "in", 2, datetime(2025, 1, 1))
+        except Exception as e:  # pragma: no cover - выводится в assert ниже
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(threads_count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    with app.app_context():
+        assert Stock.query.filter_by(product_id=pid).one().quantity == 100 + 4 * per_thread * (2 - 1)
+        assert Operation.query.count() == threads_count * per_thread
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,69 @@
+import logging
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import instrumentation
+from instrumentation import fingerprint
+from models import db
+
+
+def test_fingerprint_normalizes_literals_and_in_lists():
+    a, text = fingerprint("SELECT * FROM products WHERE id IN (1, 2, 3) AND name = 'Болт'")
+    b, _ = fingerprint("SELECT *  FROM products\nWHERE id IN (7) AND name = 'Гайка'")
+    c, _ = fingerprint("SELECT * FROM products WHERE id IN (?, ?) AND name = ?")
+    assert a == b == c
+    assert text == "SELECT * FROM products WHERE id IN (?) AND name = ?"
+
+
+def test_response_carries_timing_headers(client, sample_data):
+    resp = client.get("/products")
+    assert int(resp.headers["X-Query-Count"]) >= 1
+    timing = resp.headers["Server-Timing"]
+    assert "db;dur=" in timing and "redis;dur=" in timing and "app;dur=" in timing
+
+
+def test_metrics_endpoint_exposes_histograms(client, sample_data):
+    instrumentation.reset_metrics()
+    client.get("/products")
+    client.get("/")
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{endpoint="main.products",method="GET",status="200"} 1' in body
+    assert 'http_request_duration_seconds_bucket{endpoint="main.index",method="GET",status="200",le="+Inf"} 1' in body
+    assert "db_query_duration_seconds_count" in body
+    # Главная читает счётчики из Redis (fakeredis) — время обращений учтено
+    assert "redis_call_duration_seconds_count" in body
+    assert "cache_breaker_open 0" in body
+
+
+def test_failed_queries_do_not_leak_timing_marks(app):
+    conn = db.session.connection()
+    for _ in range(3):
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        db.session.rollback()
+        conn = db.session.connection()
+    conn.execute(text("SELECT 1"))
+    assert conn.info.get("query_start") == []
+
+
+def test_slow_queries_are_logged_with_fingerprint(app, client, sample_data, caplog):
+    instrumentation.reset_metrics()
+    app.config["SLOW_QUERY_MS"] = 1e-6
+    with caplog.at_level(logging.WARNING, logger="instrumentation"):
+        client.get("/products")
+
+    assert any("Медленный SQL" in r.getMessage() for r in caplog.records)
+    assert "db_slow_queries_total{fingerprint=" in client.get("/metrics").get_data(as_text=True)
+
+
+def test_profiler_returns_collapsed_stacks(app, client, sample_data):
+    assert client.get("/products?_profile=1").mimetype == "text/html"
+
+    app.config.update(PROFILER_ENABLED=True, PROFILER_INTERVAL=0.0005)
+    resp = client.get("/products?_profile=1")
+    assert resp.mimetype == "text/plain"
+    lines = resp.get_data(as_text=True).splitlines()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
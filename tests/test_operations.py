@@ -80,3 +80,53 @@ def test_operation_filter_by_date(client, sample_data):
     # Check that the old operation is NOT in the filtered results
     # by verifying op_old.id is not in the table rows
     assert f"<td>{op_old.id}</td>" not in html
+
+
+def test_operation_filter_to_includes_whole_day(client, sample_data):
+    p = sample_data["product"]
+
+    late = Operation(product_id=p.id, type="in", quantity=7, date=datetime(2024, 3, 5, 23, 30))
+    next_day = Operation(product_id=p.id, type="in", quantity=8, date=datetime(2024, 3, 6, 0, 0))
+    db.session.add_all([late, next_day])
+    db.session.commit()
+
+    html = client.get("/operations?from=2024-03-05&to=2024-03-05").get_data(as_text=True)
+
+    assert f"<td>{late.id}</td>" in html
+    assert f"<td>{next_day.id}</td>" not in html
+
+
+def test_operations_keyset_pagination(client, sample_data):
+    import re
+
+    p = sample_data["product"]
+    base = datetime(2024, 1, 1)
+    # Две операции с одинаковой датой — порядок должен добиваться по id
+    ops = [Operation(product_id=p.id, type="in", quantity=1, date=base + timedelta(hours=i // 2))
+           for i in range(7)]
+    db.session.add_all(ops)
+    db.session.commit()
+    expected = [o.id for o in sorted(ops, key=lambda o: (o.date, o.id), reverse=True)]
+
+    seen = []
+    url = "/operations?per_page=3"
+    pages = []
+    while url:
+        html = client.get(url).get_data(as_text=True)
+        pages.append(html)
+        seen += [int(x) for x in re.findall(r"<tr>\s*<td>(\d+)</td>", html)]
+        m = re.search(r'href="([^"]*after=[^"]*)"', html)
+        url = m.group(1).replace("&amp;", "&") if m else None
+
+    assert seen == expected
+    assert len(pages) == 3
+
+    # Ссылка «назад» со второй страницы возвращает первую
+    m = re.search(r'href="([^"]*before=[^"]*)"', pages[1])
+    html = client.get(m.group(1).replace("&amp;", "&")).get_data(as_text=True)
+    assert [int(x) for x in re.findall(r"<tr>\s*<td>(\d+)</td>", html)] == expected[:3]
+
+
+def test_operations_bad_cursor_falls_back_to_first_page(client, sample_data):
+    resp = client.get("/operations?after=not-a-cursor&per_page=abc")
+    assert resp.status_code == 200
@@ -0,0 +1,32 @@
+from models import db, Supplier, Product, Stock, Operation
+from datetime import datetime
+
+
+def _add_products(n):
+    start = Product.query.count()
+    for i in range(start, start + n):
+        supplier = Supplier(name=f"Поставщик {i}")
+        product = Product(name=f"Товар {i}", sku=f"QC{i}", supplier=supplier)
+        db.session.add_all([supplier, product])
+        db.session.flush()
+        db.session.add(Stock(product_id=product.id, quantity=1, min_stock=5))
+        db.session.add(Operation(product_id=product.id, type="in", quantity=1,
+                                 date=datetime(2024, 1, 1)))
+    db.session.commit()
+
+
+def _query_count(client, url):
+    resp = client.get(url)
+    assert resp.status_code == 200
+    return int(resp.headers["X-Query-Count"])
+
+
+def test_listings_cost_constant_number_of_queries(client, app):
+    _add_products(1)
+    small = {url: _query_count(client, url) for url in ("/products", "/stock/low", "/operations")}
+
+    _add_products(15)
+    large = {url: _query_count(client, url) for url in ("/products", "/stock/low", "/operations")}
+
+    assert large == small
+    assert all(count <= 2 for count in large.values())
@@ -0,0 +1,104 @@
+from datetime import datetime
+
+import archive
+import reconcile
+import sqlite3
+
+from sqlalchemy import event
+
+from app import create_app
+from ledger import book_operation
+from models import db, Product, Stock, Operation
+
+
+def _catalog(n):
+    products = [Product(name=f"P{i}", sku=f"P{i}") for i in range(n)]
+    db.session.add_all(products)
+    db.session.flush()
+    for p in products:
+        db.session.add(Stock(product_id=p.id, quantity=0, min_stock=0))
+    db.session.commit()
+    for i, p in enumerate(products):
+        book_operation(p.id, "in", 10 + i, datetime(2024, 1, 1))
+        book_operation(p.id, "transfer", 3, datetime(2024, 1, 2), to_wh="Северный")
+        book_operation(p.id, "adjust", 1, datetime(2024, 1, 3))
+    return products
+
+
+def _drift(products):
+    # Остаток, изменённый мимо журнала, и операция, записанная мимо остатка
+    Stock.query.filter_by(product_id=products[1].id, warehouse="Основной").one().quantity += 5
+    db.session.add(Operation(product_id=products[3].id, type="in", quantity=7,
+                             date=datetime(2024, 1, 4), to_wh="Южный"))
+    db.session.commit()
+
+
+def test_reconcile_reports_and_fixes_drift(app, tmp_path):
+    products = _catalog(5)
+    archive.archive_operations(datetime(2024, 1, 2, 12))
+    _drift(products)
+
+    out = tmp_path / "drift.csv"
+    summary = reconcile.run(out=str(out), chunk_size=2)
+    assert summary == {"chunks": 3, "drift": 2, "fixed": 0}
+    assert out.read_text(encoding="utf-8").splitlines()[1:] == [
+        f"{products[1].id},Основной,12,7,-5",
+        f"{products[3].id},Южный,,7,7",
+    ]
+
+    assert reconcile.run(write=True, chunk_size=2)["fixed"] == 2
+    assert Stock.query.filter_by(product_id=products[1].id, warehouse="Основной").one().quantity == 7
+    assert Stock.query.filter_by(product_id=products[3].id, warehouse="Южный").one().quantity == 7
+    assert reconcile.run()["drift"] == 0
+
+
+def test_reconcile_skips_rows_changed_after_scan(app):
+    products = _catalog(2)
+    _drift(products * 2)
+    (_, _, drift), = reconcile.scan()
+    book_operation(products[1].id, "in", 1, datetime(2024, 1, 5))
+
+    assert len(drift) == 2
+    assert reconcile.apply(drift) == 1  # вставлена только недостающая строка
+
+
+def test_reconcile_in_process_pool(tmp_path):
+    app = create_app({"TESTING": True, "CACHE_BACKEND": "memory",
+                      "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'wh.db'}"})
+    with app.app_context():
+        db.create_all()
+        products = _catalog(6)
+        _drift(products)
+        summary = reconcile.run(chunk_size=2, workers=2)
+        db.session.remove()
+    assert summary == {"chunks": 3, "drift": 2, "fixed": 0}
+
+
+def test_booking_between_reads_is_not_reverted(tmp_path):
+    path = tmp_path / "wh.db"
+    app = create_app({"TESTING": True, "CACHE_BACKEND": "memory",
+                      "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+    with app.app_context():
+        db.create_all()
+        p = _catalog(1)[0]
+        booked = []
+
+        @event.listens_for(db.engine, "after_cursor_execute")
+        def _book_after_ledger_read(conn, cursor, statement, parameters, context, executemany):
+            # Проводка другим соединением сразу после чтения журнала, до чтения остатков
+            if "opening_balances" in statement and not booked:
+                booked.append(1)
+                other = sqlite3.connect(path)
+                with other:
+                    other.execute("INSERT INTO operations (product_id, type, quantity, date) "
+                                  "VALUES (?, 'in', 5, '2024-01-05 00:00:00')", (p.id,))
+                    other.execute("UPDATE stocks SET quantity = quantity + 5 "
+                                  "WHERE product_id = ? AND warehouse = 'Основной'", (p.id,))
+                other.close()
+
+        summary = reconcile.run(write=True)
+        assert booked
+        assert summary["drift"] == 0
+        stock = Stock.query.filter_by(product_id=p.id, warehouse="Основной").one()
+        assert stock.quantity == 6 + 5
+        db.session.remove()
@@ -0,0 +1,65 @@
+import math
+from datetime import datetime, timedelta
+from statistics import NormalDist, pstdev
+
+import reorder
+from models import db, Product, Stock, Operation
+
+NOW = datetime(2025, 3, 1)
+
+
+def _product(sku, warehouses=("Основной",)):
+    p = Product(name=sku, sku=sku)
+    db.session.add(p)
+    db.session.flush()
+    for wh in warehouses:
+        db.session.add(Stock(product_id=p.id, warehouse=wh, quantity=100, min_stock=0))
+    return p
+
+
+def _out(p, qty, days_ago, wh=None):
+    db.session.add(Operation(product_id=p.id, type="out", quantity=qty,
+                             date=NOW - timedelta(days=days_ago, hours=-1), from_wh=wh))
+
+
+def test_reorder_point_matches_reference(app):
+    a = _product("A", ("Основной", "Северный"))
+    b = _product("B")
+    daily = [5, 0, 3, 3, 0, 9, 1, 0, 0, 4]
+    for i, qty in enumerate(daily):
+        if qty:
+            _out(a, qty, i + 1)
+    _out(a, 2, 1)                       # второй расход в тот же день складывается
+    _out(a, 6, 3, wh="Северный")
+    db.session.add(Operation(product_id=b.id, type="in", quantity=50, date=NOW))
+    _out(b, 30, 200)                    # вне окна
+    db.session.commit()
+
+    batches = list(reorder.recommend(batch_size=1, lookback_days=10, lead_time_days=4,
+                                     service_level=0.9, now=NOW))
+    assert len(batches) == 2
+    rows = {(int(p), w): (rate, rp) for batch in batches for p, w, rate, rp in
+            zip(batch["product_id"], batch["warehouse"], batch["demand_rate"], batch["reorder_point"])}
+
+    daily[0] += 2
+    z = NormalDist().inv_cdf(0.9)
+    expected = math.ceil(sum(daily) / 10 * 4 + z * pstdev(daily) * 2)
+    assert rows[(a.id, "Основной")] == (sum(daily) / 10, expected)
+    assert rows[(a.id, "Северный")][1] == math.ceil(0.6 * 4 + z * pstdev([6] + [0] * 9) * 2)
+    assert rows[(b.id, "Основной")] == (0, 0)
+
+
+def test_apply_writes_min_stock(app, tmp_path):
+    p = _product("C")
+    for day in range(1, 31):
+        _out(p, 2, day)
+    db.session.commit()
+
+    out = tmp_path / "reorder.csv"
+    dry = reorder.run(out=str(out), lookback_days=30, lead_time_days=5, now=NOW)
+    assert dry == {"rows": 1, "changed": 1}
+    assert Stock.query.one().min_stock == 0
+    assert out.read_text(encoding="utf-8").splitlines()[1].endswith(",10")
+
+    assert reorder.run(write=True, lookback_days=30, lead_time_days=5, now=NOW)["changed"] == 1
+    assert Stock.query.one().min_stock == 10
@@ -0,0 +1,112 @@
+import sqlite3
+import time
+
+import pytest
+
+import replicas
+import versions
+from flask import Flask
+
+from app import create_app
+from cache import cache
+from models import db, Supplier
+
+
+@pytest.fixture
+def replicated(tmp_path, monkeypatch):
+    app = create_app({"TESTING": True, "CACHE_BACKEND": "memory",
+                      "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'primary.db'}",
+                      "REPLICA_DATABASE_URI": f"sqlite:///{tmp_path / 'replica.db'}"})
+    # Свежесть реплики сверяется с версиями, а они есть только в общем Redis
+    monkeypatch.setattr(cache, "backend", "redis")
+    with app.app_context():
+        db.create_all()
+        db.session.add(Supplier(name="Общий"))
+        db.session.commit()
+        yield app, tmp_path / "replica.db"
+        db.session.remove()
+    # init_app заводит пустые метаданные под bind реплики — другим тестам они не нужны
+    db.metadatas.pop(replicas.REPLICA_BIND, None)
+
+
+def _settle(*tables):
+    # Записи «секунду назад»: снятая после них копия считается свежей
+    for name in tables:
+        cache.redis.hset(versions.VERSIONS_KEY, f"at:{name}", int(time.time()) - 10)
+
+
+def _mark_replica(path, name):
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO suppliers (name) VALUES (?)", (name,))
+
+
+def test_reads_go_to_fresh_replica_and_writers_stick_to_primary(replicated):
+    app, replica = replicated
+    _settle("suppliers")
+    replicas.refresh(app)
+    # Строка, которая есть только в реплике, показывает, откуда читали
+    _mark_replica(replica, "Из реплики")
+
+    client = app.test_client()
+    html = client.get("/suppliers").get_data(as_text=True)
+    assert "Общий" in html and "Из реплики" in html
+
+    client.post("/supplier/add", data={"name": "Свежий"})
+    html = client.get("/suppliers").get_data(as_text=True)
+    assert "Свежий" in html and "Из реплики" not in html
+
+    # Другой клиент не писал, но реплика старше записи — тоже основная база
+    html = app.test_client().get("/suppliers").get_data(as_text=True)
+    assert "Свежий" in html and "Из реплики" not in html
+
+
+def test_replica_older_than_versions_is_not_used(replicated):
+    app, replica = replicated
+    replicas.refresh(app)
+    _mark_replica(replica, "Из реплики")
+    # Хэш версий пересоздан после снятия копии: записи до него неизвестны
+    cache.redis.delete(versions.VERSIONS_KEY)
+    client = app.test_client()
+    assert "Из реплики" not in client.get("/suppliers").get_data(as_text=True)
+
+    cache.redis.hset(versions.VERSIONS_KEY, "started", int(time.time()) - 10)
+    # Другой адрес — мимо кэша страниц с тем же ETag
+    assert "Из реплики" in client.get("/suppliers?page=1").get_data(as_text=True)
+
+
+def test_refresh_replaces_replica_under_open_pool(replicated):
+    app, replica = replicated
+    _settle("suppliers", "products", "stocks")
+    replicas.refresh(app)
+    client = app.test_client()
+    assert "Новый" not in client.get("/suppliers").get_data(as_text=True)
+
+    db.session.add(Supplier(name="Новый"))
+    db.session.commit()
+    _settle("suppliers")
+    replicas.refresh(app)
+    _mark_replica(replica, "Из реплики")
+
+    html = client.get("/suppliers").get_data(as_text=True)
+    assert "Новый" in html and "Из реплики" in html
+    with sqlite3.connect(replica) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+
+
+def test_refresh_writes_the_file_the_replica_bind_reads(tmp_path, monkeypatch):
+    # Относительный путь SQLite Flask-SQLAlchemy разрешает от instance_path
+    monkeypatch.setattr(Flask, "auto_find_instance_path", lambda self: str(tmp_path / "instance"))
+    monkeypatch.chdir(tmp_path)
+    app = create_app({"TESTING": True, "CACHE_BACKEND": "memory",
+                      "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'primary.db'}",
+                      "REPLICA_DATABASE_URI": "sqlite:///replica.db"})
+    try:
+        with app.app_context():
+            db.create_all()
+            started = replicas.refresh(app)
+            assert (tmp_path / "instance" / "replica.db").exists()
+            assert not (tmp_path / "replica.db").exists()
+            assert replicas.synced_at() == pytest.approx(started)
+            db.session.remove()
+    finally:
+        db.metadatas.pop(replicas.REPLICA_BIND, None)
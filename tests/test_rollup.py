@@ -0,0 +1,84 @@
+from datetime import date, datetime
+
+from sqlalchemy import insert
+
+import rollup
+from ledger import book_operation
+from models import db, StockDaily
+
+
+def _snapshot():
+    return {(r.product_id, r.warehouse, r.day): r.balance
+            for r in StockDaily.query.order_by(StockDaily.day)}
+
+
+def _book(pid, op_type, qty, when, **kw):
+    book_operation(pid, op_type, qty, when, **kw)
+
+
+def test_rollup_is_maintained_incrementally(app, sample_data):
+    pid = sample_data["product"].id
+    _book(pid, "in", 10, datetime(2024, 1, 1, 9))
+    _book(pid, "out", 3, datetime(2024, 1, 3, 12))
+    _book(pid, "in", 5, datetime(2024, 1, 3, 15), to_wh="Северный")
+    # Операция задним числом сдвигает все последующие дни
+    _book(pid, "in", 2, datetime(2024, 1, 2, 10))
+
+    incremental = _snapshot()
+    assert incremental == {
+        (pid, "Основной", date(2024, 1, 1)): 10,
+        (pid, "Основной", date(2024, 1, 2)): 12,
+        (pid, "Основной", date(2024, 1, 3)): 9,
+        (pid, "Северный", date(2024, 1, 3)): 5,
+    }
+
+    rollup.rebuild()
+    db.session.commit()
+    assert _snapshot() == incremental
+
+
+def test_rollup_without_on_conflict(app, sample_data, monkeypatch):
+    # СУБД без ON CONFLICT: dialect_insert отдаёт обычный insert()
+    monkeypatch.setattr(rollup, "dialect_insert", lambda table: insert(table))
+    pid = sample_data["product"].id
+    _book(pid, "in", 10, datetime(2024, 1, 1, 9))
+    _book(pid, "out", 3, datetime(2024, 1, 1, 12))
+    _book(pid, "in", 2, datetime(2024, 1, 2, 10))
+
+    assert _snapshot() == {
+        (pid, "Основной", date(2024, 1, 1)): 7,
+        (pid, "Основной", date(2024, 1, 2)): 9,
+    }
+
+
+def test_stock_as_of(app, sample_data):
+    pid = sample_data["product"].id
+    _book(pid, "in", 10, datetime(2024, 1, 1, 9))
+    _book(pid, "out", 3, datetime(2024, 1, 5, 12))
+    _book(pid, "out", 1, datetime(2024, 1, 5, 18))
+
+    assert rollup.stock_as_of(date(2023, 12, 31)) == {}
+    assert rollup.stock_as_of(date(2024, 1, 3)) == {(pid, "Основной"): 10}
+    assert rollup.stock_as_of(date(2024, 1, 5)) == {(pid, "Основной"): 6}
+    # Внутри дня: снимок на конец 4-го + операции 5-го до 13:00
+    assert rollup.stock_as_of(date(2024, 1, 5), until=datetime(2024, 1, 5, 13)) == {(pid, "Основной"): 7}
+
+
+def test_stock_as_of_api_and_view(client, sample_data):
+    pid = sample_data["product"].id
+    client.post("/operations/add", data={"product_id": pid, "type": "in", "quantity": 4,
+                                         "date": "2024-02-01", "to_wh": ""})
+
+    data = client.get(f"/api/stock/asof?date=2024-02-02&product_id={pid}").get_json()
+    assert data["items"] == [{"product_id": pid, "warehouse": "Основной", "quantity": 4}]
+
+    html = client.get("/stock/asof?date=2024-02-02").get_data(as_text=True)
+    assert "Тест Товар" in html
+    assert client.get("/api/stock/asof?date=bad").status_code == 400
+
+
+def test_bulk_ingest_feeds_rollup(client, sample_data):
+    body = "sku,type,quantity,date\nSKU123,in,3,2024-03-01\nSKU123,in,2,2024-03-01\n"
+    client.post("/operations/bulk", data=body.encode(), content_type="text/csv")
+
+    assert rollup.stock_as_of(date(2024, 3, 1)) == {(sample_data["product"].id, "Основной"): 5}
@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import scanner
+from models import db, Product, Stock
+
+
+def test_scan_returns_product_stock_and_supplier(client, sample_data):
+    db.session.add(Stock(product_id=sample_data["product"].id, warehouse="Северный",
+                         quantity=4, min_stock=0))
+    db.session.commit()
+
+    data = client.get("/api/scan/SKU123").get_json()
+    assert data["name"] == "Тест Товар"
+    assert data["supplier"]["name"] == "Test Supplier"
+    assert [(s["warehouse"], s["quantity"]) for s in data["stocks"]] == [("Основной", 10), ("Северный", 4)]
+    assert data["total"] == 14
+
+    # Повторный скан: id из карты процесса, один запрос по первичному ключу
+    resp = client.get("/api/scan/SKU123")
+    assert resp.headers["X-Query-Count"] == "1"
+
+    assert client.get("/api/scan/NOPE").status_code == 404
+
+
+def test_sku_map_follows_renames_and_deletes(client, sample_data):
+    p = sample_data["product"]
+    assert client.get("/api/scan/SKU123").status_code == 200
+
+    p.sku = "SKU999"
+    db.session.commit()
+    assert client.get("/api/scan/SKU123").status_code == 404
+    assert client.get("/api/scan/SKU999").get_json()["id"] == p.id
+
+    # Запись, устаревшая в другом процессе, перечитывается по индексу
+    other = Product(name="Другой", sku="SKU123")
+    db.session.add(other)
+    db.session.commit()
+    scanner.sku_map.set("SKU999", other.id)
+    assert client.get("/api/scan/SKU999").get_json()["id"] == p.id
+
+
+def test_sku_is_unique(client, sample_data):
+    resp = client.post("/product/add", data={"name": "Дубль", "sku": "SKU123", "supplier": ""},
+                       follow_redirects=True)
+    assert "уже есть" in resp.get_data(as_text=True)
+    assert Product.query.count() == 1
+
+    db.session.add(Product(name="Дубль", sku="SKU123"))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+
+
+def test_concurrent_duplicate_sku_is_rejected_without_orphan_stock(client, sample_data, monkeypatch):
+    import routes
+
+    # Параллельный запрос добавил тот же артикул уже после проверки
+    real_execute = db.session.execute
+
+    def execute_after_race(stmt, *args, **kwargs):
+        if "products.sku" in str(stmt):
+            return real_execute(db.select(Product.id).where(db.false()))
+        return real_execute(stmt, *args, **kwargs)
+
+    monkeypatch.setattr(routes.db.session, "execute", execute_after_race)
+    resp = client.post("/product/add", data={"name": "Дубль", "sku": "SKU123", "supplier": ""},
+                       follow_redirects=True)
+    monkeypatch.undo()
+
+    assert resp.status_code == 200
+    assert "уже есть" in resp.get_data(as_text=True)
+    assert Product.query.count() == 1
+    assert Stock.query.count() == 1
@@ -0,0 +1,108 @@
+from models import db, Product
+import search
+
+
+def _add(name, sku, category=None):
+    p = Product(name=name, sku=sku, category=category)
+    db.session.add(p)
+    db.session.commit()
+    return p
+
+
+def test_search_uses_fts_and_is_case_insensitive(client, app):
+    assert search.fts_available()
+    _add("Болт оцинкованный", "B-100", "Крепёж")
+    _add("Гайка", "G-200", "Крепёж")
+
+    html = client.get("/products?q=болт").get_data(as_text=True)
+    assert "Болт оцинкованный" in html
+    assert "Гайка" not in html
+
+    # Префикс слова тоже находит товар
+    html = client.get("/products?q=оцинк").get_data(as_text=True)
+    assert "Болт оцинкованный" in html
+
+
+def test_search_index_follows_updates_and_deletes(client, app):
+    p = _add("Старое имя", "UPD-1")
+
+    p.name = "Новое имя"
+    db.session.commit()
+    assert "Новое имя" in client.get("/products?q=Новое").get_data(as_text=True)
+    assert "Новое имя" not in client.get("/products?q=Старое").get_data(as_text=True)
+
+    db.session.delete(p)
+    db.session.commit()
+    assert "Новое имя" not in client.get("/products?q=Новое").get_data(as_text=True)
+
+
+def test_exact_sku_fast_path(client, app):
+    _add("Первый", "ABC")
+    _add("Второй", "ABC-2")
+
+    html = client.get("/products?q=ABC").get_data(as_text=True)
+    assert "Первый" in html
+    assert "Второй" not in html
+
+
+def test_search_falls_back_to_like_without_fts(client, app):
+    _add("Шайба", "SH-1", "Крепёж")
+    with db.engine.begin() as conn:
+        search.drop_fts(None, conn)
+
+    assert not search.fts_available()
+    html = client.get("/products?q=айб&category=репё").get_data(as_text=True)
+    assert "Шайба" in html
+
+
+def test_search_limit(client, app):
+    app.config["SEARCH_RESULT_LIMIT"] = 2
+    for i in range(5):
+        _add(f"Лампа {i}", f"L{i}")
+
+    html = client.get("/products?q=лампа").get_data(as_text=True)
+    assert html.count("Лампа ") == 2
+
+
+def test_suggest_by_sku_prefix_then_name(client, app):
+    _add("Болт М6", "BM-6")
+    _add("Болт М8", "BM-8")
+    _add("Шайба для болта", "SH-1")
+    _add("BMX-рама", "ZZ-9")
+
+    items = client.get("/api/products/suggest?q=BM").get_json()["items"]
+    # Сначала артикулы с префиксом, потом совпадения по названию
+    assert [i["sku"] for i in items] == ["BM-6", "BM-8", "ZZ-9"]
+    names = {i["name"] for i in client.get("/api/products/suggest?q=бол").get_json()["items"]}
+    assert names == {"Болт М6", "Болт М8", "Шайба для болта"}
+
+    assert len(client.get("/api/products/suggest?q=BM&limit=1").get_json()["items"]) == 1
+    # Отрицательный лимит не снимает ограничение (LIMIT -1 в SQLite — без лимита)
+    assert len(client.get("/api/products/suggest?q=BM&limit=-1").get_json()["items"]) == 1
+    assert client.get("/api/products/suggest?q=%20").get_json()["items"] == []
+
+
+def test_suggest_caches_hot_prefixes(client, app):
+    _add("Гвоздь", "GV-1")
+    assert client.get("/api/products/suggest?q=GV").get_json()["items"][0]["sku"] == "GV-1"
+
+    resp = client.get("/api/products/suggest?q=GV")
+    assert resp.headers["X-Query-Count"] == "0"
+
+    # Изменение каталога сбрасывает подсказки
+    _add("Гвоздь большой", "GV-2")
+    assert len(client.get("/api/products/suggest?q=GV").get_json()["items"]) == 2
+
+
+def test_add_operation_form_does_not_load_catalog(client, app):
+    for i in range(50):
+        db.session.add(Product(name=f"Товар {i}", sku=f"T-{i}"))
+    db.session.commit()
+
+    resp = client.get("/operations/add")
+    assert resp.headers["X-Query-Count"] == "0"
+    assert "Товар 1" not in resp.get_data(as_text=True)
+
+    resp = client.post("/operations/add", data={"product_id": "", "type": "in",
+                                                "quantity": 1, "date": "2025-01-01"})
+    assert resp.status_code == 302
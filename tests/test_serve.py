@@ -0,0 +1,30 @@
+import argparse
+from types import SimpleNamespace
+
+import serve
+from models import db
+
+
+def test_options_preload_and_use_threads():
+    args = argparse.Namespace(
+        bind="127.0.0.1:0", workers=3, threads=4, timeout=30,
+        graceful_timeout=20, max_requests=1000, max_streams=None)
+    options = serve.options_from_args(args)
+    assert options["preload_app"] is True
+    assert options["worker_class"] == "gthread"
+    assert options["graceful_timeout"] == 20
+    assert options["post_fork"] is serve.post_fork
+    # Под SSE — половина потоков, остальные остаются обычным запросам
+    assert serve.max_streams(args) == 2
+    assert serve.max_streams(argparse.Namespace(threads=1, max_streams=None)) == 0
+
+
+def test_post_fork_disposes_engines(app, monkeypatch):
+    disposed = []
+    with app.app_context():
+        for engine in db.engines.values():
+            monkeypatch.setattr(engine, "dispose", lambda close=True: disposed.append(close))
+
+    server = SimpleNamespace(app=SimpleNamespace(application=app))
+    serve.post_fork(server, worker=None)
+    assert disposed and disposed == [False] * len(disposed)
@@ -13,3 +13,30 @@ def test_stock_low_list(client, sample_data):
     resp = client.get("/stock/low")
     html = resp.get_data(as_text=True)
     assert "Тест Товар" in html
+
+
+def test_stock_low_sorted_by_deficit_with_pages(client, app, sample_data):
+    from models import db, Product
+    for i, (quantity, min_stock) in enumerate([(0, 40), (9, 10), (50, 10), (1, 30)]):
+        p = Product(name=f"Дефицит {i}", sku=f"DEF{i}")
+        db.session.add(p)
+        db.session.flush()
+        db.session.add(Stock(product_id=p.id, quantity=quantity, min_stock=min_stock))
+    db.session.commit()
+
+    first = client.get("/stock/low?per_page=2").get_data(as_text=True)
+    assert first.index("Дефицит 0") < first.index("Дефицит 3")
+    assert "Дефицит 1" not in first and "after=" in first
+
+    cursor = first.split("after=")[1].split("&")[0].split('"')[0]
+    second = client.get(f"/stock/low?per_page=2&after={cursor}").get_data(as_text=True)
+    # Тест Товар: 10 при минимуме 5 — не критичен; «Дефицит 2» выше минимума
+    assert "Дефицит 1" in second and "Дефицит 0" not in second
+    assert "Дефицит 2" not in second and "Тест Товар" not in second
+
+
+def test_empty_low_stock_page_keeps_live_update_notice(client, sample_data):
+    # Пустой список: таблицы нет, но подсказка с фильтром склада есть для stock_events.js
+    html = client.get("/stock/low?warehouse=Основной").get_data(as_text=True)
+    assert 'id="low-stock"' not in html
+    assert '<p id="low-stock-new" data-warehouse="Основной" hidden>' in html
@@ -0,0 +1,105 @@
+import time
+from datetime import datetime
+
+from werkzeug.http import http_date
+
+import versions
+from ledger import book_operation
+from models import db, Supplier
+
+
+def test_unchanged_list_is_not_queried_or_rendered_again(client, sample_data, shared_redis):
+    first = client.get("/suppliers")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    again = client.get("/suppliers", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["X-Query-Count"] == "0"
+
+    cached = client.get("/suppliers")
+    assert cached.get_data() == first.get_data()
+    assert cached.headers["X-Query-Count"] == "0"
+
+    # Запись новой версии: после редиректа страница с flash рисуется заново
+    resp = client.post("/supplier/add", data={"name": "Новый"}, follow_redirects=True)
+    assert "Поставщик добавлен" in resp.get_data(as_text=True)
+    fresh = client.get("/suppliers", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert "Новый" in fresh.get_data(as_text=True)
+    assert "Поставщик добавлен" not in fresh.get_data(as_text=True)
+
+
+def test_versions_follow_written_tables(client, sample_data, shared_redis):
+    etags = {url: client.get(url).headers["ETag"] for url in ("/suppliers", "/stock/low")}
+
+    book_operation(sample_data["product"].id, "out", 1, datetime(2025, 1, 1))
+    assert client.get("/suppliers").headers["ETag"] == etags["/suppliers"]
+    assert client.get("/stock/low").headers["ETag"] != etags["/stock/low"]
+
+    db.session.add(Supplier(name="Откатится"))
+    db.session.flush()
+    db.session.rollback()
+    assert client.get("/suppliers").headers["ETag"] == etags["/suppliers"]
+
+    # Разные аргументы — разные ETag
+    assert client.get("/stock/low?per_page=50").headers["ETag"] != client.get("/stock/low").headers["ETag"]
+
+
+def test_if_modified_since(client, sample_data, shared_redis):
+    versions.bump("suppliers")
+    # Last-Modified отдаётся только за завершившуюся секунду
+    assert "Last-Modified" not in client.get("/suppliers").headers
+
+    shared_redis.hset(versions.VERSIONS_KEY, "at:suppliers", int(time.time()) - 10)
+    modified = client.get("/suppliers").headers["Last-Modified"]
+    assert client.get("/suppliers", headers={"If-Modified-Since": modified}).status_code == 304
+    old = http_date(time.time() - 60)
+    assert client.get("/suppliers", headers={"If-Modified-Since": old}).status_code == 200
+
+
+def test_no_conditional_get_without_shared_redis(client, sample_data, fake_redis):
+    # memory/local: версии другого процесса не видны — ETag был бы вечным
+    resp = client.get("/suppliers")
+    assert "ETag" not in resp.headers
+    assert client.get("/suppliers", headers={"If-None-Match": "*"}).status_code == 200
+
+
+def test_lost_bump_resets_versions(client, sample_data, shared_redis, monkeypatch):
+    etag = client.get("/suppliers").headers["ETag"]
+
+    def unavailable(fn):
+        raise versions.CacheUnavailable("Redis недоступен")
+
+    with monkeypatch.context() as m:
+        m.setattr(versions.cache, "run", unavailable)
+        db.session.add(Supplier(name="Мимо счётчиков"))
+        db.session.commit()
+
+    resp = client.get("/suppliers", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert "Мимо счётчиков" in resp.get_data(as_text=True)
+
+
+def test_versions_expire_when_a_writer_exits_after_a_lost_bump(app, client, sample_data,
+                                                               shared_redis, monkeypatch):
+    app.config["PAGE_CACHE_TTL"] = 1
+    etag = client.get("/suppliers").headers["ETag"]
+    assert 0 < shared_redis.ttl(versions.VERSIONS_KEY) <= 1
+
+    def unavailable(fn):
+        raise versions.CacheUnavailable("Redis недоступен")
+
+    # Команда flask записала мимо счётчиков и завершилась, не прочитав версии
+    with monkeypatch.context() as m:
+        m.setattr(versions.cache, "run", unavailable)
+        db.session.add(Supplier(name="Мимо счётчиков"))
+        db.session.commit()
+    versions._lost_bump.clear()
+    assert client.get("/suppliers", headers={"If-None-Match": etag}).status_code == 304
+
+    # Не позже PAGE_CACHE_TTL хэш пропадает и epoch меняется
+    time.sleep(1.1)
+    resp = client.get("/suppliers", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert "Мимо счётчиков" in resp.get_data(as_text=True)
@@ -0,0 +1,83 @@
+import io
+import json
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import text
+
+import warehouses
+from ingest import ingest_operations
+from ledger import book_operation, InvalidTransfer, InsufficientStock
+from models import db, Stock, StockDaily, Operation
+
+
+def _stocks(pid):
+    return {s.warehouse: s.quantity for s in Stock.query.filter_by(product_id=pid)}
+
+
+def test_transfer_moves_stock_between_warehouses(app, sample_data):
+    pid = sample_data["product"].id
+
+    _, source_after = book_operation(pid, "transfer", 4, datetime(2024, 1, 2),
+                                     from_wh="Основной", to_wh="Северный")
+    book_operation(pid, "transfer", 1, datetime(2024, 1, 3), from_wh="Северный", to_wh="Южный")
+
+    assert source_after == 6
+    assert _stocks(pid) == {"Основной": 6, "Северный": 3, "Южный": 1}
+    assert StockDaily.query.filter_by(product_id=pid, warehouse="Северный",
+                                      day=date(2024, 1, 3)).one().balance == 3
+
+
+def test_rejected_transfer_changes_nothing(app, sample_data):
+    app.config["NEGATIVE_STOCK_POLICY"] = "reject"
+    pid = sample_data["product"].id
+
+    with pytest.raises(InsufficientStock):
+        book_operation(pid, "transfer", 11, datetime(2024, 1, 2), to_wh="Северный")
+    with pytest.raises(InvalidTransfer):
+        book_operation(pid, "transfer", 1, datetime(2024, 1, 2), to_wh="Основной")
+
+    assert _stocks(pid) == {"Основной": 10}
+    assert Operation.query.count() == 0
+
+
+def test_bulk_ingest_applies_transfers_per_warehouse(app, sample_data):
+    app.config["NEGATIVE_STOCK_POLICY"] = "reject"
+    lines = [
+        {"sku": "SKU123", "type": "transfer", "quantity": 7, "to_wh": "Северный"},
+        {"sku": "SKU123", "type": "out", "quantity": 5, "from_wh": "Северный"},
+        {"sku": "SKU123", "type": "out", "quantity": 5, "from_wh": "Северный"},
+        {"sku": "SKU123", "type": "transfer", "quantity": 1},
+    ]
+    stream = io.BytesIO("".join(json.dumps(r) + "\n" for r in lines).encode())
+
+    report = ingest_operations(stream, "ndjson").to_dict()
+
+    assert report["accepted"] == 2
+    assert [e["line"] for e in report["errors"]] == [3, 4]
+    assert _stocks(sample_data["product"].id) == {"Основной": 3, "Северный": 2}
+
+
+def test_low_stock_and_totals_by_warehouse(client, app, sample_data):
+    pid = sample_data["product"].id
+    book_operation(pid, "transfer", 8, datetime(2024, 1, 2), to_wh="Северный")
+
+    totals = {r.warehouse: (r.positions, r.quantity, r.low) for r in warehouses.warehouse_totals()}
+    assert totals == {"Основной": (1, 2, 1), "Северный": (1, 8, 0)}
+
+    assert "Тест Товар" in client.get("/stock/low?warehouse=Основной").get_data(as_text=True)
+    assert "Тест Товар" not in client.get("/stock/low?warehouse=Северный").get_data(as_text=True)
+    assert client.get("/stock/warehouses").status_code == 200
+
+
+def test_warehouse_queries_use_indexes(app):
+    def plan(stmt):
+        compiled = stmt.compile(db.engine, compile_kwargs={"literal_binds": True})
+        return " ".join(r[-1] for r in db.session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+
+    urgent = [c.desc() for c in warehouses.LOW_STOCK_ORDER]
+    for warehouse, index in ((None, "ix_stocks_deficit"), ("Основной", "ix_stocks_low")):
+        query_plan = plan(warehouses.low_stock_query(warehouse).order_by(*urgent).limit(50).statement)
+        assert index in query_plan and "TEMP B-TREE" not in query_plan
+    assert "COVERING INDEX ix_stocks_warehouse_totals" in plan(
+        db.select(Stock.warehouse, db.func.sum(Stock.quantity)).group_by(Stock.warehouse))
@@ -0,0 +1,182 @@
+"""Версии данных по таблицам: условный GET и кэш отрисованных страниц.
+
+Каждая транзакция сессии запоминает, в какие таблицы писала (flush ORM и
+INSERT/UPDATE/DELETE через session.execute), и после commit увеличивает их
+счётчики в хэше Redis VERSIONS_KEY; откат их не трогает.
+
+Версии ведутся только в общем Redis (CACHE_BACKEND=redis): счётчики в
+процессе не видели бы записей других воркеров, worker.py и команд flask.
+Без него (local, memory) и пока Redis не отвечает условного GET и кэша
+страниц нет.
+
+Представление, обёрнутое в conditional(*tables), по версиям своих таблиц и
+адресу запроса получает ETag:
+- совпал с If-None-Match — 304 без запросов к базе и без шаблона;
+- есть отрисованный HTML с этим ETag в кэше (cache: LRU процесса + Redis) —
+  отдаётся он;
+- иначе страница рисуется и кладётся в кэш на PAGE_CACHE_TTL секунд.
+
+epoch в хэше меняется, если хэш пропал (сброс Redis), поэтому старые ETag
+не совпадут с новыми счётчиками. Хэш живёт PAGE_CACHE_TTL секунд от
+создания epoch, так что ETag не старше этого срока, даже если счётчики не
+сдвинула запись из процесса, который уже завершился (команда flask,
+worker.py). Процесс, у которого запись не смогла увеличить счётчики, сам
+удаляет хэш, как только Redis снова ответит.
+Страница с непоказанными flash-сообщениями не кэшируется.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import cache, CacheUnavailable
+
+log = logging.getLogger(__name__)
+
+VERSIONS_KEY = "data:versions"
+
+# Запись, не сдвинувшая счётчики: хэш нужно сбросить при следующем ответе Redis
+_lost_bump = threading.Event()
+
+
+def shared():
+    """Версии видны всем процессам только через общий Redis."""
+    return cache.backend == "redis"
+
+
+# ---------------- Учёт записей ----------------
+def _written(session):
+    return session.info.setdefault("written_tables", set())
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    tables = _written(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tables.update(t.name for t in type(obj).__mapper__.tables)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        _written(state.session).add(state.statement.table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_pending(session):
+    tables = session.info.pop("written_tables", None)
+    if tables:
+        bump(*tables)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("written_tables", None)
+
+
+def bump(*tables):
+    """Новые версии таблиц: все ETag и страницы по ним перестают совпадать."""
+    now = int(time.time())
+
+    def apply(client):
+        pipe = client.pipeline()
+        for name in tables:
+            pipe.hincrby(VERSIONS_KEY, name, 1)
+            pipe.hset(VERSIONS_KEY, f"at:{name}", now)
+        pipe.execute()
+
+    if not shared():
+        return
+    try:
+        cache.run(apply)
+    except CacheUnavailable:
+        # Иначе старые ETag совпадали бы со счётчиками бессрочно
+        _lost_bump.set()
+
+
+def current():
+    """Все версии: {таблица: n, "at:таблица": время, "epoch": ..., "started": ...};
+    None без общего Redis."""
+    if not shared():
+        return None
+    ttl = current_app.config.get("PAGE_CACHE_TTL", 300)
+
+    def read(client):
+        if _lost_bump.is_set():
+            client.delete(VERSIONS_KEY)
+            _lost_bump.clear()
+            log.info("Версии данных сброшены после пропущенной записи")
+        versions = client.hgetall(VERSIONS_KEY)
+        if "epoch" not in versions:
+            # started — с какого момента хэш знает обо всех записях
+            pipe = client.pipeline()
+            pipe.hsetnx(VERSIONS_KEY, "epoch", uuid.uuid4().hex)
+            pipe.hsetnx(VERSIONS_KEY, "started", int(time.time()))
+            pipe.expire(VERSIONS_KEY, ttl)
+            pipe.hgetall(VERSIONS_KEY)
+            versions = pipe.execute()[-1]
+        return versions
+
+    try:
+        return cache.run(read)
+    except CacheUnavailable:
+        return None
+
+
+# ---------------- Условный GET ----------------
+def _etag(versions, tables):
+    parts = [versions["epoch"], request.endpoint, request.full_path]
+    parts += [f"{name}={versions.get(name, 0)}" for name in tables]
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:20]
+
+
+def _last_modified(versions, tables):
+    stamps = [int(versions[f"at:{name}"]) for name in tables if f"at:{name}" in versions]
+    # Только завершившаяся секунда: запись в ту же секунду не поменяла бы Last-Modified
+    if stamps and max(stamps) + 1 <= time.time():
+        return datetime.fromtimestamp(max(stamps), timezone.utc)
+    return None
+
+
+def conditional(*tables):
+    """Декоратор GET-представления, данные которого зависят только от tables."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = current()
+            if versions is None or "_flashes" in session:
+                return view(*args, **kwargs)
+
+            etag = _etag(versions, tables)
+            modified = _last_modified(versions, tables)
+            if request.if_none_match:
+                fresh = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                fresh = bool(since and modified and modified <= since)
+            if fresh:
+                resp = current_app.response_class(status=304)
+            else:
+                key = f"page:{etag}"
+                html = cache.get(key)
+                if html is None:
+                    html = view(*args, **kwargs)
+                    if isinstance(html, str):
+                        cache.set(key, html, ttl=current_app.config.get("PAGE_CACHE_TTL", 300))
+                resp = make_response(html)
+
+            resp.set_etag(etag)
+            if modified:
+                resp.last_modified = modified
+            # Браузер хранит страницу, но каждый раз сверяет ETag
+            resp.cache_control.no_cache = True
+            return resp
+        return wrapper
+    return decorator
@@ -0,0 +1,56 @@
+"""Запросы остатков в разрезе складов.
+
+Все агрегаты считаются в SQL и опираются на индексы stocks:
+ix_stocks_warehouse_totals покрывает итоги по складам, частичные
+ix_stocks_deficit и ix_stocks_low содержат только критические строки,
+упорядоченные по дефициту.
+"""
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import joinedload
+
+from models import db, Product, Stock
+
+_low = Stock.quantity <= Stock.min_stock
+
+# Критические остатки от самых срочных: (deficit, id) по убыванию
+LOW_STOCK_ORDER = (Stock.deficit, Stock.id)
+LOW_STOCK_CURSOR = (int, int)
+
+
+def warehouse_names():
+    return db.session.execute(
+        select(Stock.warehouse).distinct().order_by(Stock.warehouse)).scalars().all()
+
+
+def warehouse_totals():
+    """По каждому складу: позиций, суммарный остаток, критических позиций."""
+    return db.session.execute(
+        select(Stock.warehouse,
+               func.count().label("positions"),
+               func.coalesce(func.sum(Stock.quantity), 0).label("quantity"),
+               func.sum(case((_low, 1), else_=0)).label("low"))
+        .group_by(Stock.warehouse)
+        .order_by(Stock.warehouse)
+    ).all()
+
+
+def product_totals(product_ids=None):
+    """{product_id: суммарный остаток по всем складам}."""
+    stmt = select(Stock.product_id, func.sum(Stock.quantity)).group_by(Stock.product_id)
+    if product_ids is not None:
+        stmt = stmt.where(Stock.product_id.in_(product_ids))
+    return dict(db.session.execute(stmt).all())
+
+
+def low_stock_query(warehouse=None):
+    """Критические остатки (deficit >= 0), при желании по одному складу.
+
+    Условие записано ровно как у частичных индексов — иначе планировщик
+    SQLite их не выберет. Сортировку задаёт вызывающий (LOW_STOCK_ORDER).
+    """
+    query = (Stock.query
+             .options(joinedload(Stock.product).joinedload(Product.supplier))
+             .filter(Stock.deficit >= 0))
+    if warehouse:
+        query = query.filter(Stock.warehouse == warehouse)
+    return query
@@ -0,0 +1,84 @@
+"""Воркер фоновых задач (jobs.py).
+
+    python worker.py --processes 2
+
+Запускает пул процессов, каждый со своим приложением и соединениями с БД;
+процесс выполняет задачи по одной. Упавший процесс перезапускается. По
+SIGTERM/SIGINT процессы дорабатывают текущую задачу и выходят.
+
+Число процессов по умолчанию берётся из переменной окружения JOB_WORKERS.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+from app import create_app
+from models import db
+import jobs
+
+log = logging.getLogger(__name__)
+
+
+def default_processes():
+    return int(os.environ.get("JOB_WORKERS", max(1, multiprocessing.cpu_count() // 2)))
+
+
+def run_worker(stop):
+    # Останавливает мастер через stop: Ctrl+C в терминале не должен обрывать задачу
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    app = create_app()
+    with app.app_context():
+        jobs.work(stop)
+
+
+def start_worker(stop):
+    # Не daemon: задаче (например, сверке) нужен свой ProcessPoolExecutor
+    process = multiprocessing.Process(target=run_worker, args=(stop,), name="jobs-worker")
+    process.start()
+    return process
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=default_processes())
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(message)s")
+
+    # Таблица jobs должна существовать до первого опроса очереди
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        for engine in db.engines.values():
+            engine.dispose()
+
+    stop = multiprocessing.Event()
+    stopping = []
+
+    def shutdown(signum, frame):
+        # Только флаг: сам stop.set() из обработчика может ждать замок, занятый циклом
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    processes = [start_worker(stop) for _ in range(args.processes)]
+    log.info("Запущено воркеров задач: %d", len(processes))
+    while not stopping:
+        for i, process in enumerate(processes):
+            if not process.is_alive():
+                log.warning("Воркер %s завершился с кодом %s, перезапуск", process.pid, process.exitcode)
+                processes[i] = start_worker(stop)
+        time.sleep(1)
+
+    log.info("Остановка: воркеры дорабатывают текущие задачи")
+    stop.set()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()